@@ -0,0 +1,58 @@
+-- Tabelas externas da camada Bronze (brt_dataset_bronze)
+-- Executado pela task run_dbt_external_table do flow; ${GCP_PROJECT_ID} e
+-- ${GCS_BUCKET_NAME} são substituídos antes da execução.
+-- Deve acompanhar models/bronze/sources.yml (particionamento Hive dt/hour).
+
+CREATE SCHEMA IF NOT EXISTS `${GCP_PROJECT_ID}.brt_dataset_bronze`;
+
+-- OUTPUT_FORMAT=csv
+CREATE OR REPLACE EXTERNAL TABLE `${GCP_PROJECT_ID}.brt_dataset_bronze.brt_gps_raw` (
+    capture_timestamp TIMESTAMP,
+    vehicle_id STRING,
+    line STRING,
+    latitude FLOAT64,
+    longitude FLOAT64,
+    speed FLOAT64,
+    timestamp_gps INT64,
+    placa STRING,
+    sentido STRING,
+    trajeto STRING,
+    raw_data STRING
+)
+WITH PARTITION COLUMNS (
+    dt DATE,
+    hour INT64
+)
+OPTIONS (
+    format = 'CSV',
+    uris = ['gs://${GCS_BUCKET_NAME}/bronze/*.csv'],
+    skip_leading_rows = 1,
+    allow_quoted_newlines = TRUE,
+    hive_partition_uri_prefix = 'gs://${GCS_BUCKET_NAME}/bronze',
+    require_hive_partition_filter = TRUE
+);
+
+-- OUTPUT_FORMAT=parquet (schema explícito: a criação não depende de já haver arquivos)
+CREATE OR REPLACE EXTERNAL TABLE `${GCP_PROJECT_ID}.brt_dataset_bronze.brt_gps_raw_parquet` (
+    capture_timestamp TIMESTAMP,
+    vehicle_id STRING,
+    line STRING,
+    latitude FLOAT64,
+    longitude FLOAT64,
+    speed FLOAT64,
+    timestamp_gps INT64,
+    placa STRING,
+    sentido STRING,
+    trajeto STRING,
+    raw_data STRING
+)
+WITH PARTITION COLUMNS (
+    dt DATE,
+    hour INT64
+)
+OPTIONS (
+    format = 'PARQUET',
+    uris = ['gs://${GCS_BUCKET_NAME}/bronze/*.parquet'],
+    hive_partition_uri_prefix = 'gs://${GCS_BUCKET_NAME}/bronze',
+    require_hive_partition_filter = TRUE
+);
@@ -1,6 +1,8 @@
 {{
     config(
-        materialized='table',
+        materialized='incremental',
+        incremental_strategy='insert_overwrite',
+        on_schema_change='append_new_columns',
         partition_by={
             'field': 'date_partition',
             'data_type': 'date',
@@ -11,18 +13,38 @@
     )
 }}
 
+{#- Watermark: dias a partir do último capture_timestamp agregado (menos a tolerância) -#}
+{%- set watermark = none -%}
+{%- if execute and is_incremental() -%}
+    {%- set watermark_query -%}
+        SELECT FORMAT_TIMESTAMP(
+            '%Y-%m-%d %H:%M:%S',
+            TIMESTAMP_SUB(
+                MAX(last_capture_timestamp),
+                INTERVAL {{ var('incremental_lookback_minutes') }} MINUTE
+            )
+        )
+        FROM {{ this }}
+    {%- endset -%}
+    {%- set watermark = run_query(watermark_query).columns[0].values()[0] -%}
+{%- endif %}
+
 /*
 Modelo Gold - BRT Line Metrics
 Agregações e métricas de negócio prontas para consumo:
 - Análise por linha de BRT
 - Métricas de operação (velocidade média, total de veículos)
 - Agregações temporais
+
+Incremental (insert_overwrite): cada execução recalcula por inteiro apenas os
+dias a partir do watermark e substitui essas partições de date_partition.
 */
 
 WITH silver_data AS (
     SELECT
         vehicle_id,
         line,
+        capture_timestamp,
         capture_date,
         capture_hour,
         day_of_week,
@@ -32,6 +54,10 @@ WITH silver_data AS (
         speed_kmh,
         speed_category
     FROM {{ ref('stg_brt_gps_cleaned') }}
+    {% if watermark %}
+    -- Dias inteiros (a partição é substituída), podados por capture_date
+    WHERE capture_date >= DATE(TIMESTAMP('{{ watermark }}'))
+    {% endif %}
 ),
 
 aggregated_metrics AS (
@@ -64,6 +90,7 @@ aggregated_metrics AS (
         -- Metadata
         MIN(capture_hour) AS first_hour,
         MAX(capture_hour) AS last_hour,
+        MAX(capture_timestamp) AS last_capture_timestamp,
         CURRENT_TIMESTAMP() AS processed_at
         
     FROM silver_data
@@ -1,10 +1,35 @@
 {{
     config(
-        materialized='view',
+        materialized='incremental',
+        incremental_strategy='merge',
+        unique_key='row_hash',
+        partition_by={
+            'field': 'capture_date',
+            'data_type': 'date',
+            'granularity': 'day'
+        },
+        cluster_by=['line', 'vehicle_id'],
+        on_schema_change='append_new_columns',
         description='Camada Silver - Dados do BRT limpos e padronizados'
     )
 }}
 
+{#- Watermark: maior capture_timestamp já carregado, menos a tolerância a atrasos -#}
+{%- set watermark = none -%}
+{%- if execute and is_incremental() -%}
+    {%- set watermark_query -%}
+        SELECT FORMAT_TIMESTAMP(
+            '%Y-%m-%d %H:%M:%S',
+            TIMESTAMP_SUB(
+                MAX(capture_timestamp),
+                INTERVAL {{ var('incremental_lookback_minutes') }} MINUTE
+            )
+        )
+        FROM {{ this }}
+    {%- endset -%}
+    {%- set watermark = run_query(watermark_query).columns[0].values()[0] -%}
+{%- endif %}
+
 /*
 Modelo Silver - BRT GPS Cleaned
 Aplica transformações e limpezas nos dados brutos:
@@ -12,6 +37,11 @@ Aplica transformações e limpezas nos dados brutos:
 - Valida coordenadas GPS (dentro dos limites do Rio de Janeiro)
 - Padroniza formatos de data e hora
 - Calcula campos derivados
+- Lê apenas as partições dt entre partition_start_date e partition_end_date
+
+Incremental: cada execução lê só as partições posteriores ao watermark
+(capture_timestamp máximo já carregado menos incremental_lookback_minutes)
+e faz merge por row_hash, então capturas reprocessadas não duplicam.
 */
 
 WITH source_data AS (
@@ -23,8 +53,28 @@ WITH source_data AS (
         longitude,
         speed,
         timestamp_gps,
-        raw_data
+        raw_data,
+        dt,
+        hour
+    {% if var('gcs_source_format') | upper == 'PARQUET' %}
+    FROM {{ source('brt_external', 'brt_gps_raw_parquet') }}
+    {% else %}
     FROM {{ source('brt_external', 'brt_gps_raw') }}
+    {% endif %}
+    -- Poda de partições Hive (dt=YYYY-MM-DD/hour=HH/)
+    WHERE dt >= DATE('{{ var("partition_start_date") }}')
+    {% if var('partition_end_date') %}
+        AND dt <= DATE('{{ var("partition_end_date") }}')
+    {% endif %}
+    {% if watermark %}
+        -- Literais (e não subconsulta) para o BigQuery podar dt/hour
+        AND dt >= DATE(TIMESTAMP('{{ watermark }}'))
+        AND (
+            dt > DATE(TIMESTAMP('{{ watermark }}'))
+            OR hour >= EXTRACT(HOUR FROM TIMESTAMP('{{ watermark }}'))
+        )
+        AND CAST(capture_timestamp AS TIMESTAMP) > TIMESTAMP('{{ watermark }}')
+    {% endif %}
 ),
 
 cleaned_data AS (
@@ -74,6 +124,10 @@ cleaned_data AS (
             ELSE 'Madrugada'
         END AS period_of_day,
         
+        -- Partição de origem na Bronze (permite poda em consultas sobre a view)
+        dt AS partition_date,
+        hour AS partition_hour,
+        
         -- Metadata
         raw_data
         
@@ -16,14 +16,67 @@ from prefect.engine.signals import SKIP
 from datetime import timedelta, datetime
 from loguru import logger
 import time
-import subprocess
 import os
 
 from brt_api_capture import BRTAPICapture
+from brt_capture_service import BRTCaptureService, run_service
 from brt_data_aggregator import BRTDataAggregator
+from brt_instrumentation import get_metrics
+from brt_window_queue import WindowQueue
+from dbt_runner import DBTRunner, count_failures
+from external_tables import ExternalTableManager
 from gcs_manager import GCSManager
 
 
+# Capturador compartilhado entre execuções do mesmo processo: mantém o pool
+# de conexões keep-alive e os validadores HTTP (ETag/Last-Modified)
+_capture: BRTAPICapture = None
+
+
+def get_capture() -> BRTAPICapture:
+    """Retorna o capturador compartilhado, criando-o na primeira chamada"""
+    global _capture
+    if _capture is None:
+        _capture = BRTAPICapture()
+    return _capture
+
+
+# Executor DBT compartilhado: o manifest é carregado uma vez por processo
+_dbt_runner: DBTRunner = None
+
+
+def get_dbt_runner() -> DBTRunner:
+    """Retorna o executor DBT compartilhado, criando-o na primeira chamada"""
+    global _dbt_runner
+    if _dbt_runner is None:
+        _dbt_runner = DBTRunner()
+    return _dbt_runner
+
+
+# Gerenciador de tabelas externas compartilhado: mantém o cliente BigQuery
+_external_tables: ExternalTableManager = None
+
+
+def get_external_tables() -> ExternalTableManager:
+    """Retorna o gerenciador de tabelas externas, criando-o na primeira chamada"""
+    global _external_tables
+    if _external_tables is None:
+        _external_tables = ExternalTableManager()
+    return _external_tables
+
+
+# Fila de janelas gravadas: liga o flow de captura ao flow de warehouse
+_window_queue: WindowQueue = None
+
+
+def get_window_queue() -> WindowQueue:
+    """Retorna a fila de janelas compartilhada, criando-a na primeira chamada"""
+    global _window_queue
+    if _window_queue is None:
+        _window_queue = WindowQueue()
+    return _window_queue
+
+
 # ==================== TASKS ====================
 
 @task(name="Capturar dados BRT API", max_retries=3, retry_delay=timedelta(seconds=30))
@@ -34,12 +87,30 @@ def capture_brt_data():
     """
     logger.info("📡 Iniciando captura de dados da API BRT...")
     
-    capture = BRTAPICapture()
-    df = capture.capture_and_process()
-    
-    if df.empty:
-        logger.warning("Nenhum dado capturado")
-        raise SKIP("Sem dados disponíveis na API")
+    with get_metrics().measure('capture_brt_data') as record:
+        capture = get_capture()
+        df = capture.capture_and_process()
+        logger.info(f"Tempos da requisição: {capture.last_timings}")
+        
+        if capture.last_network:
+            logger.info(
+                f"Rede: {len(capture.last_network['segments'])} trechos e "
+                f"{len(capture.last_network['stops'])} paradas ocupadas "
+                f"({capture.map_matcher.last_duration * 1000:.0f} ms)"
+            )
+        
+        if capture.last_not_modified:
+            raise SKIP("Payload da API inalterado desde a última captura")
+        
+        record['rows_in'] = capture.last_records
+        record['rows_out'] = len(df)
+        
+        if df.empty and capture.delta_only and capture.last_raw_bytes:
+            raise SKIP("Nenhum veículo com posição nova desde a última captura")
+        
+        if df.empty:
+            logger.warning("Nenhum dado capturado")
+            raise SKIP("Sem dados disponíveis na API")
     
     logger.success(f"Dados capturados: {len(df)} registros")
     return df
@@ -53,11 +124,17 @@ def add_to_buffer(df, aggregator):
     """
     logger.info("Adicionando dados ao buffer...")
     
-    is_complete = aggregator.add_data(df)
+    with get_metrics().measure('add_to_buffer') as record:
+        record['rows_in'] = len(df)
+        is_complete = aggregator.add_data(
+            df, network=get_capture().last_network
+        )
+        status = aggregator.get_buffer_status()
+        record['rows_out'] = status['buffered_rows']
     
-    status = aggregator.get_buffer_status()
     logger.info(
-        f"Buffer status: {status['captures_count']}/{status['target_captures']} capturas"
+        f"Buffer status: {len(status['open_windows'])} janelas abertas, "
+        f"{status['captures_count']} capturas, watermark {status['watermark']}"
     )
     
     return is_complete, aggregator
@@ -66,139 +143,129 @@ def add_to_buffer(df, aggregator):
 @task(name="Gerar arquivo CSV")
 def generate_csv(is_complete, aggregator):
     """
-    Task: Gera arquivo CSV quando buffer está completo
-    Retorna: Caminho do arquivo CSV ou None
+    Task: Gera um arquivo por janela de tempo de evento completa
+    Retorna: Lista de caminhos dos arquivos gerados
     """
     if not is_complete:
-        logger.info("Buffer ainda não está completo, pulando geração de CSV")
+        logger.info("Nenhuma janela completa, pulando geração de arquivo")
         raise SKIP("Buffer incompleto")
     
-    logger.info("Gerando arquivo CSV consolidado...")
+    logger.info("Gerando arquivos das janelas completas...")
     
-    csv_path = aggregator.aggregate_and_save()
+    with get_metrics().measure('generate_csv') as record:
+        buffered_rows = aggregator.get_buffer_status()['buffered_rows']
+        file_paths = aggregator.save_ready_windows()
+        record['rows_in'] = buffered_rows
+        record['rows_out'] = (
+            buffered_rows - aggregator.get_buffer_status()['buffered_rows']
+        )
+        record['files'] = len(file_paths or [])
+        record['bytes_written'] = sum(
+            Path(path).stat().st_size for path in file_paths or []
+            if Path(path).exists()
+        )
     
-    if csv_path:
-        logger.success(f"CSV gerado: {csv_path}")
+    if file_paths:
+        logger.success(f"Arquivos gerados: {file_paths}")
     else:
-        logger.error("❌ Erro ao gerar CSV")
+        logger.error("❌ Erro ao gerar arquivos")
     
-    return csv_path
+    return file_paths
+
+
+@task(name="Enfileirar janelas para o warehouse")
+def enqueue_windows(file_paths):
+    """
+    Task: Entrega as janelas gravadas ao flow de warehouse (upload + DBT)
+    
+    O flow de captura termina aqui; o DBT roda em outro flow, disparado pela
+    fila, e não atrasa a próxima captura.
+    """
+    if not file_paths:
+        raise SKIP("Sem janelas gravadas")
+    
+    get_window_queue().enqueue(file_paths)
+    return file_paths
 
 
 @task(name="Upload para Google Cloud Storage", max_retries=2, retry_delay=timedelta(seconds=60))
-def upload_to_gcs(csv_path):
+def upload_to_gcs(file_paths):
     """
-    Task: Faz upload do CSV para o GCS
-    Retorna: URI do arquivo no GCS
+    Task: Faz upload dos arquivos das janelas para o GCS
+    Retorna: Lista de URIs dos arquivos no GCS
     """
-    if csv_path is None:
+    if not file_paths:
         logger.warning("⚠️ Sem arquivo para upload")
         raise SKIP("Sem arquivo CSV")
     
-    logger.info(f"☁️ Enviando arquivo para GCS: {csv_path}")
+    logger.info(f"☁️ Enviando {len(file_paths)} arquivos para GCS")
     
-    gcs_manager = GCSManager()
-    gcs_uri = gcs_manager.upload_file(csv_path, gcs_folder='brt-data')
+    # Upload paralelo sob dt=YYYY-MM-DD/hour=HH/ (partições Hive da tabela
+    # externa); em retry, arquivos já enviados são pulados por checksum
+    with get_metrics().measure('upload_to_gcs') as record:
+        gcs_manager = GCSManager()
+        results = gcs_manager.upload_files(
+            file_paths, gcs_folder=os.getenv('GCS_DATA_FOLDER', 'bronze')
+        )
+        # Linhas não são relidas no upload: o volume é em arquivos e bytes
+        record['files'] = sum(1 for r in results if r['status'] != 'failed')
+        record['bytes_uploaded'] = sum(
+            r['bytes'] for r in results if r['status'] == 'uploaded'
+        )
     
-    if gcs_uri:
-        logger.success(f"Upload concluído: {gcs_uri}")
-    else:
-        logger.error("Erro ao fazer upload para GCS")
+    failed = [r for r in results if r['status'] == 'failed']
+    if failed:
+        logger.error(f"Erro ao fazer upload para GCS: {failed}")
         raise Exception("Falha no upload para GCS")
     
-    return gcs_uri
+    gcs_uris = [r['gcs_uri'] for r in results]
+    logger.success(f"Upload concluído: {gcs_uris}")
+    
+    return gcs_uris
 
 
 @task(name="Executar DBT - Criar tabela externa")
 def run_dbt_external_table():
     """
-    Task: Cria/atualiza tabela externa no BigQuery
+    Task: Cria/atualiza tabelas externas no BigQuery
     
-    NOTA: A partir do dbt-bigquery 1.5+, tabelas externas são criadas
-    usando o comando 'dbt run --select source:*' ou via script SQL direto.
+    O DDL (dbt_brt/analyses/create_external_table.sql) só é executado quando
+    a definição muda; execuções sem mudança não criam jobs no BigQuery.
     """
-    logger.info("Criando tabela externa no BigQuery...")
-    
-    dbt_dir = Path(__file__).parent.parent / 'dbt_brt'
+    logger.info("Verificando tabelas externas no BigQuery...")
     
     try:
-        # Opção 1: Usar script SQL direto (mais confiável)
-        logger.info("Criando tabela externa via BigQuery API...")
-        
-        from google.cloud import bigquery
-        import os
-        
-        # Inicializa cliente BigQuery
-        client = bigquery.Client(
-            project=os.getenv('GCP_PROJECT_ID')
-        )
-        
-        # Lê o script SQL
-        sql_file = dbt_dir / 'models' / 'bronze' / 'create_external_table.sql'
-        with open(sql_file, 'r') as f:
-            sql = f.read()
-        
-        # Substitui variáveis
-        sql = sql.replace('${GCP_PROJECT_ID}', os.getenv('GCP_PROJECT_ID'))
-        sql = sql.replace('${GCS_BUCKET_NAME}', os.getenv('GCS_BUCKET_NAME'))
-        
-        # Executa comandos SQL (separados por ;)
-        for statement in sql.split(';'):
-            statement = statement.strip()
-            if statement and not statement.startswith('--'):
-                try:
-                    client.query(statement).result()
-                    logger.debug(f"Executado: {statement[:50]}...")
-                except Exception as e:
-                    # Ignora erros de "já existe" ou comentários
-                    if 'Already Exists' not in str(e) and 'comment' not in str(e).lower():
-                        logger.warning(f"Aviso: {e}")
-        
-        logger.success("Tabela externa criada/atualizada com sucesso")
+        with get_metrics().measure('run_dbt_external_table'):
+            get_external_tables().apply()
         
     except Exception as e:
         logger.error(f"Erro ao criar tabela externa: {e}")
         logger.info("Você pode criar manualmente usando o script:")
-        logger.info("   dbt_brt/models/bronze/create_external_table.sql")
+        logger.info("   dbt_brt/analyses/create_external_table.sql")
         raise
 
 
 @task(name="Executar DBT - Transformações")
 def run_dbt_transformations():
     """
-    Task: Executa modelos DBT (Silver e Gold)
+    Task: Executa modelos DBT (Silver e Gold) afetados pela nova janela
     """
     logger.info("Executando transformações DBT...")
     
-    dbt_dir = Path(__file__).parent.parent / 'dbt_brt'
-    
-    try:
-        # Executa modelos DBT
-        result = subprocess.run(
-            ['dbt', 'run', '--profiles-dir', '.'],
-            cwd=str(dbt_dir),
-            check=True,
-            capture_output=True,
-            text=True
+    runner = get_dbt_runner()
+    with get_metrics().measure('run_dbt_transformations'):
+        success, results = runner.run()
+    if not success:
+        logger.error(
+            f"Erro ao executar DBT: {count_failures(results)} modelos com falha"
         )
-        
-        logger.success("Transformações DBT executadas com sucesso")
-        logger.debug(result.stdout)
-        
-        # Gera documentação
-        logger.info("Gerando documentação DBT...")
-        subprocess.run(
-            ['dbt', 'docs', 'generate', '--profiles-dir', '.'],
-            cwd=str(dbt_dir),
-            check=True,
-            capture_output=True
-        )
-        
+        raise Exception("Falha nas transformações DBT")
+    
+    logger.success("Transformações DBT executadas com sucesso")
+    
+    # Documentação em cadência mais lenta (DBT_DOCS_INTERVAL_MINUTES)
+    if runner.generate_docs():
         logger.success("Documentação gerada")
-        
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Erro ao executar DBT: {e.stderr}")
-        raise
 
 
 @task(name="Executar testes DBT")
@@ -208,22 +275,16 @@ def run_dbt_tests():
     """
     logger.info("Executando testes de qualidade de dados...")
     
-    dbt_dir = Path(__file__).parent.parent / 'dbt_brt'
-    
     try:
-        result = subprocess.run(
-            ['dbt', 'test', '--profiles-dir', '.'],
-            cwd=str(dbt_dir),
-            check=False,  # Não falha se testes falharem
-            capture_output=True,
-            text=True
-        )
+        with get_metrics().measure('run_dbt_tests'):
+            success, results = get_dbt_runner().test()
         
-        if result.returncode == 0:
+        if success:
             logger.success("Todos os testes passaram")
         else:
-            logger.warning("Alguns testes falharam:")
-            logger.warning(result.stdout)
+            logger.warning(
+                f"Alguns testes falharam: {count_failures(results)}"
+            )
         
     except Exception as e:
         logger.error(f" Erro ao executar testes: {e}")
@@ -236,7 +297,10 @@ def create_brt_pipeline_flow(
     run_interval_minutes: int = 1
 ):
     """
-    Cria flow do pipeline BRT
+    Cria flow de captura e agregação do pipeline BRT
+    
+    Roda a cada minuto e só grava as janelas e as enfileira; upload e DBT
+    ficam no flow de warehouse (create_brt_warehouse_flow).
     
     Args:
         aggregation_minutes: Minutos para agregação
@@ -250,7 +314,8 @@ def create_brt_pipeline_flow(
     
     with Flow(
         name="BRT Data Pipeline - Medallion Architecture",
-        schedule=schedule
+        schedule=schedule,
+        state_handlers=[get_metrics().flow_state_handler]
     ) as flow:
         
         # Parâmetros
@@ -259,7 +324,8 @@ def create_brt_pipeline_flow(
             default=aggregation_minutes
         )
         
-        # Inicializa agregador (mantém estado entre execuções)
+        # Inicializa agregador (buffer persistido em data/buffer e
+        # recuperado do disco se o agent for reiniciado)
         aggregator = BRTDataAggregator(aggregation_minutes=agg_minutes)
         
         # ========== Camada Bronze ==========
@@ -271,33 +337,163 @@ def create_brt_pipeline_flow(
         is_complete = buffer_result[0]
         aggregator = buffer_result[1]
         
-        # 3. Gera CSV quando buffer completo
-        csv_path = generate_csv(is_complete, aggregator)
+        # 3. Gera um arquivo por janela completa (watermark de tempo de evento)
+        file_paths = generate_csv(is_complete, aggregator)
+        
+        # 4. Enfileira as janelas para o flow de warehouse
+        enqueue_windows(file_paths)
+    
+    return flow
+
+
+def create_brt_warehouse_flow():
+    """
+    Cria flow downstream (upload + DBT) para janelas já gravadas
+    
+    Disparado pelo worker do warehouse a cada lote da fila de janelas:
+    várias janelas pendentes são enviadas juntas e geram uma única
+    execução DBT.
+    """
+    
+    with Flow(
+        name="BRT Data Pipeline - Warehouse",
+        state_handlers=[get_metrics().flow_state_handler]
+    ) as flow:
+        
+        # Arquivos das janelas gravadas pelo agregador
+        file_paths = Parameter("file_paths", default=[])
         
-        # 4. Upload para GCS
-        gcs_uri = upload_to_gcs(csv_path)
+        # ========== Camada Bronze ==========
+        # 1. Upload para GCS
+        gcs_uri = upload_to_gcs(file_paths)
         
         # ========== Camada Silver/Gold ==========
-        # 5. Cria tabela externa no BigQuery
+        # 2. Cria tabela externa no BigQuery
         external_table = run_dbt_external_table()
         external_table.set_upstream(gcs_uri)
         
-        # 6. Executa transformações DBT
+        # 3. Executa transformações DBT
         transformations = run_dbt_transformations()
         transformations.set_upstream(external_table)
         
-        # 7. Executa testes de qualidade
+        # 4. Executa testes de qualidade
         tests = run_dbt_tests()
         tests.set_upstream(transformations)
     
     return flow
 
 
+def run_warehouse_worker(stop_event=None):
+    """
+    Consome a fila de janelas e dispara o flow de warehouse
+    
+    Cada execução reivindica todas as janelas pendentes (até
+    WAREHOUSE_MAX_BATCH): se o DBT atrasar, as janelas acumuladas no
+    período são processadas juntas na execução seguinte. Lotes com falha
+    voltam para a fila e são tentados de novo após WAREHOUSE_RETRY_SECONDS.
+    
+    Args:
+        stop_event: threading.Event que encerra o worker (None = indefinido)
+    """
+    import threading
+    
+    stop_event = stop_event or threading.Event()
+    queue = get_window_queue()
+    warehouse_flow = create_brt_warehouse_flow()
+    max_batch = int(os.getenv('WAREHOUSE_MAX_BATCH', 30))
+    poll_seconds = float(os.getenv('WAREHOUSE_POLL_SECONDS', 5))
+    retry_seconds = float(os.getenv('WAREHOUSE_RETRY_SECONDS', 60))
+    
+    queue.recover()
+    logger.info(f"Worker do warehouse aguardando janelas em {queue.queue_dir}")
+    
+    while not stop_event.is_set():
+        if not queue.wait(poll_seconds):
+            continue
+        
+        batch = queue.claim(max_batch)
+        if not len(batch):
+            continue
+        
+        file_paths = batch.file_paths
+        logger.info(
+            f"Disparando flow de warehouse: {len(batch)} entradas, "
+            f"{len(file_paths)} arquivos ({queue.pending_count()} pendentes)"
+        )
+        try:
+            state = warehouse_flow.run(parameters={'file_paths': file_paths})
+            success = state.is_successful()
+        except Exception as e:
+            logger.error(f"Erro no flow de warehouse: {e}")
+            success = False
+        
+        if success:
+            queue.ack(batch)
+        else:
+            queue.release(batch)
+            stop_event.wait(retry_seconds)
+
+
+def start_warehouse_worker():
+    """
+    Inicia o worker do warehouse em uma thread daemon deste processo
+    
+    Desativado com WAREHOUSE_WORKER=external, quando o worker roda em
+    processo próprio (python pipeline/brt_flow.py warehouse).
+    """
+    import threading
+    
+    if os.getenv('WAREHOUSE_WORKER', 'thread').lower() != 'thread':
+        return None
+    
+    worker = threading.Thread(
+        target=run_warehouse_worker, name='brt-warehouse', daemon=True
+    )
+    worker.start()
+    return worker
+
+
+def run_capture_service(aggregation_minutes: int = 10):
+    """
+    Executa o serviço de captura contínua (asyncio) fora do schedule Prefect
+    
+    A API é consultada a cada CAPTURE_INTERVAL_SECONDS; cada janela gravada
+    entra na fila consumida pelo worker do warehouse.
+    
+    Args:
+        aggregation_minutes: Minutos para agregação
+    """
+    service = BRTCaptureService(
+        capture=get_capture(),
+        aggregator=BRTDataAggregator(aggregation_minutes=aggregation_minutes),
+        on_window_ready=get_window_queue().enqueue
+    )
+    
+    start_warehouse_worker()
+    logger.info("Iniciando serviço de captura contínua BRT...")
+    run_service(service)
+
+
 # ==================== MAIN ====================
 
 def main():
     """Função principal para registro e execução do flow"""
     
+    # Endpoint /metrics no formato Prometheus (METRICS_PORT; 0 desativa)
+    get_metrics().serve()
+    
+    # Modo serviço: captura sub-minuto com Prefect apenas no downstream
+    # (python pipeline/brt_flow.py service)
+    if len(sys.argv) > 1 and sys.argv[1] == 'service':
+        run_capture_service(aggregation_minutes=10)
+        return
+    
+    # Modo warehouse: apenas o consumidor da fila de janelas, em processo
+    # próprio (python pipeline/brt_flow.py warehouse)
+    if len(sys.argv) > 1 and sys.argv[1] == 'warehouse':
+        run_warehouse_worker()
+        return
+    
     # Cria flow
     flow = create_brt_pipeline_flow(
         aggregation_minutes=10,
@@ -307,8 +503,9 @@ def main():
     # Registra flow no Prefect Server
     # flow.register(project_name="BRT Pipeline")
     
-    # OU executa localmente
+    # OU executa localmente (warehouse em thread, salvo WAREHOUSE_WORKER=external)
     logger.info("Iniciando BRT Data Pipeline...")
+    start_warehouse_worker()
     flow.run()
 
 
@@ -5,50 +5,409 @@ Arquitetura Medallion - Camada Bronze (dados brutos)
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 import pandas as pd
 from datetime import datetime
-from typing import Dict, List, Optional
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 from loguru import logger
+import gzip
+import json
 import os
+import re
+import threading
+import time
 from dotenv import load_dotenv
 
+from brt_map_matching import MapMatcher, create_map_matcher
+from brt_schema import CAPTURE_COLUMNS, CAPTURE_DTYPES
+
+# Decodificadores JSON rápidos são opcionais (fallback para a stdlib)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+# urllib3 só descomprime brotli se um dos pacotes estiver instalado
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = 'gzip, deflate, br'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
 load_dotenv()
 
+# Destinos de raw_data (ver BRTAPICapture._raw_data_column)
+RAW_DATA_MODES = ('inline', 'separate', 'none')
+
+# Campos da API usados na montagem das colunas
+API_FIELDS = (
+    'codigo', 'ordem', 'linha', 'latitude', 'longitude',
+    'velocidade', 'dataHora', 'placa', 'sentido', 'trajeto',
+)
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_RAW_DECODER = json.JSONDecoder()
+
+
+def json_loads(data: bytes) -> Any:
+    """
+    Decodifica JSON com orjson/simdjson quando disponíveis
+
+    Args:
+        data: Conteúdo JSON em bytes
+
+    Returns:
+        Objeto Python decodificado
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if simdjson is not None:
+        return simdjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj: Any) -> str:
+    """
+    Serializa objeto em JSON compacto (orjson quando disponível)
+
+    Args:
+        obj: Objeto serializável
+
+    Returns:
+        String JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def _scan_vehicle_list(text: str, pos: int) -> Tuple[list, List[str], int]:
+    """
+    Percorre a lista de veículos que começa em text[pos] ('[')
+
+    Returns:
+        Tuple (veículos, trechos JSON originais, posição após o ']')
+    """
+    vehicles, slices = [], []
+    scan_once = _RAW_DECODER.scan_once
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    if text.startswith(']', pos):
+        return vehicles, slices, pos + 1
+    while True:
+        try:
+            vehicle, end = scan_once(text, pos)
+        except StopIteration:
+            raise ValueError(f"JSON inválido na posição {pos}")
+        vehicles.append(vehicle)
+        slices.append(text[pos:end])
+        
+        # Caminho rápido para JSON compacto: ',' seguido do próximo '{'
+        separator = text[end:end + 1]
+        if separator == ',':
+            pos = end + 1
+            if not text.startswith('{', pos):
+                pos = _WHITESPACE.match(text, pos).end()
+            continue
+        if separator == ']':
+            return vehicles, slices, end + 1
+        pos = _WHITESPACE.match(text, end).end()
+        if text.startswith(']', pos):
+            return vehicles, slices, pos + 1
+        if not text.startswith(',', pos):
+            raise ValueError(f"JSON inválido na posição {pos}")
+        pos = _WHITESPACE.match(text, pos + 1).end()
+
+
+def _scan_payload_object(text: str, pos: int) -> Tuple[dict, Optional[List[str]], int]:
+    """
+    Percorre o objeto que começa em text[pos] ('{'), recortando "veiculos"
+
+    Returns:
+        Tuple (objeto com todas as chaves, trechos por veículo ou None,
+        posição após o '}')
+    """
+    scan_once = _RAW_DECODER.scan_once
+    data, slices = {}, None
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    if text.startswith('}', pos):
+        return data, slices, pos + 1
+    while True:
+        if not text.startswith('"', pos):
+            raise ValueError(f"JSON inválido na posição {pos}")
+        key, pos = scan_once(text, pos)
+        pos = _WHITESPACE.match(text, pos).end()
+        if not text.startswith(':', pos):
+            raise ValueError(f"JSON inválido na posição {pos}")
+        pos = _WHITESPACE.match(text, pos + 1).end()
+        if key == 'veiculos' and text.startswith('[', pos):
+            value, slices, pos = _scan_vehicle_list(text, pos)
+        else:
+            try:
+                value, pos = scan_once(text, pos)
+            except StopIteration:
+                raise ValueError(f"JSON inválido na posição {pos}")
+        data[key] = value
+        pos = _WHITESPACE.match(text, pos).end()
+        if text.startswith(',', pos):
+            pos = _WHITESPACE.match(text, pos + 1).end()
+            continue
+        if text.startswith('}', pos):
+            return data, slices, pos + 1
+        raise ValueError(f"JSON inválido na posição {pos}")
+
+
+def decode_with_raw_slices(raw: bytes) -> Tuple[Any, Optional[List[str]]]:
+    """
+    Decodifica o payload e recorta o JSON original de cada veículo
+
+    A lista de veículos é percorrida uma única vez com o scanner C da
+    stdlib: cada elemento é decodificado e seu trecho original é guardado
+    sem reserialização. As demais chaves do objeto são decodificadas
+    normalmente e o payload inteiro é validado como json.loads faria.
+
+    Args:
+        raw: Corpo da resposta da API em bytes
+
+    Returns:
+        Tuple (dados decodificados, trechos JSON por veículo ou None se o
+        payload não tiver uma lista de veículos)
+
+    Raises:
+        ValueError: Payload truncado, malformado ou com conteúdo após o JSON
+    """
+    text = raw.decode('utf-8')
+    pos = _WHITESPACE.match(text).end()
+
+    if text.startswith('[', pos):
+        data, slices, end = _scan_vehicle_list(text, pos)
+    elif text.startswith('{', pos):
+        data, slices, end = _scan_payload_object(text, pos)
+    else:
+        return json.loads(text), None
+
+    end = _WHITESPACE.match(text, end).end()
+    if end != len(text):
+        raise ValueError(f"Conteúdo após o JSON na posição {end}")
+    return data, slices
+
+
+# Tempo de abertura de conexão (TCP + TLS) da requisição corrente
+_connect_timing = threading.local()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    """Conexão HTTP que registra o tempo de connect()"""
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connect_timing.seconds = time.perf_counter() - start
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """Conexão HTTPS que registra o tempo de connect() (TCP + TLS)"""
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connect_timing.seconds = time.perf_counter() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Adapter com pool keep-alive que mede o tempo de abertura de conexões"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool,
+        }
+
 
 class BRTAPICapture:
     """Classe para captura de dados da API do BRT"""
     
-    def __init__(self, api_url: Optional[str] = None):
+    def __init__(
+        self,
+        api_url: Optional[str] = None,
+        raw_json_passthrough: Optional[bool] = None,
+        pool_maxsize: int = 4,
+        delta_only: Optional[bool] = None,
+        map_matcher: Optional[MapMatcher] = None,
+        raw_data_mode: Optional[str] = None
+    ):
         """
         Inicializa o capturador de dados BRT
         
         Args:
             api_url: URL da API BRT (padrão: variável de ambiente BRT_API_URL)
+            raw_json_passthrough: Guarda o JSON original de cada veículo em
+                raw_data em vez de reserializá-lo
+            pool_maxsize: Conexões keep-alive mantidas no pool por host
+            delta_only: Emite apenas veículos cujo timestamp_gps avançou
+                desde a última captura
+            map_matcher: Associa cada captura aos shapes e paradas do GTFS
+                (padrão: criado se MAP_MATCHING=true e GTFS_PATH existir)
+            raw_data_mode: 'inline', 'separate' ou 'none'
+                (padrão: RAW_DATA_MODE)
         """
         self.api_url = api_url or os.getenv(
             'BRT_API_URL', 
             'https://jeap.rio.rj.gov.br/je-api/api/v2/gps'
         )
+        if raw_json_passthrough is None:
+            raw_json_passthrough = os.getenv(
+                'RAW_JSON_PASSTHROUGH', 'true'
+            ).lower() == 'true'
+        self.raw_json_passthrough = raw_json_passthrough
+        
+        # raw_data em cada registro ('inline'), arquivado à parte por
+        # captura ('separate') ou descartado ('none')
+        self.raw_data_mode = (
+            raw_data_mode or os.getenv('RAW_DATA_MODE', 'inline')
+        ).lower()
+        if self.raw_data_mode not in RAW_DATA_MODES:
+            raise ValueError(
+                f"RAW_DATA_MODE inválido: {self.raw_data_mode} "
+                f"(use {', '.join(RAW_DATA_MODES)})"
+            )
+        self.raw_archive_dir = Path(
+            os.getenv('RAW_ARCHIVE_DIR', './data/bronze_raw')
+        )
+        
+        self.timeout = float(os.getenv('API_TIMEOUT', 30))
+        
+        # Sessão com pool de conexões keep-alive reaproveitado entre capturas
+        self.session = requests.Session()
+        adapter = TimedHTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_maxsize
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'User-Agent': os.getenv(
+                'API_USER_AGENT', 'CIVITAS-BRT-Pipeline/1.0'
+            ),
+            'Accept-Encoding': ACCEPT_ENCODING,
+            'Accept': 'application/json',
+        })
+        
+        # Validadores HTTP da última resposta (requisições condicionais)
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.last_not_modified = False
+        
+        # Tempos da última requisição (connect, TTFB, download)
+        self.last_timings: Dict[str, Any] = {}
+        
+        # Corpo da última resposta e trechos JSON por veículo
+        self.last_raw_bytes: Optional[bytes] = None
+        self.last_raw_slices: Optional[List[str]] = None
+        
+        # Registros da última resposta, antes do filtro delta
+        self.last_records = 0
+        
+        # Índice do último timestamp_gps emitido por veículo (captura delta)
+        if delta_only is None:
+            delta_only = os.getenv('DELTA_ONLY', 'false').lower() == 'true'
+        self.delta_only = delta_only
+        self.last_seen = pd.Series(dtype='Int64', index=pd.Index([], dtype='string'))
+        self.delta_stats = {
+            'rows_in': 0,
+            'rows_emitted': 0,
+            'rows_suppressed': 0,
+        }
+        
+        # Map-matching da frota à rede GTFS (índice construído uma vez)
+        self.map_matcher = (
+            map_matcher if map_matcher is not None else create_map_matcher()
+        )
+        self.last_network: Dict[str, pd.DataFrame] = {}
+        
         logger.info(f"BRT API Capture inicializado com URL: {self.api_url}")
     
     def fetch_data(self) -> Optional[Dict]:
         """
         Realiza requisição à API BRT e retorna os dados
         
+        Usa requisição condicional (If-None-Match / If-Modified-Since):
+        se a API responder 304, retorna None e marca last_not_modified.
+        
         Returns:
-            Dict com dados da API ou None em caso de erro
+            Dict com dados da API ou None em caso de erro ou sem alterações
         """
+        self.last_not_modified = False
+        # Payload de uma captura anterior não vale para esta (304 ou erro)
+        self.last_raw_bytes = None
+        self.last_raw_slices = None
+        
         try:
             logger.info(f"Capturando dados da API BRT em {datetime.now()}")
             
-            response = requests.get(
+            headers = {}
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+            
+            _connect_timing.seconds = 0.0
+            start = time.perf_counter()
+            response = self.session.get(
                 self.api_url,
-                timeout=30,
-                headers={'User-Agent': 'CIVITAS-BRT-Pipeline/1.0'}
+                timeout=self.timeout,
+                headers=headers,
+                stream=True
             )
+            ttfb = time.perf_counter() - start
+            
+            if response.status_code == 304:
+                # Devolve a conexão ao pool para a próxima captura
+                response.raw.drain_conn()
+                response.raw.release_conn()
+                self._record_timings(response, start, ttfb, 0)
+                self.last_not_modified = True
+                logger.info("Dados não modificados desde a última captura (304)")
+                return None
+            
             response.raise_for_status()
             
-            data = response.json()
+            # Decodifica os bytes uma única vez, mantendo o original
+            self.last_raw_bytes = response.content
+            self._record_timings(response, start, ttfb, len(self.last_raw_bytes))
+            
+            self.etag = response.headers.get('ETag')
+            self.last_modified = response.headers.get('Last-Modified')
+            
+            # Trechos por veículo só são necessários com raw_data inline
+            if self.raw_json_passthrough and self.raw_data_mode == 'inline':
+                data, self.last_raw_slices = decode_with_raw_slices(
+                    self.last_raw_bytes
+                )
+            else:
+                data = json_loads(self.last_raw_bytes)
+                self.last_raw_slices = None
+            
             logger.success(f"Dados capturados com sucesso: {len(data)} veículos")
             
             return data
@@ -60,19 +419,64 @@ class BRTAPICapture:
             logger.error(f"Erro inesperado: {e}")
             return None
     
-    def process_raw_data(self, raw_data: Dict) -> pd.DataFrame:
+    def _record_timings(
+        self,
+        response: requests.Response,
+        start: float,
+        ttfb: float,
+        content_bytes: int
+    ) -> None:
+        """
+        Registra os tempos da requisição em last_timings
+        
+        Args:
+            response: Resposta HTTP
+            start: Instante (perf_counter) de início da requisição
+            ttfb: Segundos até o recebimento dos cabeçalhos
+            content_bytes: Tamanho do corpo descomprimido
+        """
+        total = time.perf_counter() - start
+        connect = getattr(_connect_timing, 'seconds', 0.0)
+        
+        self.last_timings = {
+            'status_code': response.status_code,
+            'reused_connection': connect == 0.0,
+            'connect_seconds': round(connect, 4),
+            'ttfb_seconds': round(ttfb, 4),
+            'download_seconds': round(total - ttfb, 4),
+            'total_seconds': round(total, 4),
+            'content_bytes': content_bytes,
+            'content_encoding': response.headers.get('Content-Encoding'),
+        }
+        logger.debug(f"Tempos da requisição: {self.last_timings}")
+    
+    def close(self) -> None:
+        """Fecha a sessão HTTP e as conexões do pool"""
+        self.session.close()
+    
+    def process_raw_data(
+        self,
+        raw_data: Dict,
+        raw_slices: Optional[List[str]] = None
+    ) -> pd.DataFrame:
         """
         Processa dados brutos da API e retorna DataFrame
         
+        As colunas são montadas campo a campo a partir da lista de veículos,
+        com tipos explícitos (ver brt_schema.CAPTURE_DTYPES), sem criar um
+        dict intermediário por veículo.
+        
         Args:
             raw_data: Dados brutos da API
+            raw_slices: JSON original de cada veículo (ver
+                decode_with_raw_slices); se ausente, raw_data é reserializado
             
         Returns:
             DataFrame com dados processados
         """
         try:
             # Adiciona timestamp de captura
-            capture_timestamp = datetime.now().isoformat()
+            capture_timestamp = pd.Timestamp(datetime.now())
             
             # Verifica se raw_data é uma lista ou dict
             if isinstance(raw_data, list):
@@ -82,25 +486,48 @@ class BRTAPICapture:
             else:
                 vehicles = [raw_data]
             
-            # Processa cada veículo
-            processed_records = []
-            for vehicle in vehicles:
-                record = {
-                    'capture_timestamp': capture_timestamp,
-                    'vehicle_id': vehicle.get('codigo') or vehicle.get('ordem'),  # Novo formato usa 'codigo'
-                    'line': vehicle.get('linha'),
-                    'latitude': vehicle.get('latitude'),
-                    'longitude': vehicle.get('longitude'),
-                    'speed': vehicle.get('velocidade'),
-                    'timestamp_gps': vehicle.get('dataHora'),
-                    'placa': vehicle.get('placa', ''),
-                    'sentido': vehicle.get('sentido', ''),
-                    'trajeto': vehicle.get('trajeto', ''),
-                    'raw_data': str(vehicle)  # Mantém dados brutos para auditoria
-                }
-                processed_records.append(record)
-            
-            df = pd.DataFrame(processed_records)
+            if not vehicles:
+                logger.info("Dados processados: 0 registros")
+                return pd.DataFrame(columns=CAPTURE_COLUMNS)
+            
+            # Extrai somente os campos usados, um vetor por campo
+            fields = {
+                field: [vehicle.get(field) for vehicle in vehicles]
+                for field in API_FIELDS
+            }
+            
+            def text(
+                field: str, column: str, fill: Optional[str] = None
+            ) -> pd.Series:
+                series = pd.Series(fields[field], dtype='object')
+                if fill is not None:
+                    series = series.fillna(fill)
+                return series.astype(CAPTURE_DTYPES[column])
+            
+            def numeric(field: str, dtype: str) -> pd.Series:
+                return pd.to_numeric(
+                    pd.Series(fields[field], dtype='object'), errors='coerce'
+                ).astype(dtype)
+            
+            # Novo formato usa 'codigo', formato antigo usa 'ordem'
+            vehicle_id = pd.Series(fields['codigo'], dtype='object').fillna(
+                pd.Series(fields['ordem'], dtype='object')
+            )
+            
+            df = pd.DataFrame({
+                'capture_timestamp': capture_timestamp,
+                'vehicle_id': vehicle_id.astype(CAPTURE_DTYPES['vehicle_id']),
+                'line': text('linha', 'line'),
+                'latitude': numeric('latitude', CAPTURE_DTYPES['latitude']),
+                'longitude': numeric('longitude', CAPTURE_DTYPES['longitude']),
+                'speed': numeric('velocidade', CAPTURE_DTYPES['speed']),
+                'timestamp_gps': numeric('dataHora', CAPTURE_DTYPES['timestamp_gps']),
+                'placa': text('placa', 'placa', fill=''),
+                'sentido': text('sentido', 'sentido', fill=''),
+                'trajeto': text('trajeto', 'trajeto', fill=''),
+                'raw_data': self._raw_data_column(vehicles, raw_slices),
+            }, columns=CAPTURE_COLUMNS)
+            
             logger.info(f"Dados processados: {len(df)} registros")
             
             return df
@@ -109,6 +536,103 @@ class BRTAPICapture:
             logger.error(f"Erro ao processar dados: {e}")
             return pd.DataFrame()
     
+    def _raw_data_column(
+        self,
+        vehicles: List[Dict],
+        raw_slices: Optional[List[str]]
+    ) -> pd.Series:
+        """
+        Coluna raw_data conforme RAW_DATA_MODE
+        
+        Em 'inline' mantém o JSON de cada veículo para auditoria; em
+        'separate' e 'none' a coluna fica nula (o corpo da resposta é
+        arquivado à parte em 'separate', ver archive_raw_payload).
+        """
+        if self.raw_data_mode != 'inline':
+            return pd.Series(
+                pd.NA, index=range(len(vehicles)),
+                dtype=CAPTURE_DTYPES['raw_data']
+            )
+        return pd.Series(
+            raw_slices
+            if raw_slices is not None and len(raw_slices) == len(vehicles)
+            else [json_dumps(vehicle) for vehicle in vehicles],
+            dtype=CAPTURE_DTYPES['raw_data']
+        )
+    
+    def archive_raw_payload(
+        self,
+        capture_timestamp: pd.Timestamp
+    ) -> Optional[Path]:
+        """
+        Grava o corpo da última resposta, comprimido, fora do DataFrame
+        
+        Args:
+            capture_timestamp: Timestamp da captura (nome e partição)
+            
+        Returns:
+            Caminho do arquivo gravado ou None se não houver corpo
+        """
+        if not self.last_raw_bytes:
+            return None
+        
+        filepath = (
+            self.raw_archive_dir
+            / f"dt={capture_timestamp.strftime('%Y-%m-%d')}"
+            / f"hour={capture_timestamp.strftime('%H')}"
+            / f"brt_raw_{capture_timestamp.strftime('%Y%m%d_%H%M%S')}.json.gz"
+        )
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = filepath.with_name(filepath.name + '.tmp')
+        tmp_path.write_bytes(gzip.compress(self.last_raw_bytes, compresslevel=6))
+        tmp_path.replace(filepath)
+        return filepath
+    
+    def filter_delta(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Remove veículos cuja posição não avançou desde a última captura
+        
+        Compara o timestamp_gps de cada registro com o último emitido para o
+        mesmo vehicle_id. Registros sem timestamp_gps são sempre mantidos.
+        
+        Args:
+            df: DataFrame produzido por process_raw_data
+            
+        Returns:
+            DataFrame apenas com registros novos
+        """
+        if df.empty:
+            return df
+        
+        # Duplicatas dentro da mesma resposta também contam como suprimidas
+        rows_in = len(df)
+        df = df.drop_duplicates(subset=['vehicle_id', 'timestamp_gps'])
+        previous = df['vehicle_id'].map(self.last_seen)
+        advanced = (
+            previous.isna()
+            | df['timestamp_gps'].isna()
+            | (df['timestamp_gps'] > previous).fillna(False)
+        ).astype(bool)
+        delta_df = df[advanced].reset_index(drop=True)
+        
+        # Atualiza o índice com o maior timestamp emitido por veículo
+        latest = (
+            delta_df.dropna(subset=['vehicle_id', 'timestamp_gps'])
+            .groupby('vehicle_id')['timestamp_gps'].max()
+        )
+        self.last_seen = latest.combine_first(self.last_seen)
+        
+        self.delta_stats['rows_in'] += rows_in
+        self.delta_stats['rows_emitted'] += len(delta_df)
+        self.delta_stats['rows_suppressed'] += rows_in - len(delta_df)
+        suppressed = self.delta_stats['rows_suppressed']
+        
+        logger.info(
+            f"Captura delta: {len(delta_df)} de {rows_in} registros emitidos "
+            f"({suppressed} suprimidos no total)"
+        )
+        return delta_df
+    
     def capture_and_process(self) -> pd.DataFrame:
         """
         Captura e processa dados em uma única operação
@@ -117,12 +641,36 @@ class BRTAPICapture:
             DataFrame com dados processados
         """
         raw_data = self.fetch_data()
+        self.last_records = 0
+        # Sem payload novo (304 ou erro) não há rede desta captura
+        self.last_network = {}
+        
+        if raw_data is None and self.last_not_modified:
+            logger.info("Payload inalterado, processamento ignorado")
+            return pd.DataFrame()
         
         if raw_data is None:
             logger.warning("Retornando DataFrame vazio devido a erro na captura")
             return pd.DataFrame()
         
-        return self.process_raw_data(raw_data)
+        df = self.process_raw_data(raw_data, raw_slices=self.last_raw_slices)
+        self.last_records = len(df)
+        
+        if self.raw_data_mode == 'separate' and not df.empty:
+            self.archive_raw_payload(df['capture_timestamp'].iloc[0])
+        
+        # Antes do filtro delta: a permanência nas paradas depende de ver
+        # também os veículos parados
+        if self.map_matcher is not None and not df.empty:
+            try:
+                self.last_network = self.map_matcher.process(df)
+            except Exception as e:
+                logger.error(f"Erro no map-matching: {e}")
+        
+        if self.delta_only:
+            df = self.filter_delta(df)
+        
+        return df
 
 
 def main():
@@ -0,0 +1,585 @@
+"""
+Backfill histórico do pipeline BRT
+Relê os arquivos Bronze existentes (inclusive CSVs antigos com raw_data em
+repr Python), refaz o parsing da API e a agregação em janelas com um pool de
+processos e grava no formato e layout atuais, com checkpoint por partição
+Arquitetura Medallion - Reprocessamento Bronze -> Silver/Gold sem tempo real
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from loguru import logger
+import ast
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import pandas as pd
+from dotenv import load_dotenv
+
+from brt_api_capture import json_loads
+from brt_schema import CAPTURE_COLUMNS
+from brt_state_files import read_json, write_json_atomic
+from local_engine import LEGACY_COLUMNS, LocalEngine
+
+load_dotenv()
+
+CHECKPOINT_FILE = 'backfill_checkpoint.json'
+
+# Campos da API reconstruídos a partir das colunas quando raw_data está
+# vazio (RAW_DATA_MODE separate/none) ou ilegível
+COLUMN_FIELDS = {
+    'vehicle_id': 'codigo',
+    'line': 'linha',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+    'speed': 'velocidade',
+    'timestamp_gps': 'dataHora',
+    'placa': 'placa',
+    'sentido': 'sentido',
+    'trajeto': 'trajeto',
+}
+
+
+def read_bronze_file(filepath: Path) -> pd.DataFrame:
+    """
+    Lê um arquivo Bronze completo (CSV ou Parquet, layout atual ou antigo)
+
+    Args:
+        filepath: Caminho do arquivo
+
+    Returns:
+        DataFrame com CAPTURE_COLUMNS (textos como object)
+    """
+    filepath = Path(filepath)
+    if filepath.suffix == '.parquet':
+        df = pd.read_parquet(filepath)
+    else:
+        df = pd.read_csv(
+            filepath,
+            dtype={
+                'vehicle_id': 'string', 'line': 'string', 'placa': 'string',
+                'sentido': 'string', 'trajeto': 'string', 'raw_data': 'string',
+            },
+            keep_default_na=False,
+            na_values={'latitude': [''], 'longitude': [''], 'speed': ['']},
+            encoding='utf-8-sig'
+        )
+    return df.rename(columns=LEGACY_COLUMNS).reindex(columns=CAPTURE_COLUMNS)
+
+
+def parse_raw_record(text) -> Optional[dict]:
+    """
+    Decodifica o raw_data de um registro
+
+    O layout atual grava JSON; o consolidado antigo gravava o repr do dict
+    Python (aspas simples), lido com ast.literal_eval.
+
+    Args:
+        text: Conteúdo da coluna raw_data
+
+    Returns:
+        Dict do veículo ou None se vazio/ilegível
+    """
+    if not isinstance(text, str) or not text:
+        return None
+    try:
+        record = json.loads(text)
+    except ValueError:
+        try:
+            record = ast.literal_eval(text)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return None
+    return record if isinstance(record, dict) else None
+
+
+def vehicles_from_frame(df: pd.DataFrame) -> Tuple[List[dict], int]:
+    """
+    Reconstrói a lista de veículos da API de um arquivo Bronze
+
+    Args:
+        df: DataFrame retornado por read_bronze_file
+
+    Returns:
+        Tuple (veículos na ordem das linhas, quantidade reconstruída a
+        partir das colunas)
+    """
+    texts = df['raw_data'].tolist()
+    vehicles = None
+    if all(isinstance(text, str) and text for text in texts):
+        # Layout atual: um único decode do arquivo inteiro como array JSON
+        try:
+            vehicles = json_loads(('[' + ','.join(texts) + ']').encode('utf-8'))
+        except ValueError:
+            vehicles = None
+        if vehicles is not None and (
+            len(vehicles) != len(texts)
+            or not all(isinstance(vehicle, dict) for vehicle in vehicles)
+        ):
+            vehicles = None
+    if vehicles is None:
+        vehicles = [parse_raw_record(text) for text in texts]
+    missing = [i for i, vehicle in enumerate(vehicles) if vehicle is None]
+    if missing:
+        columns = df.iloc[missing][list(COLUMN_FIELDS)]
+        columns = columns.astype(object).where(columns.notna(), None)
+        for i, row in zip(missing, columns.itertuples(index=False)):
+            vehicles[i] = {
+                field: value for field, value in zip(COLUMN_FIELDS.values(), row)
+            }
+    return vehicles, len(missing)
+
+
+def event_times(df: pd.DataFrame, event_time_column: str) -> pd.Series:
+    """Tempo de evento de cada registro (mesma regra do agregador)"""
+    if event_time_column == 'timestamp_gps':
+        return pd.to_datetime(df['timestamp_gps'], unit='ms')
+    return pd.to_datetime(df['capture_timestamp'])
+
+
+def file_signature(files: List[Path]) -> str:
+    """Assinatura de um conjunto de arquivos (nome, tamanho e mtime)"""
+    digest = hashlib.sha1()
+    for filepath in files:
+        stat = Path(filepath).stat()
+        digest.update(f"{filepath}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _unit_prefix(unit: str) -> str:
+    """Prefixo dos arquivos de staging de uma partição de origem"""
+    return unit.replace(':', '_') + '__'
+
+
+# Capturador reaproveitado entre partições do mesmo processo do pool
+_capture = None
+
+
+def _get_capture():
+    global _capture
+    if _capture is None:
+        from brt_api_capture import BRTAPICapture
+
+        _capture = BRTAPICapture()
+    return _capture
+
+
+def _configure_worker(log_level: str) -> None:
+    logger.remove()
+    logger.add(sys.stderr, level=log_level)
+
+
+def stage_unit(
+    unit: str,
+    files: List[str],
+    staging_dir: str,
+    config: dict,
+    log_level: str = 'WARNING'
+) -> dict:
+    """
+    Fase 1: reprocessa os arquivos de uma partição de origem e separa os
+    registros pela janela de tempo de evento
+
+    Os arquivos são relidos por BRTAPICapture.process_raw_data
+    (capture_timestamp original preservado) e cada janela vira um Parquet
+    em staging_dir/date=YYYY-MM-DD/window=YYYYMMDDTHHMM/. Um arquivo que
+    cruza a meia-noite (ou, com timestamp_gps, uma partição local cujas
+    horas caem no dia UTC seguinte) alimenta as janelas do outro dia, que
+    são agregadas por quem processa aquela data na fase 2.
+
+    Args:
+        unit: Partição de origem (YYYY-MM-DD) ou 'file:<nome>' sem data
+        files: Arquivos da partição em ordem
+        staging_dir: Diretório de staging
+        config: Parâmetros do agregador (ver run_backfill)
+        log_level: Nível de log do processo
+
+    Returns:
+        Dict com estatísticas da partição
+    """
+    _configure_worker(log_level)
+    start = time.perf_counter()
+    staging_dir = Path(staging_dir)
+    prefix = _unit_prefix(unit)
+    window_size = pd.Timedelta(minutes=config['aggregation_minutes'])
+
+    # Partição refeita (interrompida ou alterada): remove o staging anterior
+    for old in staging_dir.glob(f'date=*/window=*/{prefix}*.parquet'):
+        old.unlink()
+
+    capture = _get_capture()
+    stats = {
+        'unit': unit, 'files': 0, 'input_rows': 0, 'staged_rows': 0,
+        'rebuilt_from_columns': 0, 'no_event_time_rows': 0, 'windows': 0,
+    }
+    for filepath in files:
+        filepath = Path(filepath)
+        df = read_bronze_file(filepath)
+        stats['files'] += 1
+        stats['input_rows'] += len(df)
+        if df.empty:
+            continue
+
+        vehicles, rebuilt = vehicles_from_frame(df)
+        stats['rebuilt_from_columns'] += rebuilt
+        processed = capture.process_raw_data(vehicles)
+        processed['capture_timestamp'] = pd.to_datetime(
+            df['capture_timestamp']
+        ).to_numpy()
+
+        times = event_times(processed, config['event_time_column'])
+        valid = times.notna().to_numpy()
+        # O agregador também descarta esses registros (sem janela possível)
+        stats['no_event_time_rows'] += int((~valid).sum())
+        processed, times = processed[valid], times[valid]
+
+        window_starts = times.dt.floor(window_size)
+        for window_start, window_df in processed.groupby(
+            window_starts.to_numpy(), sort=True
+        ):
+            window_start = pd.Timestamp(window_start)
+            target = (
+                staging_dir
+                / f"date={window_start.strftime('%Y-%m-%d')}"
+                / f"window={window_start.strftime('%Y%m%dT%H%M')}"
+                / f"{prefix}{filepath.stem}.parquet"
+            )
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = target.with_name(target.name + '.tmp')
+            window_df.to_parquet(tmp_path, index=False)
+            tmp_path.replace(target)
+            stats['staged_rows'] += len(window_df)
+            stats['windows'] += 1
+
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def staging_signatures(staging_dir: Path) -> Dict[str, str]:
+    """Assinatura dos arquivos de staging de cada data"""
+    return {
+        date_dir.name.split('=', 1)[1]: file_signature(
+            sorted(date_dir.glob('window=*/*.parquet'))
+        )
+        for date_dir in sorted(staging_dir.glob('date=*'))
+    }
+
+
+def aggregate_date(
+    date: str,
+    staging_dir: str,
+    output_dir: str,
+    config: dict,
+    log_level: str = 'WARNING'
+) -> dict:
+    """
+    Fase 2: agrega as janelas de uma data a partir do staging
+
+    Cada janela chega completa (todas as partições de origem já gravaram
+    sua parte) e em ordem, então é gravada logo após ser adicionada: não há
+    registros atrasados e a memória fica limitada a uma janela.
+
+    Args:
+        date: Data das janelas (YYYY-MM-DD)
+        staging_dir: Diretório de staging
+        output_dir: Raiz de saída (bronze/, silver/ e gold/)
+        config: Parâmetros do agregador (ver run_backfill)
+        log_level: Nível de log do processo
+
+    Returns:
+        Dict com estatísticas da data
+    """
+    _configure_worker(log_level)
+
+    from brt_data_aggregator import BRTDataAggregator
+
+    start = time.perf_counter()
+    output_dir = Path(output_dir)
+    buffer_dir = output_dir / 'backfill_buffers' / date
+    # Data interrompida é refeita do início
+    shutil.rmtree(buffer_dir, ignore_errors=True)
+
+    # AGGREGATION_MINUTES tem precedência no agregador; o processo do pool
+    # usa o valor do backfill
+    os.environ['AGGREGATION_MINUTES'] = str(config['aggregation_minutes'])
+    aggregator = BRTDataAggregator(
+        aggregation_minutes=config['aggregation_minutes'],
+        data_dir=str(output_dir),
+        output_format=config['output_format'],
+        event_time_column=config['event_time_column'],
+        allowed_lateness_seconds=0,
+        buffer_dir=str(buffer_dir)
+    )
+    # Snapshot das janelas abertas é só do processo ao vivo
+    aggregator.live_metrics_path = None
+
+    stats = {'date': date, 'output_rows': 0, 'windows': 0}
+    date_dir = Path(staging_dir) / f"date={date}"
+    for window_dir in sorted(date_dir.glob('window=*')):
+        parts = sorted(window_dir.glob('*.parquet'))
+        if not parts:
+            continue
+        window_df = pd.concat(
+            [pd.read_parquet(part) for part in parts], ignore_index=True
+        )
+        aggregator.add_data(window_df)
+        stats['windows'] += len(aggregator.save_ready_windows(force=True))
+        stats['output_rows'] += len(window_df)
+
+    # Tempo de evento à frente do relógio (GPS adiantado) é descartado como
+    # no processo ao vivo
+    stats['late_rows'] = aggregator.late_rows
+    stats['future_rows'] = aggregator.future_rows
+    stats['output_rows'] -= aggregator.late_rows + aggregator.future_rows
+    shutil.rmtree(buffer_dir, ignore_errors=True)
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    return stats
+
+
+def _run_pool(
+    executor: ProcessPoolExecutor,
+    tasks: Dict[str, tuple],
+    on_done,
+    label: str
+) -> List[str]:
+    """Executa as tarefas no pool e retorna as chaves que falharam"""
+    failed = []
+    futures = {executor.submit(*args): key for key, args in tasks.items()}
+    for future in as_completed(futures):
+        key = futures[future]
+        try:
+            on_done(key, future.result())
+        except Exception as e:
+            logger.error(f"Falha no backfill ({label}) de {key}: {e}")
+            failed.append(key)
+    return failed
+
+
+def run_backfill(
+    source_dir: Optional[str] = None,
+    output_dir: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    workers: Optional[int] = None,
+    aggregation_minutes: Optional[int] = None,
+    output_format: Optional[str] = None,
+    event_time_column: Optional[str] = None,
+    restart: bool = False,
+    log_level: str = 'WARNING'
+) -> dict:
+    """
+    Reprocessa a Bronze em paralelo, em duas fases
+
+    1. Uma tarefa por partição dt de origem reprocessa os arquivos e separa
+       os registros por janela de tempo de evento (staging).
+    2. Uma tarefa por data de evento agrega as janelas completas daquela
+       data, vindas de qualquer partição de origem.
+
+    Assim nenhum registro se perde quando a data de evento difere da
+    partição do arquivo, e dois processos nunca gravam a mesma janela.
+
+    O checkpoint (output_dir/backfill_checkpoint.json) guarda a assinatura
+    dos arquivos de origem de cada partição e do staging de cada data
+    concluída; uma nova execução refaz só o que mudou ou foi interrompido.
+    O staging fica em output_dir/backfill_staging para isso. Mudar a
+    configuração do agregador invalida o checkpoint e o staging.
+
+    Args:
+        source_dir: Diretório Bronze de origem (padrão: BACKFILL_SOURCE_DIR)
+        output_dir: Raiz de saída (padrão: BACKFILL_OUTPUT_DIR)
+        start_date: Primeira partição (YYYY-MM-DD)
+        end_date: Última partição (YYYY-MM-DD)
+        workers: Processos do pool (padrão: BACKFILL_WORKERS ou nº de CPUs)
+        aggregation_minutes: Tamanho da janela (padrão: AGGREGATION_MINUTES)
+        output_format: csv ou parquet (padrão: OUTPUT_FORMAT)
+        event_time_column: Coluna de tempo de evento (padrão: EVENT_TIME_COLUMN)
+        restart: Ignora o checkpoint e o staging existentes
+        log_level: Nível de log dos processos do pool
+
+    Returns:
+        Dict com estatísticas da execução
+    """
+    source_dir = Path(
+        source_dir or os.getenv('BACKFILL_SOURCE_DIR', './data/bronze')
+    )
+    output_dir = Path(
+        output_dir or os.getenv('BACKFILL_OUTPUT_DIR', './data/backfill')
+    )
+    if source_dir.resolve() == (output_dir / 'bronze').resolve():
+        raise ValueError(
+            f"Saída {output_dir} regravaria a própria origem {source_dir}"
+        )
+    workers = int(workers or os.getenv('BACKFILL_WORKERS', 0) or os.cpu_count() or 1)
+    config = {
+        'aggregation_minutes': int(
+            aggregation_minutes or os.getenv('AGGREGATION_MINUTES', 10)
+        ),
+        'output_format': (
+            output_format or os.getenv('OUTPUT_FORMAT', 'csv')
+        ).lower(),
+        'event_time_column': (
+            event_time_column
+            or os.getenv('EVENT_TIME_COLUMN', 'capture_timestamp')
+        ),
+        'raw_data_mode': os.getenv('RAW_DATA_MODE', 'inline').lower(),
+    }
+
+    # Partições dt da origem; arquivos sem data viram uma tarefa cada
+    partitions = LocalEngine(silver_dir=str(source_dir)).discover_files(
+        start_date, end_date
+    )
+    units: Dict[str, List[Path]] = {}
+    for partition, files in partitions.items():
+        if partition is None:
+            for filepath in files:
+                units[f"file:{filepath.name}"] = [filepath]
+        else:
+            units[partition] = files
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    staging_dir = output_dir / 'backfill_staging'
+    checkpoint_path = output_dir / CHECKPOINT_FILE
+    checkpoint = {} if restart else read_json(checkpoint_path)
+    if checkpoint and checkpoint.get('config') != config:
+        logger.warning("Configuração mudou desde o checkpoint: refazendo tudo")
+        checkpoint = {}
+    if not checkpoint:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    staged = checkpoint.get('staged', {})
+    aggregated = checkpoint.get('aggregated', {})
+    checkpoint = {'config': config, 'staged': staged, 'aggregated': aggregated}
+
+    signatures = {unit: file_signature(files) for unit, files in units.items()}
+    todo = sorted(
+        unit for unit in units
+        if staged.get(unit, {}).get('signature') != signatures[unit]
+    )
+    logger.info(
+        f"Backfill de {source_dir} para {output_dir}: {len(units)} partições, "
+        f"{len(units) - len(todo)} já concluídas, {workers} processos"
+    )
+
+    start = time.perf_counter()
+    totals = {
+        'units': 0, 'files': 0, 'input_rows': 0, 'staged_rows': 0,
+        'no_event_time_rows': 0, 'dates': 0, 'output_rows': 0,
+        'windows': 0, 'failed_units': [], 'failed_dates': [],
+    }
+
+    def unit_done(unit: str, stats: dict) -> None:
+        staged[unit] = {
+            'signature': signatures[unit],
+            'finished_at': datetime.now().isoformat(),
+            'stats': stats,
+        }
+        write_json_atomic(checkpoint_path, checkpoint)
+        totals['units'] += 1
+        for field in ('files', 'input_rows', 'staged_rows', 'no_event_time_rows'):
+            totals[field] += stats[field]
+        logger.info(
+            f"[staging {len(staged)}/{len(units)}] {unit}: "
+            f"{stats['input_rows']} registros em {stats['windows']} "
+            f"janelas ({stats['seconds']}s)"
+        )
+
+    def date_done(date: str, stats: dict) -> None:
+        aggregated[date] = {
+            'signature': date_signatures[date],
+            'finished_at': datetime.now().isoformat(),
+            'stats': stats,
+        }
+        write_json_atomic(checkpoint_path, checkpoint)
+        totals['dates'] += 1
+        for field in ('output_rows', 'windows'):
+            totals[field] += stats[field]
+        logger.info(
+            f"[agregação] {date}: {stats['output_rows']} registros, "
+            f"{stats['windows']} janelas ({stats['seconds']}s)"
+        )
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        totals['failed_units'] = _run_pool(executor, {
+            unit: (
+                stage_unit, unit, [str(f) for f in units[unit]],
+                str(staging_dir), config, log_level
+            )
+            for unit in todo
+        }, unit_done, 'staging')
+
+        # Agregar com partições faltando gravaria janelas incompletas
+        if not totals['failed_units']:
+            date_signatures = staging_signatures(staging_dir)
+            dates = sorted(
+                date for date, signature in date_signatures.items()
+                if aggregated.get(date, {}).get('signature') != signature
+            )
+            totals['failed_dates'] = _run_pool(executor, {
+                date: (
+                    aggregate_date, date, str(staging_dir), str(output_dir),
+                    config, log_level
+                )
+                for date in dates
+            }, date_done, 'agregação')
+
+    try:
+        (output_dir / 'backfill_buffers').rmdir()
+    except OSError:
+        pass
+
+    seconds = time.perf_counter() - start
+    totals['seconds'] = round(seconds, 3)
+    totals['rows_per_second'] = (
+        round(totals['input_rows'] / seconds, 1) if seconds else None
+    )
+    logger.success(
+        f"Backfill: {totals['units']} partições, {totals['input_rows']} "
+        f"registros -> {totals['dates']} datas, {totals['output_rows']} "
+        f"registros em {totals['windows']} janelas em {totals['seconds']}s "
+        f"({totals['rows_per_second']} registros/s)"
+    )
+    return totals
+
+
+def main():
+    """Função principal: backfill da Bronze local"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--source-dir', help='Bronze de origem (padrão: data/bronze)')
+    parser.add_argument('--output-dir', help='Raiz de saída (padrão: data/backfill)')
+    parser.add_argument('--start-date', help='Primeira partição dt (YYYY-MM-DD)')
+    parser.add_argument('--end-date', help='Última partição dt (YYYY-MM-DD)')
+    parser.add_argument('--workers', type=int, help='Processos do pool')
+    parser.add_argument('--aggregation-minutes', type=int, help='Tamanho da janela')
+    parser.add_argument('--output-format', choices=['csv', 'parquet'])
+    parser.add_argument(
+        '--event-time-column', choices=['capture_timestamp', 'timestamp_gps']
+    )
+    parser.add_argument(
+        '--restart', action='store_true', help='Ignora o checkpoint e o staging existentes'
+    )
+    parser.add_argument('--log-level', default='WARNING', help='Nível de log dos processos')
+    args = parser.parse_args()
+
+    totals = run_backfill(
+        source_dir=args.source_dir,
+        output_dir=args.output_dir,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        workers=args.workers,
+        aggregation_minutes=args.aggregation_minutes,
+        output_format=args.output_format,
+        event_time_column=args.event_time_column,
+        restart=args.restart,
+        log_level=args.log_level
+    )
+    if totals['failed_units'] or totals['failed_dates']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+"""
+Benchmark do caminho captura -> agregação -> upload do pipeline BRT
+Sintetiza frotas a partir de data/example_brt_consolidated.csv, serve cada
+captura por um servidor HTTP local no lugar da API e mede as classes reais
+(BRTAPICapture, BRTDataAggregator, GCSManager com o emulador de storage)
+Resultado em JSON: registros/s, latência p50/p99 por etapa e pico de memória
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from loguru import logger
+import argparse
+import ast
+import gzip
+import json
+import multiprocessing
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from local_engine import LATITUDE_RANGE, LONGITUDE_RANGE
+
+SEED_PATH = Path(__file__).parent.parent / 'data' / 'example_brt_consolidated.csv'
+
+STAGES = ['fetch', 'process', 'add_data', 'save', 'upload']
+
+METERS_PER_DEGREE = 111195.0
+
+
+def load_seed(path: Path = SEED_PATH) -> List[Dict]:
+    """
+    Lê os veículos de exemplo no formato da API
+
+    raw_data do CSV de exemplo é o repr Python do dict de cada veículo.
+
+    Args:
+        path: CSV consolidado de exemplo
+
+    Returns:
+        Lista de dicts no formato da API
+    """
+    df = pd.read_csv(path, usecols=['raw_data'], encoding='utf-8-sig')
+    return [ast.literal_eval(raw) for raw in df['raw_data']]
+
+
+class SyntheticFleet:
+    """Frota sintética que se desloca a cada captura"""
+
+    def __init__(self, seed: List[Dict], vehicles: int, random_state: int = 42):
+        """
+        Replica os veículos de exemplo até o tamanho pedido
+
+        Args:
+            seed: Veículos de exemplo (load_seed)
+            vehicles: Tamanho da frota
+            random_state: Semente do gerador aleatório
+        """
+        self.rng = np.random.default_rng(random_state)
+        self.templates = [
+            {k: v for k, v in vehicle.items()
+             if k not in ('codigo', 'latitude', 'longitude', 'dataHora', 'velocidade')}
+            for vehicle in seed
+        ]
+        self.template_index = np.arange(vehicles) % len(seed)
+        self.codes = [f"9{i:07d}" for i in range(vehicles)]
+
+        base_lat = np.array([v['latitude'] for v in seed])[self.template_index]
+        base_lon = np.array([v['longitude'] for v in seed])[self.template_index]
+        self.latitude = np.clip(
+            base_lat + self.rng.normal(0, 0.01, vehicles), *LATITUDE_RANGE
+        )
+        self.longitude = np.clip(
+            base_lon + self.rng.normal(0, 0.01, vehicles), *LONGITUDE_RANGE
+        )
+        self.heading = self.rng.uniform(0, 2 * np.pi, vehicles)
+        self.speed = self.rng.uniform(0, 60, vehicles)
+        self.epoch_ms = int(pd.Timestamp('2025-01-06 08:00:00').value // 1_000_000)
+
+    def step(self, seconds: float) -> None:
+        """Avança a frota (posição, velocidade e relógio) em N segundos"""
+        distance = self.speed / 3.6 * seconds
+        self.latitude = np.clip(
+            self.latitude + distance * np.cos(self.heading) / METERS_PER_DEGREE,
+            *LATITUDE_RANGE
+        )
+        self.longitude = np.clip(
+            self.longitude + distance * np.sin(self.heading) / (
+                METERS_PER_DEGREE * np.cos(np.radians(self.latitude))
+            ),
+            *LONGITUDE_RANGE
+        )
+        self.heading += self.rng.normal(0, 0.2, len(self.heading))
+        self.speed = np.clip(self.speed + self.rng.normal(0, 5, len(self.speed)), 0, 80)
+        self.epoch_ms += int(seconds * 1000)
+
+    def payload(self, interval_seconds: float) -> bytes:
+        """
+        Corpo JSON de uma captura (dataHora com atraso de até um intervalo)
+
+        Returns:
+            Bytes no formato {"veiculos": [...]}
+        """
+        lag = self.rng.integers(0, max(1, int(interval_seconds * 1000)), len(self.codes))
+        gps_ms = self.epoch_ms - lag
+        latitude = np.round(self.latitude, 6).tolist()
+        longitude = np.round(self.longitude, 6).tolist()
+        speed = np.round(self.speed, 1).tolist()
+        gps_ms = gps_ms.tolist()
+        vehicles = [
+            {
+                **self.templates[t],
+                'codigo': code,
+                'latitude': latitude[i],
+                'longitude': longitude[i],
+                'dataHora': gps_ms[i],
+                'velocidade': speed[i],
+            }
+            for i, (t, code) in enumerate(zip(self.template_index.tolist(), self.codes))
+        ]
+        return json.dumps({'veiculos': vehicles}, ensure_ascii=False).encode('utf-8')
+
+
+class ReplayServer:
+    """Servidor HTTP local que responde como a API com a captura atual"""
+
+    def __init__(self):
+        self.body = b'{"veiculos": []}'
+        self.gzip_body = gzip.compress(self.body, compresslevel=1)
+        self.etag = '"0"'
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.headers.get('If-None-Match') == server.etag:
+                    self.send_response(304)
+                    self.send_header('ETag', server.etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+                body = server.gzip_body if use_gzip else server.body
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', server.etag)
+                if use_gzip:
+                    self.send_header('Content-Encoding', 'gzip')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v2/gps"
+
+    def publish(self, body: bytes, version: int) -> None:
+        """Troca a captura servida (compressão fora da medição)"""
+        self.gzip_body = gzip.compress(body, compresslevel=1)
+        self.body = body
+        self.etag = f'"{version}"'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def summarize_stage(durations: List[float], rows: int, extra: Optional[Dict] = None) -> Dict:
+    """
+    Estatísticas de uma etapa
+
+    Args:
+        durations: Duração de cada chamada em segundos
+        rows: Registros processados no total
+        extra: Campos adicionais (ex.: bytes enviados)
+
+    Returns:
+        Dict com chamadas, registros, registros/s e latências em ms
+    """
+    if not durations:
+        return {'calls': 0, 'rows': 0}
+    values = np.asarray(durations)
+    total = float(values.sum())
+    summary = {
+        'calls': len(durations),
+        'rows': int(rows),
+        'total_seconds': round(total, 6),
+        'rows_per_second': round(rows / total, 1) if total > 0 else None,
+        'p50_ms': round(float(np.percentile(values, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(values, 99)) * 1000, 3),
+        'max_ms': round(float(values.max()) * 1000, 3),
+    }
+    summary.update(extra or {})
+    return summary
+
+
+def peak_rss_mb() -> float:
+    """Pico de memória residente do processo (MB)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é KB no Linux e bytes no macOS
+    return round(peak / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+def run_scenario(
+    vehicles: int,
+    captures: int,
+    interval_seconds: float,
+    aggregation_minutes: int,
+    output_format: str,
+    storage_latency_ms: float,
+    trace_python_heap: bool = False,
+    log_level: str = 'WARNING'
+) -> Dict:
+    """
+    Executa um cenário completo em diretório temporário
+
+    Args:
+        vehicles: Tamanho da frota
+        captures: Quantidade de capturas
+        interval_seconds: Intervalo simulado entre capturas
+        aggregation_minutes: Tamanho da janela do agregador
+        output_format: Formato dos arquivos das janelas (csv ou parquet)
+        storage_latency_ms: Latência injetada no emulador de storage
+        trace_python_heap: Mede também o pico do heap Python (tracemalloc)
+        log_level: Nível de log do processo do cenário
+
+    Returns:
+        Dict com parâmetros, etapas e memória
+    """
+    logger.remove()
+    logger.add(sys.stderr, level=log_level)
+
+    from brt_api_capture import BRTAPICapture
+    from brt_data_aggregator import BRTDataAggregator
+    from gcs_manager import GCSManager
+    from storage_backends import LocalStorageBackend
+
+    work_dir = Path(tempfile.mkdtemp(prefix='brt_benchmark_'))
+    fleet = SyntheticFleet(load_seed(), vehicles)
+    durations = {stage: [] for stage in STAGES}
+    rows = {stage: 0 for stage in STAGES}
+    uploaded_bytes = 0
+    windows_saved = 0
+    rss_start = peak_rss_mb()
+
+    if trace_python_heap:
+        tracemalloc.start()
+
+    try:
+        with ReplayServer() as server:
+            capture = BRTAPICapture(api_url=server.url)
+            # Janelas por timestamp_gps: o relógio simulado fecha as janelas
+            aggregator = BRTDataAggregator(
+                aggregation_minutes=aggregation_minutes,
+                data_dir=str(work_dir / 'data'),
+                output_format=output_format,
+                event_time_column='timestamp_gps'
+            )
+            gcs = GCSManager(
+                bucket_name='brt-benchmark',
+                backend=LocalStorageBackend(
+                    'brt-benchmark',
+                    root_dir=str(work_dir / 'gcs'),
+                    latency_ms=storage_latency_ms,
+                    latency_jitter_ms=0
+                )
+            )
+
+            for i in range(captures):
+                fleet.step(interval_seconds)
+                server.publish(fleet.payload(interval_seconds), i + 1)
+
+                start = time.perf_counter()
+                raw = capture.fetch_data()
+                durations['fetch'].append(time.perf_counter() - start)
+                if raw is None:
+                    raise RuntimeError("Falha ao buscar a captura no servidor local")
+                rows['fetch'] += vehicles
+
+                start = time.perf_counter()
+                df = capture.process_raw_data(raw, raw_slices=capture.last_raw_slices)
+                durations['process'].append(time.perf_counter() - start)
+                rows['process'] += len(df)
+
+                start = time.perf_counter()
+                ready = aggregator.add_data(df)
+                durations['add_data'].append(time.perf_counter() - start)
+                rows['add_data'] += len(df)
+
+                if not ready:
+                    continue
+
+                buffered = aggregator.get_buffer_status()['buffered_rows']
+                start = time.perf_counter()
+                paths = aggregator.save_ready_windows()
+                durations['save'].append(time.perf_counter() - start)
+                saved_rows = buffered - aggregator.get_buffer_status()['buffered_rows']
+                rows['save'] += saved_rows
+                windows_saved += len(paths)
+
+                start = time.perf_counter()
+                results = gcs.upload_files(paths, gcs_folder='bronze')
+                durations['upload'].append(time.perf_counter() - start)
+                failed = [r for r in results if r['status'] == 'failed']
+                if failed:
+                    raise RuntimeError(f"Falha no upload: {failed}")
+                uploaded_bytes += sum(r['bytes'] for r in results)
+                rows['upload'] += saved_rows
+
+            capture.close()
+    finally:
+        python_heap_peak = None
+        if trace_python_heap:
+            python_heap_peak = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+            tracemalloc.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    stages = {
+        stage: summarize_stage(durations[stage], rows[stage])
+        for stage in STAGES
+    }
+    if durations['upload']:
+        upload_seconds = sum(durations['upload'])
+        stages['upload']['bytes'] = uploaded_bytes
+        stages['upload']['mb_per_second'] = (
+            round(uploaded_bytes / 1024 ** 2 / upload_seconds, 2)
+            if upload_seconds > 0 else None
+        )
+
+    return {
+        'vehicles': vehicles,
+        'captures': captures,
+        'interval_seconds': interval_seconds,
+        'aggregation_minutes': aggregation_minutes,
+        'output_format': output_format,
+        'storage_latency_ms': storage_latency_ms,
+        'windows_saved': windows_saved,
+        'stages': stages,
+        'memory': {
+            'rss_before_mb': rss_start,
+            'peak_rss_mb': peak_rss_mb(),
+            'python_heap_peak_mb': python_heap_peak,
+        },
+    }
+
+
+def environment_info() -> Dict:
+    """Versões e commit usados no benchmark (comparação entre versões)"""
+    import pyarrow
+
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'pyarrow': pyarrow.__version__,
+        'platform': platform.platform(),
+        'cpu_count': multiprocessing.cpu_count(),
+    }
+
+
+def compare_results(report: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """
+    Compara registros/s por etapa com um relatório anterior
+
+    Args:
+        report: Relatório atual
+        baseline: Relatório de referência
+        tolerance: Queda relativa tolerada (ex.: 0.2 = 20%)
+
+    Returns:
+        Lista de regressões (cenário, etapa, valores e razão)
+    """
+    previous = {s['vehicles']: s for s in baseline.get('scenarios', [])}
+    regressions = []
+    for scenario in report['scenarios']:
+        base = previous.get(scenario['vehicles'])
+        if base is None:
+            continue
+        for stage, stats in scenario['stages'].items():
+            old = base['stages'].get(stage, {}).get('rows_per_second')
+            new = stats.get('rows_per_second')
+            if not old or not new:
+                continue
+            ratio = new / old
+            if ratio < 1 - tolerance:
+                regressions.append({
+                    'vehicles': scenario['vehicles'],
+                    'stage': stage,
+                    'baseline_rows_per_second': old,
+                    'rows_per_second': new,
+                    'ratio': round(ratio, 3),
+                })
+    return regressions
+
+
+def main():
+    """Executa os cenários e grava o relatório JSON"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vehicles', type=int, nargs='+', default=[1000, 10000],
+                        help='Tamanhos de frota (um cenário por valor)')
+    parser.add_argument('--captures', type=int, default=12,
+                        help='Capturas por cenário')
+    parser.add_argument('--interval-seconds', type=float, default=60,
+                        help='Intervalo simulado entre capturas')
+    parser.add_argument('--aggregation-minutes', type=int, default=2)
+    parser.add_argument('--output-format', choices=['csv', 'parquet'], default='parquet')
+    parser.add_argument('--storage-latency-ms', type=float, default=0)
+    parser.add_argument('--trace-python-heap', action='store_true',
+                        help='Mede o pico do heap Python (tracemalloc, mais lento)')
+    parser.add_argument('--output', help='Arquivo JSON do relatório '
+                        '(padrão: data/benchmarks/brt_benchmark_<timestamp>.json)')
+    parser.add_argument('--baseline', help='Relatório anterior para comparação')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Queda de registros/s tolerada contra o baseline')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment_info(),
+        'scenarios': [],
+    }
+
+    # Um processo por cenário: o pico de RSS de um não contamina o outro
+    context = multiprocessing.get_context('spawn')
+    for vehicles in args.vehicles:
+        logger.warning(f"Cenário: {vehicles} veículos x {args.captures} capturas")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            scenario = executor.submit(
+                run_scenario,
+                vehicles,
+                args.captures,
+                args.interval_seconds,
+                args.aggregation_minutes,
+                args.output_format,
+                args.storage_latency_ms,
+                args.trace_python_heap,
+                args.log_level,
+            ).result()
+        report['scenarios'].append(scenario)
+
+    exit_code = 0
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        report['regressions'] = compare_results(report, baseline, args.tolerance)
+        exit_code = 1 if report['regressions'] else 0
+
+    output = Path(
+        args.output
+        or Path(__file__).parent.parent / 'data' / 'benchmarks'
+        / f"brt_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding='utf-8')
+
+    print(json.dumps(report, indent=2))
+    logger.warning(f"Relatório gravado em {output}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
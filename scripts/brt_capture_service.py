@@ -0,0 +1,252 @@
+"""
+Serviço de captura contínua da API BRT
+Loop asyncio que consulta a API em intervalos sub-minuto e alimenta o agregador
+Arquitetura Medallion - Ingestão da camada Bronze desacoplada do Prefect
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+from loguru import logger
+import os
+import random
+import signal
+import time
+from dotenv import load_dotenv
+
+from brt_api_capture import BRTAPICapture
+from brt_data_aggregator import BRTDataAggregator
+
+load_dotenv()
+
+
+class BRTCaptureService:
+    """Serviço de longa duração que captura e agrega dados BRT"""
+
+    def __init__(
+        self,
+        capture: Optional[BRTAPICapture] = None,
+        aggregator: Optional[BRTDataAggregator] = None,
+        poll_interval_seconds: Optional[float] = None,
+        jitter_seconds: Optional[float] = None,
+        max_pending: Optional[int] = None,
+        on_window_ready: Optional[Callable[[List[str]], None]] = None
+    ):
+        """
+        Inicializa o serviço de captura
+
+        Args:
+            capture: Capturador da API (padrão: BRTAPICapture())
+            aggregator: Agregador de janelas (padrão: BRTDataAggregator())
+            poll_interval_seconds: Intervalo entre consultas à API
+            jitter_seconds: Variação aleatória máxima somada a cada consulta
+            max_pending: Capturas aguardando agregação antes de descartar
+                a mais antiga
+            on_window_ready: Função chamada com os arquivos de cada janela
+                gravada (ex.: disparo do flow de upload/DBT)
+        """
+        self.capture = capture or BRTAPICapture()
+        self.aggregator = aggregator or BRTDataAggregator()
+        self.poll_interval = float(
+            poll_interval_seconds
+            or os.getenv('CAPTURE_INTERVAL_SECONDS', 15)
+        )
+        self.jitter = float(
+            jitter_seconds if jitter_seconds is not None
+            else os.getenv('CAPTURE_JITTER_SECONDS', 1)
+        )
+        self.max_pending = int(
+            max_pending or os.getenv('CAPTURE_QUEUE_SIZE', 4)
+        )
+        self.on_window_ready = on_window_ready
+
+        # Um executor por recurso: capturador e agregador não são
+        # thread-safe, e o disparo downstream não deve travar a agregação
+        self._capture_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='brt-capture'
+        )
+        self._aggregate_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='brt-aggregate'
+        )
+        self._downstream_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='brt-downstream'
+        )
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._stop_event: Optional[asyncio.Event] = None
+
+        self.stats = {
+            'polls': 0,
+            'captures': 0,
+            'not_modified': 0,
+            'empty': 0,
+            'errors': 0,
+            'missed_ticks': 0,
+            'dropped_captures': 0,
+            'rows_aggregated': 0,
+            'windows_saved': 0,
+        }
+
+        logger.info(
+            f"Serviço de captura inicializado: intervalo {self.poll_interval}s, "
+            f"jitter {self.jitter}s, fila {self.max_pending}"
+        )
+
+    async def _enqueue(self, df, network=None) -> None:
+        """Enfileira captura, descartando a mais antiga se a fila estiver cheia"""
+        if self._queue.full():
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.stats['dropped_captures'] += 1
+            logger.warning(
+                "Agregação atrasada: captura mais antiga descartada da fila"
+            )
+        await self._queue.put((df, network))
+
+    async def _producer(self) -> None:
+        """Consulta a API em cadência fixa, com jitter e sem acumular atrasos"""
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+
+        while not self._stop_event.is_set():
+            self.stats['polls'] += 1
+            try:
+                df = await loop.run_in_executor(
+                    self._capture_executor, self.capture.capture_and_process
+                )
+                if self.capture.last_not_modified:
+                    self.stats['not_modified'] += 1
+                elif df.empty:
+                    self.stats['empty'] += 1
+                else:
+                    self.stats['captures'] += 1
+                    await self._enqueue(df, self.capture.last_network)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Erro na captura: {e}")
+
+            # Próximo instante da grade; ticks perdidos não são recuperados
+            next_tick += self.poll_interval
+            now = loop.time()
+            if now > next_tick:
+                missed = int((now - next_tick) // self.poll_interval) + 1
+                self.stats['missed_ticks'] += missed
+                next_tick += missed * self.poll_interval
+                logger.warning(f"Captura lenta: {missed} consultas puladas")
+
+            delay = next_tick - now + random.uniform(0, self.jitter)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _aggregate(self, df, network=None) -> List[str]:
+        """Agrega captura e resumo de rede e grava janelas prontas"""
+        if not self.aggregator.add_data(df, network=network):
+            return []
+        return self.aggregator.save_ready_windows()
+
+    def _dispatch(self, file_paths: List[str]) -> None:
+        """Executa o callback downstream isolando falhas"""
+        try:
+            self.on_window_ready(file_paths)
+        except Exception as e:
+            logger.error(f"Erro no processamento downstream: {e}")
+
+    async def _consumer(self) -> None:
+        """Agrega capturas da fila e dispara o processamento downstream"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            df, network = await self._queue.get()
+            try:
+                file_paths = await loop.run_in_executor(
+                    self._aggregate_executor, self._aggregate, df, network
+                )
+                self.stats['rows_aggregated'] += len(df)
+                if file_paths:
+                    self.stats['windows_saved'] += len(file_paths)
+                    logger.success(f"Janelas gravadas: {file_paths}")
+                    if self.on_window_ready is not None:
+                        loop.run_in_executor(
+                            self._downstream_executor, self._dispatch, file_paths
+                        )
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Erro na agregação: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def run(self, duration_seconds: Optional[float] = None) -> dict:
+        """
+        Executa o serviço até stop() ou até o tempo limite
+
+        Args:
+            duration_seconds: Tempo máximo de execução (None = indefinido)
+
+        Returns:
+            Dict com estatísticas da execução
+        """
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._stop_event = asyncio.Event()
+        started = time.monotonic()
+
+        consumer = asyncio.create_task(self._consumer())
+        producer = asyncio.create_task(self._producer())
+
+        try:
+            if duration_seconds is None:
+                await self._stop_event.wait()
+            else:
+                try:
+                    await asyncio.wait_for(
+                        self._stop_event.wait(), timeout=duration_seconds
+                    )
+                except asyncio.TimeoutError:
+                    self._stop_event.set()
+            await producer
+            # Drena capturas pendentes antes de encerrar
+            await self._queue.join()
+        finally:
+            consumer.cancel()
+            self._downstream_executor.shutdown(wait=True)
+            self._aggregate_executor.shutdown(wait=True)
+            self._capture_executor.shutdown(wait=True)
+            self.capture.close()
+
+        self.stats['uptime_seconds'] = round(time.monotonic() - started, 1)
+        logger.info(f"Serviço de captura encerrado: {self.stats}")
+        return self.stats
+
+    def stop(self) -> None:
+        """Solicita o encerramento do serviço"""
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+
+def run_service(service: BRTCaptureService) -> None:
+    """
+    Executa o serviço em um novo loop asyncio até SIGINT/SIGTERM
+
+    Args:
+        service: Serviço já configurado
+    """
+    async def runner():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, service.stop)
+            except NotImplementedError:
+                pass
+        await service.run()
+
+    asyncio.run(runner())
+
+
+def main():
+    """Função principal: executa o serviço até SIGINT/SIGTERM"""
+    run_service(BRTCaptureService())
+
+
+if __name__ == "__main__":
+    main()
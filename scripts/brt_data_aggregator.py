@@ -1,130 +1,770 @@
 """
 Agregador de dados BRT
-Coleta dados minuto a minuto e gera arquivo CSV com 10 minutos de dados
+Coleta dados minuto a minuto e gera arquivo CSV ou Parquet por janela de 10 minutos
+Janelas alinhadas ao relógio e fechadas por watermark de tempo de evento
 Arquitetura Medallion - Transição Bronze -> Silver
 """
 
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 from loguru import logger
 import os
+import shutil
+import time
 from dotenv import load_dotenv
 
+from brt_heatmap import WindowHeatmap, heatmap_enabled, write_heatmap
+from brt_map_matching import WindowNetwork, write_network
+from brt_schema import conform_dataframe
+from brt_spill_buffer import SpillBuffer
+from brt_state_files import read_json, write_json_atomic
+from brt_stream_metrics import (
+    PARTIAL_COLUMNS,
+    WindowMetrics,
+    combine_partials,
+    stream_metrics_enabled,
+    write_partials,
+)
+from brt_trajectories import (
+    TRAJECTORY_SOURCE_COLUMNS,
+    build_trajectories,
+    summarize_trajectories,
+    trajectories_enabled,
+    write_trajectories,
+)
+
 load_dotenv()
 
+OUTPUT_FORMATS = ('csv', 'parquet')
+EVENT_TIME_COLUMNS = ('capture_timestamp', 'timestamp_gps')
+
 
 class BRTDataAggregator:
-    """Classe para agregação de dados BRT capturados minuto a minuto"""
+    """Classe para agregação de dados BRT em janelas de tempo de evento"""
     
     def __init__(
         self, 
         aggregation_minutes: int = 10,
-        data_dir: Optional[str] = None
+        data_dir: Optional[str] = None,
+        output_format: Optional[str] = None,
+        compression: Optional[str] = None,
+        row_group_size: Optional[int] = None,
+        event_time_column: Optional[str] = None,
+        allowed_lateness_seconds: Optional[int] = None,
+        stream_metrics: Optional[bool] = None,
+        live_metrics_interval_seconds: Optional[float] = None,
+        trajectories: Optional[bool] = None,
+        heatmap: Optional[bool] = None,
+        buffer_dir: Optional[str] = None,
+        max_clock_skew_seconds: Optional[int] = None
     ):
         """
         Inicializa o agregador de dados
         
         Args:
-            aggregation_minutes: Quantidade de minutos para agregação
+            aggregation_minutes: Tamanho da janela de agregação em minutos
             data_dir: Diretório para armazenar dados
+            output_format: Formato dos arquivos gerados ('csv' ou 'parquet')
+            compression: Codec de compressão do Parquet (snappy, zstd, gzip, none)
+            row_group_size: Quantidade máxima de linhas por row group do Parquet
+            event_time_column: Coluna de tempo de evento que define a janela
+                ('capture_timestamp' ou 'timestamp_gps')
+            allowed_lateness_seconds: Atraso tolerado antes de fechar a janela
+            stream_metrics: Mantém as métricas Gold de cada janela enquanto
+                as capturas chegam (padrão: STREAM_METRICS)
+            live_metrics_interval_seconds: Intervalo mínimo entre regravações
+                de metrics_live.parquet; 0 grava a cada captura
+                (padrão: LIVE_METRICS_INTERVAL_SECONDS)
+            trajectories: Grava a tabela de segmentos por veículo de cada
+                janela fechada (padrão: TRAJECTORIES)
+            heatmap: Mantém contagens e velocidades por célula da grade de
+                cada janela (padrão: HEATMAP)
+            buffer_dir: Diretório do buffer em disco (padrão: data_dir/buffer)
+            max_clock_skew_seconds: Quanto um tempo de evento pode estar à
+                frente do relógio local antes de ser descartado; 0 desativa
+                (padrão: MAX_EVENT_TIME_SKEW_SECONDS)
         """
         self.aggregation_minutes = int(
             os.getenv('AGGREGATION_MINUTES', aggregation_minutes)
         )
+        self.output_format = (
+            output_format or os.getenv('OUTPUT_FORMAT', 'csv')
+        ).lower()
+        if self.output_format not in OUTPUT_FORMATS:
+            raise ValueError(
+                f"Formato de saída inválido: {self.output_format} "
+                f"(use {', '.join(OUTPUT_FORMATS)})"
+            )
+        self.compression = (
+            compression or os.getenv('PARQUET_COMPRESSION', 'snappy')
+        ).lower()
+        self.row_group_size = int(
+            row_group_size or os.getenv('PARQUET_ROW_GROUP_SIZE', 100000)
+        )
+        self.event_time_column = (
+            event_time_column
+            or os.getenv('EVENT_TIME_COLUMN', 'capture_timestamp')
+        )
+        if self.event_time_column not in EVENT_TIME_COLUMNS:
+            raise ValueError(
+                f"Coluna de tempo de evento inválida: {self.event_time_column} "
+                f"(use {', '.join(EVENT_TIME_COLUMNS)})"
+            )
+        if allowed_lateness_seconds is None:
+            allowed_lateness_seconds = int(
+                os.getenv('ALLOWED_LATENESS_SECONDS', 0)
+            )
+        if max_clock_skew_seconds is None:
+            max_clock_skew_seconds = int(
+                os.getenv('MAX_EVENT_TIME_SKEW_SECONDS', 300)
+            )
+        self.window_size = pd.Timedelta(minutes=self.aggregation_minutes)
+        self.allowed_lateness = pd.Timedelta(seconds=allowed_lateness_seconds)
+        self.max_clock_skew = (
+            pd.Timedelta(seconds=max_clock_skew_seconds)
+            if max_clock_skew_seconds > 0 else None
+        )
+        
         self.data_dir = Path(data_dir or './data')
         self.bronze_dir = self.data_dir / 'bronze'
         self.silver_dir = self.data_dir / 'silver'
+        self.buffer_dir = Path(buffer_dir or self.data_dir / 'buffer')
+        self.metrics_dir = self.data_dir / 'gold' / 'metrics_partials'
+        self.live_metrics_path = self.data_dir / 'gold' / 'metrics_live.parquet'
+        self.trajectories_dir = self.data_dir / 'gold' / 'trajectories'
+        self.trajectories = (
+            trajectories_enabled() if trajectories is None else trajectories
+        )
+        self.heatmap_dir = self.data_dir / 'gold' / 'heatmap'
+        self.heatmap = heatmap_enabled() if heatmap is None else heatmap
+        self.network_dir = self.data_dir / 'gold' / 'network'
+        self.stream_metrics = (
+            stream_metrics_enabled() if stream_metrics is None
+            else stream_metrics
+        )
+        if live_metrics_interval_seconds is None:
+            live_metrics_interval_seconds = float(
+                os.getenv('LIVE_METRICS_INTERVAL_SECONDS', 60)
+            )
+        self.live_metrics_interval = live_metrics_interval_seconds
+        self._live_metrics_written_at: Optional[float] = None
         
         # Cria diretórios se não existirem
         self.bronze_dir.mkdir(parents=True, exist_ok=True)
         self.silver_dir.mkdir(parents=True, exist_ok=True)
+        self.buffer_dir.mkdir(parents=True, exist_ok=True)
         
         logger.info(
-            f"Agregador inicializado: {self.aggregation_minutes} minutos"
+            f"Agregador inicializado: janelas de {self.aggregation_minutes} "
+            f"minutos por {self.event_time_column} (formato {self.output_format})"
         )
         
-        self.data_buffer: List[pd.DataFrame] = []
-        self.buffer_start_time: Optional[datetime] = None
+        # Uma janela aberta por buffer em disco, recuperadas após reinício
+        self.windows: Dict[pd.Timestamp, SpillBuffer] = {}
+        self.metrics: Dict[pd.Timestamp, WindowMetrics] = {}
+        self.heatmaps: Dict[pd.Timestamp, WindowHeatmap] = {}
+        self.networks: Dict[pd.Timestamp, WindowNetwork] = {}
+        self.max_event_time: Optional[pd.Timestamp] = None
+        self.late_rows = 0
+        self.future_rows = 0
+        self._restore_buffer()
+    
+    @property
+    def watermark(self) -> Optional[pd.Timestamp]:
+        """Maior tempo de evento visto, descontado o atraso tolerado"""
+        if self.max_event_time is None:
+            return None
+        return self.max_event_time - self.allowed_lateness
     
-    def add_data(self, df: pd.DataFrame) -> bool:
+    def _max_valid_event_time(self) -> Optional[pd.Timestamp]:
         """
-        Adiciona dados ao buffer
+        Maior tempo de evento aceito: relógio local mais a tolerância
+
+        timestamp_gps é comparado em UTC e capture_timestamp no horário
+        local, como são gerados.
+        """
+        if self.max_clock_skew is None:
+            return None
+        if self.event_time_column == 'timestamp_gps':
+            now = pd.Timestamp.now(tz='UTC').tz_localize(None)
+        else:
+            now = pd.Timestamp.now()
+        return now + self.max_clock_skew
+    
+    def _window_dir(self, window_start: pd.Timestamp) -> Path:
+        """Diretório do buffer em disco de uma janela"""
+        return self.buffer_dir / f"window={window_start.strftime('%Y%m%dT%H%M')}"
+    
+    def _window_buffer(self, window_start: pd.Timestamp) -> SpillBuffer:
+        """Retorna (criando se necessário) o buffer de uma janela"""
+        if window_start not in self.windows:
+            self.windows[window_start] = SpillBuffer(
+                self._window_dir(window_start)
+            )
+        return self.windows[window_start]
+    
+    def _window_metrics(self, window_start: pd.Timestamp) -> WindowMetrics:
+        """Retorna (criando se necessário) as métricas de uma janela"""
+        if window_start not in self.metrics:
+            self.metrics[window_start] = WindowMetrics(window_start)
+        return self.metrics[window_start]
+    
+    def _rebuild_metrics(
+        self,
+        window_start: pd.Timestamp,
+        window_buffer: SpillBuffer
+    ) -> WindowMetrics:
+        """Recalcula as métricas de uma janela a partir dos segmentos em disco"""
+        metrics = WindowMetrics(window_start)
+        for table in window_buffer.iter_tables():
+            metrics.update(table.to_pandas())
+        self.metrics[window_start] = metrics
+        return metrics
+    
+    def _window_heatmap(self, window_start: pd.Timestamp) -> WindowHeatmap:
+        """Retorna (criando se necessário) o mapa de calor de uma janela"""
+        if window_start not in self.heatmaps:
+            self.heatmaps[window_start] = WindowHeatmap(window_start)
+        return self.heatmaps[window_start]
+    
+    def _rebuild_heatmap(
+        self,
+        window_start: pd.Timestamp,
+        window_buffer: SpillBuffer
+    ) -> WindowHeatmap:
+        """Recalcula o mapa de calor de uma janela a partir do disco"""
+        heatmap = WindowHeatmap(window_start)
+        for table in window_buffer.iter_tables():
+            heatmap.update(
+                table.select(['latitude', 'longitude', 'speed']).to_pandas()
+            )
+        self.heatmaps[window_start] = heatmap
+        return heatmap
+    
+    def _write_heatmap(
+        self,
+        window_start: pd.Timestamp,
+        window_buffer: SpillBuffer
+    ) -> Optional[Path]:
+        """
+        Grava o mapa de calor da janela (apenas células ocupadas)
+        
+        Returns:
+            Caminho gravado ou None se nenhuma posição caiu na grade
+        """
+        heatmap = self.heatmaps.pop(window_start, None)
+        if heatmap is None:
+            heatmap = self._rebuild_heatmap(window_start, window_buffer)
+            del self.heatmaps[window_start]
+        if heatmap.empty:
+            return None
+        return write_heatmap(
+            heatmap.to_frame(),
+            self._gold_path(self.heatmap_dir, 'brt_heatmap', window_start)
+        )
+    
+    def _add_network(self, summary: Dict[str, pd.DataFrame]) -> None:
+        """
+        Acumula o resumo de rede de uma captura na janela da captura
+        
+        O resumo é calculado antes do filtro delta e descreve a captura
+        inteira, por isso entra na janela do seu capture_timestamp (e não na
+        do tempo de evento de cada registro). Mantido só em memória: após um
+        reinício a janela cobre as capturas seguintes (ver window_captures).
+        
+        Args:
+            summary: Dict retornado por MapMatcher.process
+        """
+        timestamps = [
+            table['capture_timestamp'].max()
+            for table in summary.values() if not table.empty
+        ]
+        if not timestamps:
+            return
+        window_start = pd.Timestamp(max(timestamps)).floor(self.window_size)
+        watermark = self.watermark
+        if watermark is not None and window_start + self.window_size <= watermark:
+            logger.warning(
+                f"Resumo de rede de janela já fechada descartado ({window_start})"
+            )
+            return
+        if window_start not in self.networks:
+            self.networks[window_start] = WindowNetwork(window_start)
+        self.networks[window_start].add(summary)
+    
+    def _write_network(self, window_start: pd.Timestamp) -> List[Path]:
+        """
+        Grava os resumos de rede (segments/ e stops/) de uma janela fechada
+        
+        Returns:
+            Caminhos gravados (vazio se nenhum trecho ou parada foi ocupado)
+        """
+        network = self.networks[window_start]
+        paths = []
+        for name, table in network.to_frames().items():
+            paths.append(write_network(
+                table,
+                self._gold_path(
+                    self.network_dir / name, f'brt_{name}', window_start
+                )
+            ))
+        del self.networks[window_start]
+        if paths:
+            logger.info(
+                f"Rede da janela {window_start}: {network.captures} capturas "
+                f"({', '.join(p.name for p in paths)})"
+            )
+        return paths
+    
+    def _gold_path(
+        self,
+        base_dir: Path,
+        prefix: str,
+        window_start: pd.Timestamp
+    ) -> Path:
+        """Arquivo Parquet derivado de uma janela fechada (dt=/hour=)"""
+        return (
+            base_dir
+            / f"dt={window_start.strftime('%Y-%m-%d')}"
+            / f"hour={window_start.strftime('%H')}"
+            / f"{prefix}_{window_start.strftime('%Y%m%d_%H%M')}.parquet"
+        )
+    
+    def _metrics_path(self, window_start: pd.Timestamp) -> Path:
+        """Arquivo de agregados parciais de uma janela fechada"""
+        return self._gold_path(self.metrics_dir, 'brt_metrics', window_start)
+    
+    def _write_trajectories(
+        self,
+        window_start: pd.Timestamp,
+        window_buffer: SpillBuffer
+    ) -> Optional[Path]:
+        """
+        Reconstrói e grava as trajetórias da janela
+        
+        Lê do buffer apenas as colunas usadas, sem raw_data.
+        
+        Returns:
+            Caminho gravado ou None se a janela não tiver segmentos
+        """
+        import pyarrow as pa
+        
+        tables = [
+            table.select(TRAJECTORY_SOURCE_COLUMNS)
+            for table in window_buffer.iter_tables()
+        ]
+        if not tables:
+            return None
+        
+        start = time.perf_counter()
+        segments = build_trajectories(pa.concat_tables(tables).to_pandas())
+        if segments.empty:
+            return None
+        
+        filepath = write_trajectories(
+            segments,
+            self._gold_path(self.trajectories_dir, 'brt_trajectories', window_start)
+        )
+        logger.info(
+            f"Trajetórias da janela {window_start}: "
+            f"{summarize_trajectories(segments)} "
+            f"({(time.perf_counter() - start) * 1000:.0f} ms)"
+        )
+        return filepath
+    
+    def _write_live_metrics(self, force: bool = False) -> Optional[Path]:
+        """
+        Grava o snapshot das métricas das janelas abertas
+        
+        Regravado no máximo a cada live_metrics_interval segundos; o
+        fechamento de janelas força a gravação para que o snapshot não
+        some de novo grupos já gravados em metrics_partials.
+        
+        Args:
+            force: Ignora o intervalo mínimo entre gravações
+            
+        Returns:
+            Caminho de data/gold/metrics_live.parquet ou None se não gravou
+            (stream_metrics desligado, live_metrics_path None ou intervalo
+            ainda não decorrido)
+        """
+        if not self.stream_metrics or self.live_metrics_path is None:
+            return None
+        now = time.monotonic()
+        if (
+            not force
+            and self._live_metrics_written_at is not None
+            and now - self._live_metrics_written_at < self.live_metrics_interval
+        ):
+            return None
+        self._live_metrics_written_at = now
+        frames = [m.partials for m in self.metrics.values() if not m.empty]
+        partials = (
+            combine_partials(pd.concat(frames, ignore_index=True))
+            if frames else pd.DataFrame(columns=PARTIAL_COLUMNS)
+        )
+        return write_partials(partials, self.live_metrics_path)
+    
+    def _save_state(self) -> None:
+        """Persiste o watermark e os contadores de registros descartados"""
+        write_json_atomic(self.buffer_dir / 'state.json', {
+            'max_event_time': (
+                self.max_event_time.isoformat()
+                if self.max_event_time is not None else None
+            ),
+            'late_rows': self.late_rows,
+            'future_rows': self.future_rows
+        })
+    
+    def _restore_buffer(self) -> None:
+        """
+        Restaura janelas e watermark persistidos antes de um reinício
+        
+        Janelas com finalização interrompida (arquivo já gravado) são
+        concluídas; as demais são retomadas a partir dos segmentos no disco.
+        """
+        state = read_json(self.buffer_dir / 'state.json')
+        if state.get('max_event_time'):
+            self.max_event_time = pd.Timestamp(state['max_event_time'])
+            # Watermark persistido por um relógio adiantado (versões sem o
+            # limite) fecharia todas as janelas novas
+            limit = self._max_valid_event_time()
+            if limit is not None and self.max_event_time > limit:
+                logger.warning(
+                    f"Watermark persistido no futuro ({self.max_event_time}) "
+                    f"limitado a {limit}"
+                )
+                self.max_event_time = limit
+        self.late_rows = int(state.get('late_rows', 0))
+        self.future_rows = int(state.get('future_rows', 0))
+        
+        for window_dir in sorted(self.buffer_dir.glob('window=*')):
+            window_start = pd.Timestamp(
+                datetime.strptime(window_dir.name[len('window='):], '%Y%m%dT%H%M')
+            )
+            window_buffer = SpillBuffer(window_dir)
+            output_path = self._output_path(self.silver_dir, window_start)
+            
+            if window_buffer.load_state().get('finalizing'):
+                if output_path.exists():
+                    bronze_path = self._output_path(self.bronze_dir, window_start)
+                    if not bronze_path.exists():
+                        bronze_path.parent.mkdir(parents=True, exist_ok=True)
+                        shutil.copyfile(output_path, bronze_path)
+                    metrics_path = self._metrics_path(window_start)
+                    if self.stream_metrics and not metrics_path.exists():
+                        write_partials(
+                            self._rebuild_metrics(
+                                window_start, window_buffer
+                            ).partials,
+                            metrics_path
+                        )
+                        del self.metrics[window_start]
+                    trajectories_path = self._gold_path(
+                        self.trajectories_dir, 'brt_trajectories', window_start
+                    )
+                    if self.trajectories and not trajectories_path.exists():
+                        self._write_trajectories(window_start, window_buffer)
+                    heatmap_path = self._gold_path(
+                        self.heatmap_dir, 'brt_heatmap', window_start
+                    )
+                    if self.heatmap and not heatmap_path.exists():
+                        self._write_heatmap(window_start, window_buffer)
+                    window_buffer.remove()
+                    logger.warning(
+                        f"Finalização interrompida concluída: {output_path}"
+                    )
+                    continue
+                # Interrompida antes da renomeação: descarta arquivo parcial
+                tmp_path = output_path.with_name(output_path.name + '.tmp')
+                if tmp_path.exists():
+                    tmp_path.unlink()
+            
+            if window_buffer.captures_count == 0:
+                window_buffer.remove()
+                continue
+            self.windows[window_start] = window_buffer
+            if self.stream_metrics:
+                self._rebuild_metrics(window_start, window_buffer)
+            if self.heatmap:
+                self._rebuild_heatmap(window_start, window_buffer)
+        
+        if self.windows:
+            logger.info(
+                f"Janelas retomadas do disco: {len(self.windows)} "
+                f"(watermark {self.watermark})"
+            )
+    
+    def _event_times(self, df: pd.DataFrame) -> pd.Series:
+        """
+        Extrai o tempo de evento de cada registro
+        
+        Args:
+            df: DataFrame conformado ao schema de captura
+            
+        Returns:
+            Series de timestamps (timestamp_gps é convertido de epoch em ms, UTC)
+        """
+        if self.event_time_column == 'timestamp_gps':
+            return pd.to_datetime(df['timestamp_gps'], unit='ms')
+        return df['capture_timestamp']
+    
+    def _ready_windows(self) -> List[pd.Timestamp]:
+        """Janelas cujo fim já foi ultrapassado pelo watermark"""
+        watermark = self.watermark
+        if watermark is None:
+            return []
+        return sorted(
+            window_start for window_start in self.windows
+            if window_start + self.window_size <= watermark
+        )
+    
+    def add_data(
+        self,
+        df: pd.DataFrame,
+        network: Optional[Dict[str, pd.DataFrame]] = None
+    ) -> bool:
+        """
+        Distribui os registros nas janelas de tempo de evento
+        
+        Cada registro vai para a janela alinhada ao relógio que contém seu
+        tempo de evento. Registros de janelas já fechadas pelo watermark
+        são descartados e contabilizados em late_rows. Registros à frente do
+        relógio local mais max_clock_skew (relógio do GPS adiantado) são
+        descartados e contabilizados em future_rows, para que um único
+        veículo não avance o watermark e feche as janelas de todos.
         
         Args:
             df: DataFrame com dados capturados
+            network: Resumo de rede da captura (MapMatcher.process), gravado
+                uma vez por janela em data/gold/network
             
         Returns:
-            True se buffer está completo, False caso contrário
+            True se alguma janela está pronta para ser gravada
         """
+        if network:
+            self._add_network(network)
         if df.empty:
             logger.warning("DataFrame vazio recebido, ignorando")
             return False
         
-        # Primeiro dado - inicializa timestamp
-        if self.buffer_start_time is None:
-            self.buffer_start_time = datetime.now()
-            logger.info(f"Iniciando buffer em {self.buffer_start_time}")
+        df = conform_dataframe(df)
+        event_times = self._event_times(df)
+        valid = event_times.notna()
+        if not valid.all():
+            logger.warning(
+                f"{int((~valid).sum())} registros sem tempo de evento ignorados"
+            )
+            df, event_times = df[valid], event_times[valid]
+        
+        limit = self._max_valid_event_time()
+        if limit is not None:
+            future = event_times > limit
+            future_count = int(future.sum())
+            if future_count:
+                self.future_rows += future_count
+                logger.warning(
+                    f"{future_count} registros com tempo de evento no futuro "
+                    f"descartados (após {limit})"
+                )
+                df, event_times = df[~future], event_times[~future]
+        if df.empty:
+            self._save_state()
+            return False
+        
+        window_starts = event_times.dt.floor(self.window_size)
+        
+        # Descarta registros de janelas já fechadas
+        watermark = self.watermark
+        if watermark is not None:
+            late = window_starts + self.window_size <= watermark
+            late_count = int(late.sum())
+            if late_count:
+                self.late_rows += late_count
+                logger.warning(
+                    f"{late_count} registros atrasados descartados "
+                    f"(watermark {watermark})"
+                )
+                df, event_times = df[~late], event_times[~late]
+                window_starts = window_starts[~late]
+        
+        for window_start, window_df in df.groupby(window_starts, sort=True):
+            window_start = pd.Timestamp(window_start)
+            self._window_buffer(window_start).append(window_df)
+            if self.stream_metrics:
+                # Métricas Gold atualizadas na chegada, sem reler a janela
+                self._window_metrics(window_start).update(window_df)
+            if self.heatmap:
+                self._window_heatmap(window_start).update(window_df)
+        
+        if not event_times.empty:
+            batch_max = event_times.max()
+            if self.max_event_time is None or batch_max > self.max_event_time:
+                self.max_event_time = batch_max
+        self._save_state()
+        self._write_live_metrics()
         
-        self.data_buffer.append(df.copy())
         logger.info(
-            f"Dados adicionados ao buffer: {len(self.data_buffer)} capturas"
+            f"Dados adicionados ao buffer: {len(df)} registros em "
+            f"{len(self.windows)} janelas abertas (watermark {self.watermark})"
         )
         
-        # Verifica se completou o período de agregação
-        elapsed_time = datetime.now() - self.buffer_start_time
-        is_complete = len(self.data_buffer) >= self.aggregation_minutes
-        
-        if is_complete:
+        ready = self._ready_windows()
+        if ready:
             logger.success(
-                f"Buffer completo: {len(self.data_buffer)} capturas em "
-                f"{elapsed_time.total_seconds():.1f} segundos"
+                f"Janelas completas: {', '.join(str(w) for w in ready)}"
             )
         
-        return is_complete
+        return bool(ready)
     
-    def aggregate_and_save(self) -> Optional[str]:
+    def _output_path(self, base_dir: Path, window_start: pd.Timestamp) -> Path:
         """
-        Agrega dados do buffer e salva em CSV
+        Caminho determinístico do arquivo de uma janela
         
+        Args:
+            base_dir: Diretório da camada (bronze ou silver)
+            window_start: Início da janela
+            
         Returns:
-            Caminho do arquivo CSV gerado ou None em caso de erro
+            Caminho no layout dt=YYYY-MM-DD/hour=HH/
         """
-        if not self.data_buffer:
-            logger.warning("Buffer vazio, nada para agregar")
-            return None
+        return (
+            base_dir
+            / f"dt={window_start.strftime('%Y-%m-%d')}"
+            / f"hour={window_start.strftime('%H')}"
+            / f"brt_data_{window_start.strftime('%Y%m%d_%H%M')}.{self.output_format}"
+        )
+    
+    def _write_file(self, window_buffer: SpillBuffer, filepath: Path) -> int:
+        """
+        Compacta os segmentos de uma janela no formato configurado
         
-        try:
-            # Concatena todos os DataFrames do buffer
-            aggregated_df = pd.concat(self.data_buffer, ignore_index=True)
-            
-            # Gera nome do arquivo com timestamp
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"brt_data_{timestamp}.csv"
-            filepath = self.silver_dir / filename
-            
-            # Salva CSV
-            aggregated_df.to_csv(filepath, index=False)
+        O arquivo é gravado com sufixo temporário e renomeado ao final,
+        para que nunca exista um arquivo parcial com o nome definitivo.
+        
+        Args:
+            window_buffer: Buffer em disco da janela
+            filepath: Caminho de destino do arquivo
             
-            logger.success(
-                f"Arquivo CSV gerado: {filepath} "
-                f"({len(aggregated_df)} registros)"
+        Returns:
+            Quantidade de registros gravados
+        """
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        tmp_filepath = filepath.with_name(filepath.name + '.tmp')
+        
+        if self.output_format == 'parquet':
+            rows = window_buffer.write_parquet(
+                tmp_filepath,
+                compression=self.compression,
+                row_group_size=self.row_group_size
             )
+        else:
+            rows = window_buffer.write_csv(tmp_filepath)
+        
+        tmp_filepath.replace(filepath)
+        return rows
+    
+    def save_ready_windows(self, force: bool = False) -> List[str]:
+        """
+        Grava todas as janelas prontas em CSV ou Parquet
+        
+        Args:
+            force: Grava também janelas ainda abertas (ex.: no encerramento)
             
-            # Também salva cópia na camada bronze (dados brutos)
-            bronze_filepath = self.bronze_dir / filename
-            aggregated_df.to_csv(bronze_filepath, index=False)
-            
-            # Limpa buffer
-            self.data_buffer = []
-            self.buffer_start_time = None
-            
-            return str(filepath)
+        Returns:
+            Lista de caminhos dos arquivos gerados na camada silver
+        """
+        window_starts = sorted(self.windows) if force else self._ready_windows()
+        saved_paths = []
+        
+        for window_start in window_starts:
+            window_buffer = self.windows[window_start]
+            try:
+                filepath = self._output_path(self.silver_dir, window_start)
+                
+                # Registra a finalização para que um reinício no meio dela
+                # não gere o mesmo arquivo duas vezes
+                window_buffer.save_state({'finalizing': True})
+                
+                # Compacta segmentos do buffer sem concatenar em memória
+                rows = self._write_file(window_buffer, filepath)
+                
+                logger.success(
+                    f"Arquivo {self.output_format.upper()} gerado: {filepath} "
+                    f"({rows} registros)"
+                )
+                
+                # Também salva cópia na camada bronze (dados brutos)
+                bronze_filepath = self._output_path(self.bronze_dir, window_start)
+                bronze_filepath.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(filepath, bronze_filepath)
+                
+                # Agregados parciais da janela (somados pela rollup Gold)
+                if self.stream_metrics:
+                    metrics = self.metrics.get(window_start)
+                    if metrics is None:
+                        metrics = self._rebuild_metrics(
+                            window_start, window_buffer
+                        )
+                    write_partials(
+                        metrics.partials, self._metrics_path(window_start)
+                    )
+                    self.metrics.pop(window_start, None)
+                
+                if self.trajectories:
+                    self._write_trajectories(window_start, window_buffer)
+                
+                if self.heatmap:
+                    self._write_heatmap(window_start, window_buffer)
+                
+                # Limpa buffer da janela
+                window_buffer.remove()
+                del self.windows[window_start]
+                
+                saved_paths.append(str(filepath))
+                
+            except Exception as e:
+                logger.error(
+                    f"Erro ao agregar e salvar janela {window_start}: {e}"
+                )
+        
+        # Rede: janela do capture_timestamp, que pode não ter buffer próprio
+        watermark = self.watermark
+        for window_start in sorted(self.networks):
+            if force or (
+                watermark is not None
+                and window_start + self.window_size <= watermark
+            ):
+                try:
+                    self._write_network(window_start)
+                except Exception as e:
+                    logger.error(
+                        f"Erro ao gravar a rede da janela {window_start}: {e}"
+                    )
+        
+        if saved_paths:
+            self._write_live_metrics(force=True)
+        
+        return saved_paths
+    
+    def aggregate_and_save(self, force: bool = False) -> Optional[str]:
+        """
+        Grava as janelas prontas e retorna o arquivo mais recente
+        
+        Args:
+            force: Grava também janelas ainda abertas
             
-        except Exception as e:
-            logger.error(f"Erro ao agregar e salvar dados: {e}")
+        Returns:
+            Caminho do último arquivo gerado ou None se nada foi gravado
+        """
+        if not self.windows:
+            logger.warning("Buffer vazio, nada para agregar")
             return None
+        
+        saved_paths = self.save_ready_windows(force=force)
+        return saved_paths[-1] if saved_paths else None
     
     def get_buffer_status(self) -> dict:
         """
@@ -133,15 +773,20 @@ class BRTDataAggregator:
         Returns:
             Dict com informações do buffer
         """
-        elapsed = None
-        if self.buffer_start_time:
-            elapsed = (datetime.now() - self.buffer_start_time).total_seconds()
+        watermark = self.watermark
         
         return {
-            'captures_count': len(self.data_buffer),
+            'open_windows': [str(w) for w in sorted(self.windows)],
+            'captures_count': sum(
+                b.captures_count for b in self.windows.values()
+            ),
+            'buffered_rows': sum(b.rows_count for b in self.windows.values()),
             'target_captures': self.aggregation_minutes,
-            'elapsed_seconds': elapsed,
-            'is_complete': len(self.data_buffer) >= self.aggregation_minutes
+            'watermark': str(watermark) if watermark is not None else None,
+            'late_rows': self.late_rows,
+            'future_rows': self.future_rows,
+            'live_metrics_groups': sum(len(m) for m in self.metrics.values()),
+            'is_complete': bool(self._ready_windows())
         }
 
 
@@ -155,22 +800,22 @@ def main():
     aggregator = BRTDataAggregator(aggregation_minutes=3)  # 3 min para teste
     
     print("=== Teste de Agregação BRT ===")
-    print(f"Capturando dados a cada minuto por {aggregator.aggregation_minutes} minutos...\n")
+    print(f"Capturando dados a cada minuto até fechar uma janela de {aggregator.aggregation_minutes} minutos...\n")
     
-    # Simula captura minuto a minuto
-    for i in range(aggregator.aggregation_minutes):
-        print(f"[{i+1}/{aggregator.aggregation_minutes}] Capturando dados...")
+    # Simula captura minuto a minuto (uma janela fecha em até 2x o seu tamanho)
+    total_captures = 2 * aggregator.aggregation_minutes
+    for i in range(total_captures):
+        print(f"[{i+1}/{total_captures}] Capturando dados...")
         
         df = capture.capture_and_process()
         is_complete = aggregator.add_data(df)
         
         status = aggregator.get_buffer_status()
-        print(f"Status: {status['captures_count']}/{status['target_captures']} capturas")
+        print(f"Status: {status['captures_count']} capturas, watermark {status['watermark']}")
         
         if is_complete:
-            print("\n✓ Buffer completo! Gerando CSV...")
-            filepath = aggregator.aggregate_and_save()
-            if filepath:
+            print("\n✓ Janela completa! Gerando arquivo...")
+            for filepath in aggregator.save_ready_windows():
                 print(f"✓ Arquivo salvo: {filepath}\n")
             break
         else:
@@ -0,0 +1,263 @@
+"""
+Mapa de calor em grade fixa para o pipeline BRT
+Cada captura é distribuída em células de uma grade regular sobre o Rio de
+Janeiro (índices pré-calculados) e os agregados por célula são mantidos em
+arrays NumPy atualizados com np.bincount
+Arquitetura Medallion - Gold espacial (congestionamento por célula e janela)
+"""
+
+from pathlib import Path
+from typing import Optional
+import os
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from local_engine import LATITUDE_RANGE, LONGITUDE_RANGE
+
+load_dotenv()
+
+METERS_PER_DEGREE = 111195.0
+GEOHASH_ALPHABET = np.array(list('0123456789bcdefghjkmnpqrstuvwxyz'))
+
+# Velocidade (km/h) até a qual o veículo conta como lento (faixa 'Lento')
+SLOW_SPEED_KMH = 20.0
+
+HEATMAP_COLUMNS = [
+    'window_start',
+    'cell_id',
+    'cell_row',
+    'cell_col',
+    'geohash',
+    'center_latitude',
+    'center_longitude',
+    'observations',
+    'speed_observations',
+    'avg_speed_kmh',
+    'stddev_speed_kmh',
+    'stopped_share',
+    'slow_share',
+]
+
+
+def geohash_encode(latitude, longitude, precision: int = 7) -> np.ndarray:
+    """
+    Geohash vetorizado (intercalação de bits sem laço por ponto)
+
+    Args:
+        latitude: Latitudes em graus
+        longitude: Longitudes em graus
+        precision: Quantidade de caracteres
+
+    Returns:
+        Array de strings
+    """
+    latitude = np.asarray(latitude, dtype='float64')
+    longitude = np.asarray(longitude, dtype='float64')
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+
+    lon_int = np.clip(
+        ((longitude + 180.0) / 360.0 * (1 << lon_bits)).astype('int64'),
+        0, (1 << lon_bits) - 1
+    )
+    lat_int = np.clip(
+        ((latitude + 90.0) / 180.0 * (1 << lat_bits)).astype('int64'),
+        0, (1 << lat_bits) - 1
+    )
+
+    # Bits pares (a partir do mais significativo) são de longitude
+    code = np.zeros(len(latitude), dtype='int64')
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (lon_int >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_int >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+
+    shifts = 5 * np.arange(precision - 1, -1, -1)
+    chars = GEOHASH_ALPHABET[(code[:, None] >> shifts) & 31]
+    return chars.view(f'<U{precision}').ravel()
+
+
+class HeatmapGrid:
+    """Grade regular sobre os limites do município, com geometria pré-calculada"""
+
+    def __init__(self, cell_size_m: Optional[float] = None):
+        """
+        Calcula as dimensões e os centros das células
+
+        Args:
+            cell_size_m: Lado aproximado da célula em metros
+                (padrão: HEATMAP_CELL_M)
+        """
+        self.cell_size = float(
+            cell_size_m if cell_size_m is not None
+            else os.getenv('HEATMAP_CELL_M', 250)
+        )
+        self.lat_min, self.lat_max = LATITUDE_RANGE
+        self.lon_min, self.lon_max = LONGITUDE_RANGE
+
+        center_lat = (self.lat_min + self.lat_max) / 2.0
+        self.lat_step = self.cell_size / METERS_PER_DEGREE
+        self.lon_step = self.cell_size / (
+            METERS_PER_DEGREE * np.cos(np.radians(center_lat))
+        )
+        self.rows = int(np.ceil((self.lat_max - self.lat_min) / self.lat_step))
+        self.cols = int(np.ceil((self.lon_max - self.lon_min) / self.lon_step))
+        self.size = self.rows * self.cols
+
+        cell = np.arange(self.size)
+        self.cell_row = (cell // self.cols).astype('int32')
+        self.cell_col = (cell % self.cols).astype('int32')
+        self.center_latitude = self.lat_min + (self.cell_row + 0.5) * self.lat_step
+        self.center_longitude = self.lon_min + (self.cell_col + 0.5) * self.lon_step
+        self.geohash = geohash_encode(self.center_latitude, self.center_longitude)
+
+    def cell_index(self, latitude, longitude) -> np.ndarray:
+        """
+        Célula de cada coordenada
+
+        Args:
+            latitude: Latitudes em graus
+            longitude: Longitudes em graus
+
+        Returns:
+            Array int64 de índices (-1 fora dos limites ou sem coordenada)
+        """
+        latitude = np.asarray(latitude, dtype='float64')
+        longitude = np.asarray(longitude, dtype='float64')
+        row = np.floor((latitude - self.lat_min) / self.lat_step)
+        col = np.floor((longitude - self.lon_min) / self.lon_step)
+        inside = (
+            (row >= 0) & (row < self.rows) & (col >= 0) & (col < self.cols)
+        )
+        return np.where(
+            inside, np.nan_to_num(row) * self.cols + np.nan_to_num(col), -1
+        ).astype('int64')
+
+
+_grid: HeatmapGrid = None
+
+
+def get_grid() -> HeatmapGrid:
+    """Retorna a grade compartilhada, criando-a na primeira chamada"""
+    global _grid
+    if _grid is None:
+        _grid = HeatmapGrid()
+    return _grid
+
+
+class WindowHeatmap:
+    """Agregados por célula de uma janela, atualizados a cada captura"""
+
+    def __init__(self, window_start: pd.Timestamp, grid: Optional[HeatmapGrid] = None):
+        """
+        Inicializa os arrays de agregados zerados
+
+        Args:
+            window_start: Início da janela
+            grid: Grade usada (padrão: a grade compartilhada)
+        """
+        self.window_start = window_start
+        self.grid = grid or get_grid()
+        size = self.grid.size
+        self.observations = np.zeros(size, dtype='int64')
+        self.speed_count = np.zeros(size, dtype='int64')
+        self.speed_sum = np.zeros(size, dtype='float64')
+        self.speed_sq_sum = np.zeros(size, dtype='float64')
+        self.stopped = np.zeros(size, dtype='int64')
+        self.slow = np.zeros(size, dtype='int64')
+
+    def update(self, df: pd.DataFrame) -> None:
+        """
+        Incorpora uma captura aos agregados
+
+        Args:
+            df: Registros da captura pertencentes a esta janela
+        """
+        cell = self.grid.cell_index(
+            df['latitude'].to_numpy(dtype='float64', na_value=np.nan),
+            df['longitude'].to_numpy(dtype='float64', na_value=np.nan)
+        )
+        speed = df['speed'].to_numpy(dtype='float64', na_value=np.nan)
+        inside = cell >= 0
+        cell, speed = cell[inside], speed[inside]
+        size = self.grid.size
+
+        self.observations += np.bincount(cell, minlength=size)
+        valid = speed >= 0
+        cell, speed = cell[valid], speed[valid]
+        self.speed_count += np.bincount(cell, minlength=size)
+        self.speed_sum += np.bincount(cell, weights=speed, minlength=size)
+        self.speed_sq_sum += np.bincount(cell, weights=speed * speed, minlength=size)
+        self.stopped += np.bincount(cell[speed == 0], minlength=size)
+        self.slow += np.bincount(
+            cell[(speed > 0) & (speed <= SLOW_SPEED_KMH)], minlength=size
+        )
+
+    @property
+    def empty(self) -> bool:
+        return not self.observations.any()
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Células com observações no layout HEATMAP_COLUMNS (tipos compactos)
+
+        Returns:
+            DataFrame com uma linha por célula ocupada
+        """
+        cells = np.flatnonzero(self.observations)
+        count = self.speed_count[cells].astype('float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.speed_sum[cells] / count
+            variance = (
+                self.speed_sq_sum[cells] - self.speed_sum[cells] * mean
+            ) / (count - 1)
+            stopped_share = self.stopped[cells] / count
+            slow_share = self.slow[cells] / count
+
+        grid = self.grid
+        return pd.DataFrame({
+            'window_start': pd.Timestamp(self.window_start),
+            'cell_id': cells.astype('int32'),
+            'cell_row': grid.cell_row[cells].astype('int16'),
+            'cell_col': grid.cell_col[cells].astype('int16'),
+            'geohash': pd.Series(grid.geohash[cells], dtype='string'),
+            'center_latitude': grid.center_latitude[cells].astype('float32'),
+            'center_longitude': grid.center_longitude[cells].astype('float32'),
+            'observations': self.observations[cells].astype('int32'),
+            'speed_observations': self.speed_count[cells].astype('int32'),
+            'avg_speed_kmh': mean.astype('float32'),
+            # Desvio amostral; NaN com menos de 2 velocidades
+            'stddev_speed_kmh': np.where(
+                count > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan
+            ).astype('float32'),
+            'stopped_share': stopped_share.astype('float32'),
+            'slow_share': slow_share.astype('float32'),
+        }, columns=HEATMAP_COLUMNS)
+
+
+def write_heatmap(heatmap: pd.DataFrame, filepath: Path) -> Path:
+    """
+    Grava o mapa de calor de uma janela em Parquet de forma atômica
+
+    Args:
+        heatmap: DataFrame retornado por WindowHeatmap.to_frame
+        filepath: Caminho de destino
+
+    Returns:
+        Caminho gravado
+    """
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = filepath.with_name(filepath.name + '.tmp')
+    heatmap.to_parquet(tmp_path, index=False)
+    tmp_path.replace(filepath)
+    return filepath
+
+
+def heatmap_enabled() -> bool:
+    """Indica se o mapa de calor por janela está ativo (HEATMAP)"""
+    return os.getenv('HEATMAP', 'false').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,407 @@
+"""
+Instrumentação das tasks do pipeline BRT
+Mede tempo de parede, tempo de CPU, linhas, bytes e memória (RSS) de cada
+task e de cada execução de flow; grava os registros em JSON Lines e exporta
+contadores no formato texto do Prometheus (arquivo e endpoint HTTP opcional)
+"""
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+from datetime import datetime
+from loguru import logger
+import json
+import os
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Campos quantitativos que cada task pode informar (somados nos contadores)
+VOLUME_FIELDS = ['rows_in', 'rows_out', 'files', 'bytes_written', 'bytes_uploaded']
+
+
+def current_rss_bytes() -> int:
+    """
+    Memória residente atual do processo
+
+    Returns:
+        RSS em bytes (0 se indisponível na plataforma)
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def peak_rss_bytes() -> int:
+    """
+    Pico de memória residente do processo
+
+    Returns:
+        RSS máximo em bytes (0 se indisponível na plataforma)
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é KiB no Linux e bytes no macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _status_from_exception(exc: BaseException) -> str:
+    """
+    Status de uma task interrompida por exceção
+
+    Sinais do Prefect (SKIP, FAIL...) carregam o estado de destino; demais
+    exceções contam como falha.
+    """
+    state = getattr(exc, 'state', None)
+    if state is not None:
+        return type(state).__name__.lower()
+    return 'failed'
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class PipelineMetrics:
+    """Registros por task e por execução de flow, com exportação Prometheus"""
+
+    def __init__(self, metrics_dir: Optional[str] = None):
+        """
+        Inicializa o coletor
+
+        Args:
+            metrics_dir: Diretório dos arquivos de métricas
+                (padrão: METRICS_DIR)
+        """
+        self.metrics_dir = Path(
+            metrics_dir or os.getenv('METRICS_DIR', './data/metrics')
+        )
+        self.records_path = self.metrics_dir / 'pipeline_metrics.jsonl'
+        self.prometheus_path = self.metrics_dir / 'brt_pipeline.prom'
+
+        self._lock = threading.Lock()
+        # Execução de flow em andamento por thread (flows concorrentes)
+        self._local = threading.local()
+        # Contadores acumulados desde o início do processo
+        self.task_totals: Dict[str, dict] = {}
+        self.task_runs: Dict[tuple, int] = {}
+        self.flow_runs: Dict[tuple, int] = {}
+        self.flow_last: Dict[str, dict] = {}
+        self.server = None
+
+    # ==================== TASKS ====================
+
+    @contextmanager
+    def measure(self, task_name: str):
+        """
+        Mede um bloco de código como uma task
+
+        O dict retornado aceita os campos de VOLUME_FIELDS, preenchidos pela
+        própria task (ex.: record['rows_out'] = len(df)). O registro é gravado
+        também quando a task termina por exceção (SKIP ou falha).
+
+        Args:
+            task_name: Nome da task
+
+        Yields:
+            Dict do registro da task
+        """
+        record = {field: 0 for field in VOLUME_FIELDS}
+        start_wall = time.perf_counter()
+        # CPU da thread da task; o worker do warehouse e os executores do
+        # serviço de captura rodam em outras threads do mesmo processo
+        start_cpu = time.thread_time()
+        start_process_cpu = time.process_time()
+        rss_before = current_rss_bytes()
+        status = 'success'
+        try:
+            yield record
+        except BaseException as exc:
+            status = _status_from_exception(exc)
+            raise
+        finally:
+            rss_after = current_rss_bytes()
+            record.update({
+                'kind': 'task',
+                'task': task_name,
+                'status': status,
+                'timestamp': datetime.now().isoformat(),
+                'wall_seconds': round(time.perf_counter() - start_wall, 6),
+                'cpu_seconds': round(time.thread_time() - start_cpu, 6),
+                'process_cpu_seconds': round(
+                    time.process_time() - start_process_cpu, 6
+                ),
+                'rss_bytes': rss_after,
+                'rss_delta_bytes': rss_after - rss_before,
+                'peak_rss_bytes': peak_rss_bytes(),
+            })
+            self._add_task_record(record)
+
+    def _add_task_record(self, record: dict) -> None:
+        with self._lock:
+            name = record['task']
+            totals = self.task_totals.setdefault(name, {
+                'wall_seconds': 0.0,
+                'cpu_seconds': 0.0,
+                **{field: 0 for field in VOLUME_FIELDS},
+            })
+            totals['wall_seconds'] += record['wall_seconds']
+            totals['cpu_seconds'] += record['cpu_seconds']
+            for field in VOLUME_FIELDS:
+                totals[field] += record[field]
+            totals['last'] = record
+            key = (name, record['status'])
+            self.task_runs[key] = self.task_runs.get(key, 0) + 1
+
+            run = getattr(self._local, 'run', None)
+            if run is not None:
+                run['tasks'].append(record)
+
+        self._append_record(record)
+        self.write_prometheus()
+
+    # ==================== FLOW RUNS ====================
+
+    def start_run(self, flow_name: str) -> None:
+        """
+        Marca o início de uma execução de flow
+
+        Args:
+            flow_name: Nome do flow
+        """
+        self._local.run = {
+            'flow': flow_name,
+            'started_at': datetime.now().isoformat(),
+            'start_wall': time.perf_counter(),
+            'start_cpu': time.thread_time(),
+            'start_process_cpu': time.process_time(),
+            'tasks': [],
+        }
+
+    def finish_run(self, status: str) -> Optional[dict]:
+        """
+        Fecha a execução de flow em andamento e grava o resumo
+
+        Args:
+            status: Estado final do flow
+
+        Returns:
+            Registro da execução (None se nenhuma estava aberta)
+        """
+        run = getattr(self._local, 'run', None)
+        self._local.run = None
+        if run is None:
+            return None
+
+        tasks = run['tasks']
+        wall_seconds = time.perf_counter() - run['start_wall']
+        task_seconds: Dict[str, float] = {}
+        for task in tasks:
+            task_seconds[task['task']] = (
+                task_seconds.get(task['task'], 0.0) + task['wall_seconds']
+            )
+        record = {
+            'kind': 'flow',
+            'flow': run['flow'],
+            'status': status,
+            'timestamp': run['started_at'],
+            'wall_seconds': round(wall_seconds, 6),
+            'cpu_seconds': round(time.thread_time() - run['start_cpu'], 6),
+            'process_cpu_seconds': round(
+                time.process_time() - run['start_process_cpu'], 6
+            ),
+            'rss_bytes': current_rss_bytes(),
+            'peak_rss_bytes': peak_rss_bytes(),
+            **{field: sum(t[field] for t in tasks) for field in VOLUME_FIELDS},
+            # Segundos de parede de cada task e a fração (0-1) do flow
+            'task_wall_seconds': {
+                task: round(seconds, 6) for task, seconds in task_seconds.items()
+            },
+            'task_share': {
+                task: round(seconds / wall_seconds, 4) if wall_seconds else 0.0
+                for task, seconds in task_seconds.items()
+            },
+        }
+
+        with self._lock:
+            key = (record['flow'], status)
+            self.flow_runs[key] = self.flow_runs.get(key, 0) + 1
+            self.flow_last[record['flow']] = record
+
+        self._append_record(record)
+        self.write_prometheus()
+        logger.info(
+            f"Flow {record['flow']} ({status}): {record['wall_seconds']:.2f} s, "
+            f"CPU {record['cpu_seconds']:.2f} s, "
+            f"RSS {record['rss_bytes'] / 2**20:.0f} MB, "
+            f"fração por task {record['task_share']}"
+        )
+        return record
+
+    def flow_state_handler(self, flow, old_state, new_state):
+        """
+        State handler do Prefect para abrir e fechar a execução do flow
+
+        Uso: Flow(..., state_handlers=[metrics.flow_state_handler])
+        """
+        if new_state.is_running() and not old_state.is_running():
+            self.start_run(flow.name)
+        elif new_state.is_finished():
+            self.finish_run(type(new_state).__name__.lower())
+        return new_state
+
+    # ==================== EXPORTAÇÃO ====================
+
+    def _append_record(self, record: dict) -> None:
+        try:
+            self.metrics_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.records_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+        except OSError as e:
+            logger.warning(f"Falha ao gravar métricas em {self.records_path}: {e}")
+
+    def render_prometheus(self) -> str:
+        """
+        Métricas no formato texto de exposição do Prometheus
+
+        Returns:
+            Texto com HELP/TYPE e amostras
+        """
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(
+                    f'{k}="{_escape_label(v)}"' for k, v in labels.items()
+                )
+                if label_text:
+                    lines.append(f'{name}{{{label_text}}} {value}')
+                else:
+                    lines.append(f'{name} {value}')
+
+        with self._lock:
+            totals = dict(self.task_totals)
+            task_runs = dict(self.task_runs)
+            flow_runs = dict(self.flow_runs)
+            flow_last = dict(self.flow_last)
+
+        metric('brt_task_runs_total', 'counter', 'Execuções de task por status', [
+            ({'task': task, 'status': status}, count)
+            for (task, status), count in sorted(task_runs.items())
+        ])
+        for field, help_text in [
+            ('wall_seconds', 'Tempo de parede acumulado'),
+            ('cpu_seconds', 'Tempo de CPU acumulado da thread da task'),
+            ('rows_in', 'Linhas recebidas'),
+            ('rows_out', 'Linhas produzidas'),
+            ('files', 'Arquivos gravados ou enviados'),
+            ('bytes_written', 'Bytes gravados em disco'),
+            ('bytes_uploaded', 'Bytes enviados ao storage'),
+        ]:
+            metric(f'brt_task_{field}_total', 'counter', help_text, [
+                ({'task': task}, values[field])
+                for task, values in sorted(totals.items())
+            ])
+        metric('brt_task_last_wall_seconds', 'gauge',
+               'Tempo de parede da última execução', [
+                   ({'task': task}, values['last']['wall_seconds'])
+                   for task, values in sorted(totals.items())
+               ])
+        metric('brt_task_last_rss_bytes', 'gauge',
+               'RSS ao fim da última execução', [
+                   ({'task': task}, values['last']['rss_bytes'])
+                   for task, values in sorted(totals.items())
+               ])
+
+        metric('brt_flow_runs_total', 'counter', 'Execuções de flow por status', [
+            ({'flow': flow, 'status': status}, count)
+            for (flow, status), count in sorted(flow_runs.items())
+        ])
+        metric('brt_flow_last_wall_seconds', 'gauge',
+               'Tempo de parede da última execução do flow', [
+                   ({'flow': flow}, record['wall_seconds'])
+                   for flow, record in sorted(flow_last.items())
+               ])
+        metric('brt_flow_last_cpu_seconds', 'gauge',
+               'Tempo de CPU da thread na última execução do flow', [
+                   ({'flow': flow}, record['cpu_seconds'])
+                   for flow, record in sorted(flow_last.items())
+               ])
+
+        metric('brt_process_resident_memory_bytes', 'gauge',
+               'RSS atual do processo', [({}, current_rss_bytes())])
+        metric('brt_process_peak_resident_memory_bytes', 'gauge',
+               'Pico de RSS do processo', [({}, peak_rss_bytes())])
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self) -> None:
+        """Grava o arquivo .prom de forma atômica (textfile collector)"""
+        try:
+            self.metrics_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.prometheus_path.with_name(
+                self.prometheus_path.name + '.tmp'
+            )
+            tmp_path.write_text(self.render_prometheus(), encoding='utf-8')
+            tmp_path.replace(self.prometheus_path)
+        except OSError as e:
+            logger.warning(f"Falha ao gravar {self.prometheus_path}: {e}")
+
+    def serve(self, port: Optional[int] = None, host: str = '0.0.0.0'):
+        """
+        Expõe /metrics via HTTP em uma thread daemon
+
+        Args:
+            port: Porta (padrão: METRICS_PORT; 0 ou ausente desativa)
+            host: Endereço de escuta
+
+        Returns:
+            Servidor HTTP (None se desativado)
+        """
+        port = int(port if port is not None else os.getenv('METRICS_PORT', 0))
+        if not port or self.server is not None:
+            return self.server
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Métricas Prometheus em http://{host}:{port}/metrics")
+        return self.server
+
+
+# Coletor compartilhado pelas tasks do processo
+_metrics: PipelineMetrics = None
+
+
+def get_metrics() -> PipelineMetrics:
+    """Retorna o coletor compartilhado, criando-o na primeira chamada"""
+    global _metrics
+    if _metrics is None:
+        _metrics = PipelineMetrics()
+    return _metrics
@@ -0,0 +1,727 @@
+"""
+Map-matching dos veículos BRT à rede GTFS (shapes e paradas)
+Associa cada posição ao trecho de corredor e à parada mais próximos com um
+índice em grade construído uma vez, calculado de forma vetorizada por captura
+Arquitetura Medallion - Métricas de rede (velocidade por trecho e permanência)
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional
+from loguru import logger
+import io
+import os
+import time
+import zipfile
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Projeção equiretangular local (erro desprezível na escala do município)
+EARTH_RADIUS_M = 6371008.8
+REFERENCE_LATITUDE = -22.9
+
+# Penalidades (em metros) para candidatos de outra linha ou outro sentido:
+# corredores compartilhados empatam em distância e a linha decide
+LINE_MISMATCH_PENALTY_M = 1000.0
+DIRECTION_MISMATCH_PENALTY_M = 100.0
+
+# Sentido da API -> direction_id do GTFS
+DIRECTION_IDS = {'ida': 0, 'volta': 1}
+
+MATCH_COLUMNS = [
+    'shape_id',
+    'shape_line',
+    'segment_index',
+    'distance_to_shape_m',
+    'shape_progress_m',
+    'stop_id',
+    'distance_to_stop_m',
+    'at_stop',
+    'dwell_seconds',
+]
+
+
+def project(latitude, longitude) -> tuple:
+    """
+    Converte coordenadas em graus para metros no plano local
+
+    Args:
+        latitude: Latitudes em graus
+        longitude: Longitudes em graus
+
+    Returns:
+        Tuple (x, y) em metros
+    """
+    scale = np.pi / 180.0 * EARTH_RADIUS_M
+    x = np.asarray(longitude, dtype='float64') * scale * np.cos(
+        np.radians(REFERENCE_LATITUDE)
+    )
+    y = np.asarray(latitude, dtype='float64') * scale
+    return x, y
+
+
+class GridIndex:
+    """
+    Índice espacial em grade regular com candidatos em formato CSR
+
+    Cada item (segmento ou ponto) é registrado em todas as células que o seu
+    retângulo envolvente toca. Consultas olham a célula do ponto e as 8
+    vizinhas, então qualquer item a até cell_size metros é encontrado.
+    """
+
+    def __init__(
+        self,
+        xmin: np.ndarray,
+        ymin: np.ndarray,
+        xmax: np.ndarray,
+        ymax: np.ndarray,
+        cell_size: float
+    ):
+        """
+        Constrói o índice
+
+        Args:
+            xmin, ymin, xmax, ymax: Retângulo envolvente de cada item (metros)
+            cell_size: Lado da célula em metros
+        """
+        self.cell_size = float(cell_size)
+        self.x0 = float(xmin.min()) - self.cell_size
+        self.y0 = float(ymin.min()) - self.cell_size
+        self.nx = int((xmax.max() - self.x0) // self.cell_size) + 2
+        self.ny = int((ymax.max() - self.y0) // self.cell_size) + 2
+
+        ix0, iy0 = self._cell_xy(xmin, ymin)
+        ix1, iy1 = self._cell_xy(xmax, ymax)
+        span_x = ix1 - ix0 + 1
+        span_y = iy1 - iy0 + 1
+        per_item = span_x * span_y
+
+        # Expande cada item em (item, célula) sem laço em Python
+        item = np.repeat(np.arange(len(xmin)), per_item)
+        offset = _group_offsets(per_item)
+        cell_x = np.repeat(ix0, per_item) + offset % np.repeat(span_x, per_item)
+        cell_y = np.repeat(iy0, per_item) + offset // np.repeat(span_x, per_item)
+        cell = cell_y * self.nx + cell_x
+
+        order = np.argsort(cell, kind='stable')
+        cell = cell[order]
+        # Itens agrupados por célula; cada célula ocupada é uma fatia
+        # [starts[i], starts[i] + counts[i]) de items
+        self.items = item[order]
+        occupied, starts, counts = np.unique(
+            cell, return_index=True, return_counts=True
+        )
+        self.starts = starts.astype('int64')
+        self.counts = counts.astype('int64')
+
+        # Fatia de cada célula da grade (-1 = célula vazia)
+        self.rows = np.full(self.nx * self.ny, -1, dtype='int64')
+        self.rows[occupied] = np.arange(len(occupied))
+
+    def _cell_xy(self, x, y) -> tuple:
+        ix = np.floor((np.asarray(x) - self.x0) / self.cell_size).astype('int64')
+        iy = np.floor((np.asarray(y) - self.y0) / self.cell_size).astype('int64')
+        return ix, iy
+
+    def query(self, x: np.ndarray, y: np.ndarray) -> tuple:
+        """
+        Candidatos da vizinhança 3x3 de cada ponto
+
+        Só os pares existentes são materializados: a memória é proporcional
+        ao número de candidatos, não a n vezes a célula mais cheia.
+
+        Args:
+            x, y: Coordenadas projetadas dos pontos
+
+        Returns:
+            Tuple (point, item) de arrays paralelos, agrupados por ponto na
+            ordem das células e dos itens
+        """
+        ix, iy = self._cell_xy(x, y)
+        dx, dy = np.meshgrid([-1, 0, 1], [-1, 0, 1])
+        nx_ = ix[:, None] + dx.ravel()
+        ny_ = iy[:, None] + dy.ravel()
+        inside = (nx_ >= 0) & (nx_ < self.nx) & (ny_ >= 0) & (ny_ < self.ny)
+        cells = np.where(inside, ny_ * self.nx + nx_, 0)
+        rows = np.where(inside, self.rows[cells], -1).ravel()
+
+        point = np.repeat(np.arange(len(ix)), 9)
+        occupied = rows >= 0
+        point, rows = point[occupied], rows[occupied]
+
+        counts = self.counts[rows]
+        position = np.repeat(self.starts[rows], counts) + _group_offsets(counts)
+        return np.repeat(point, counts), self.items[position]
+
+
+def _group_offsets(counts: np.ndarray) -> np.ndarray:
+    """Posição de cada elemento dentro do seu grupo (0..count-1)"""
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def _best_per_point(point: np.ndarray, score: np.ndarray, n: int) -> np.ndarray:
+    """
+    Par de menor score de cada ponto
+
+    Empates ficam com o primeiro par na ordem de query, como np.argmin.
+
+    Returns:
+        Array (n,) de índices em point/score (-1 = ponto sem candidato)
+    """
+    best = np.full(n, -1, dtype='int64')
+    if len(point) == 0:
+        return best
+    order = np.lexsort((score, point))
+    first = np.flatnonzero(np.r_[True, point[order][1:] != point[order][:-1]])
+    best[point[order][first]] = order[first]
+    return best
+
+
+def _read_gtfs_table(path: Path, name: str, usecols=None) -> Optional[pd.DataFrame]:
+    """Lê um arquivo do GTFS em diretório ou .zip (None se ausente)"""
+    if path.suffix == '.zip':
+        with zipfile.ZipFile(path) as archive:
+            if name not in archive.namelist():
+                return None
+            data = archive.read(name)
+        source = io.BytesIO(data)
+    else:
+        source = path / name
+        if not source.exists():
+            return None
+    return pd.read_csv(
+        source,
+        usecols=lambda c: usecols is None or c in usecols,
+        dtype=str,
+        encoding='utf-8-sig'
+    )
+
+
+class MapMatcher:
+    """Associa posições GPS aos shapes e paradas do GTFS"""
+
+    def __init__(
+        self,
+        gtfs_path: Optional[str] = None,
+        cell_size_m: Optional[float] = None,
+        max_distance_m: Optional[float] = None,
+        stop_radius_m: Optional[float] = None,
+        segment_length_m: Optional[float] = None
+    ):
+        """
+        Carrega o GTFS e constrói os índices espaciais
+
+        Args:
+            gtfs_path: Diretório ou .zip do GTFS (padrão: GTFS_PATH)
+            cell_size_m: Lado da célula da grade (padrão: MAP_MATCH_CELL_M)
+            max_distance_m: Distância máxima até o shape para considerar
+                o ponto no corredor (padrão: MAP_MATCH_MAX_DISTANCE_M)
+            stop_radius_m: Raio para considerar o veículo na parada
+                (padrão: MAP_MATCH_STOP_RADIUS_M)
+            segment_length_m: Comprimento dos trechos de velocidade ao longo
+                do shape (padrão: MAP_MATCH_SEGMENT_M)
+        """
+        self.gtfs_path = Path(gtfs_path or os.getenv('GTFS_PATH', './data/gtfs'))
+        self.max_distance = float(
+            max_distance_m if max_distance_m is not None
+            else os.getenv('MAP_MATCH_MAX_DISTANCE_M', 150)
+        )
+        self.stop_radius = float(
+            stop_radius_m if stop_radius_m is not None
+            else os.getenv('MAP_MATCH_STOP_RADIUS_M', 40)
+        )
+        self.segment_length = float(
+            segment_length_m if segment_length_m is not None
+            else os.getenv('MAP_MATCH_SEGMENT_M', 500)
+        )
+        # A vizinhança 3x3 cobre ao menos uma célula de raio
+        self.cell_size = max(
+            float(
+                cell_size_m if cell_size_m is not None
+                else os.getenv('MAP_MATCH_CELL_M', 200)
+            ),
+            self.max_distance,
+            self.stop_radius
+        )
+
+        start = time.perf_counter()
+        self._load_shapes()
+        self._load_stops()
+        logger.info(
+            f"Rede GTFS carregada: {len(self.shape_ids)} shapes, "
+            f"{len(self.seg_x0)} segmentos, {len(self.stop_ids)} paradas "
+            f"em {time.perf_counter() - start:.2f}s"
+        )
+
+        # Estado de permanência por veículo (parada atual e chegada em ms)
+        self.dwell_state = pd.DataFrame(
+            {'stop_id': pd.Series(dtype='int64'),
+             'arrival_ms': pd.Series(dtype='float64')},
+            index=pd.Index([], dtype='string', name='vehicle_id')
+        )
+        self.last_duration = 0.0
+
+    def _load_shapes(self) -> None:
+        """Segmentos consecutivos de cada shape, com linha e sentido"""
+        shapes = _read_gtfs_table(
+            self.gtfs_path, 'shapes.txt',
+            ['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence']
+        )
+        if shapes is None or shapes.empty:
+            raise FileNotFoundError(f"shapes.txt não encontrado em {self.gtfs_path}")
+
+        shapes['shape_pt_sequence'] = pd.to_numeric(shapes['shape_pt_sequence'])
+        shapes = shapes.sort_values(['shape_id', 'shape_pt_sequence'], kind='stable')
+        shape_codes, self.shape_ids = pd.factorize(shapes['shape_id'], sort=True)
+        x, y = project(
+            pd.to_numeric(shapes['shape_pt_lat']).to_numpy(),
+            pd.to_numeric(shapes['shape_pt_lon']).to_numpy()
+        )
+
+        # Segmento i liga o ponto i ao i+1 do mesmo shape
+        same_shape = shape_codes[1:] == shape_codes[:-1]
+        self.seg_shape = shape_codes[:-1][same_shape]
+        self.seg_x0, self.seg_y0 = x[:-1][same_shape], y[:-1][same_shape]
+        self.seg_x1, self.seg_y1 = x[1:][same_shape], y[1:][same_shape]
+        self.seg_length = np.hypot(
+            self.seg_x1 - self.seg_x0, self.seg_y1 - self.seg_y0
+        )
+
+        # Distância acumulada no início de cada segmento, por shape
+        cumulative = np.cumsum(self.seg_length) - self.seg_length
+        first = np.r_[True, self.seg_shape[1:] != self.seg_shape[:-1]]
+        shape_start = np.maximum.accumulate(
+            np.where(first, np.arange(len(first)), 0)
+        )
+        self.seg_offset = cumulative - cumulative[shape_start]
+        self.seg_ordinal = np.arange(len(first)) - shape_start
+
+        # Linha (route_short_name) e direction_id de cada shape
+        self.shape_line = np.full(len(self.shape_ids), '', dtype=object)
+        self.shape_direction = np.full(len(self.shape_ids), -1, dtype='int64')
+        trips = _read_gtfs_table(
+            self.gtfs_path, 'trips.txt', ['route_id', 'shape_id', 'direction_id']
+        )
+        routes = _read_gtfs_table(
+            self.gtfs_path, 'routes.txt', ['route_id', 'route_short_name']
+        )
+        if trips is not None and routes is not None:
+            trips = trips.dropna(subset=['shape_id']).merge(routes, on='route_id')
+            trips = trips.drop_duplicates('shape_id')
+            codes = self.shape_ids.get_indexer(trips['shape_id'])
+            known = codes >= 0
+            self.shape_line[codes[known]] = (
+                trips['route_short_name'].fillna('').to_numpy()[known]
+            )
+            if 'direction_id' in trips:
+                self.shape_direction[codes[known]] = pd.to_numeric(
+                    trips['direction_id'], errors='coerce'
+                ).fillna(-1).astype('int64').to_numpy()[known]
+
+        self.segment_index = GridIndex(
+            np.minimum(self.seg_x0, self.seg_x1),
+            np.minimum(self.seg_y0, self.seg_y1),
+            np.maximum(self.seg_x0, self.seg_x1),
+            np.maximum(self.seg_y0, self.seg_y1),
+            self.cell_size
+        )
+
+    def _load_stops(self) -> None:
+        """Paradas do GTFS indexadas por ponto"""
+        stops = _read_gtfs_table(
+            self.gtfs_path, 'stops.txt',
+            ['stop_id', 'stop_name', 'stop_lat', 'stop_lon']
+        )
+        if stops is None or stops.empty:
+            self.stop_ids = pd.Index([], dtype=object)
+            self.stop_names = np.array([], dtype=object)
+            self.stop_index = None
+            return
+
+        stops = stops.dropna(subset=['stop_lat', 'stop_lon'])
+        self.stop_ids = pd.Index(stops['stop_id'])
+        self.stop_names = stops.get(
+            'stop_name', pd.Series('', index=stops.index)
+        ).fillna('').to_numpy()
+        self.stop_x, self.stop_y = project(
+            pd.to_numeric(stops['stop_lat']).to_numpy(),
+            pd.to_numeric(stops['stop_lon']).to_numpy()
+        )
+        self.stop_index = GridIndex(
+            self.stop_x, self.stop_y, self.stop_x, self.stop_y, self.cell_size
+        )
+
+    def _match_segments(self, x, y, line, direction) -> tuple:
+        """Segmento mais próximo de cada ponto, priorizando a linha do veículo"""
+        point, seg = self.segment_index.query(x, y)
+        px, py = x[point], y[point]
+
+        # Projeção do ponto no segmento (t limitado a [0, 1])
+        dx = self.seg_x1[seg] - self.seg_x0[seg]
+        dy = self.seg_y1[seg] - self.seg_y0[seg]
+        length2 = dx * dx + dy * dy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = ((px - self.seg_x0[seg]) * dx + (py - self.seg_y0[seg]) * dy) / length2
+        t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+        distance = np.hypot(
+            self.seg_x0[seg] + t * dx - px,
+            self.seg_y0[seg] + t * dy - py
+        )
+
+        near = distance <= self.max_distance
+        point, seg, t, distance = point[near], seg[near], t[near], distance[near]
+        shape = self.seg_shape[seg]
+        score = (
+            distance
+            + LINE_MISMATCH_PENALTY_M * (self.shape_line[shape] != line[point])
+            + DIRECTION_MISMATCH_PENALTY_M * (
+                (direction[point] >= 0)
+                & (self.shape_direction[shape] != direction[point])
+            )
+        )
+
+        if not len(point):
+            return np.full(len(x), -1), np.full(len(x), np.nan), np.zeros(len(x))
+        best = _best_per_point(point, score, len(x))
+        matched = best >= 0
+        pick = np.maximum(best, 0)
+        return (
+            np.where(matched, seg[pick], -1),
+            np.where(matched, distance[pick], np.nan),
+            np.where(matched, t[pick], 0.0),
+        )
+
+    def _match_stops(self, x, y) -> tuple:
+        """Parada mais próxima dentro de stop_radius de cada ponto"""
+        if self.stop_index is None:
+            return np.full(len(x), -1), np.full(len(x), np.nan)
+
+        point, stop = self.stop_index.query(x, y)
+        distance = np.hypot(self.stop_x[stop] - x[point], self.stop_y[stop] - y[point])
+        near = distance <= self.stop_radius
+        point, stop, distance = point[near], stop[near], distance[near]
+
+        if not len(point):
+            return np.full(len(x), -1), np.full(len(x), np.nan)
+        best = _best_per_point(point, distance, len(x))
+        found = best >= 0
+        pick = np.maximum(best, 0)
+        return (
+            np.where(found, stop[pick], -1),
+            np.where(found, distance[pick], np.nan),
+        )
+
+    def _update_dwell(self, df: pd.DataFrame, stop: np.ndarray) -> np.ndarray:
+        """
+        Atualiza o estado de permanência e retorna os segundos na parada
+
+        A chegada é o primeiro timestamp_gps (ou capture_timestamp) em que o
+        veículo aparece na parada; sair dela zera o estado do veículo.
+        """
+        event_ms = df['timestamp_gps'].astype('float64').to_numpy()
+        capture_ms = (
+            pd.to_datetime(df['capture_timestamp']).astype('int64').to_numpy()
+            // 1_000_000
+        ).astype('float64')
+        event_ms = np.where(np.isnan(event_ms), capture_ms, event_ms)
+
+        vehicle = df['vehicle_id'].astype('string')
+        previous = self.dwell_state.reindex(vehicle)
+        at_stop = stop >= 0
+        same = at_stop & (previous['stop_id'].to_numpy() == stop)
+        arrival = np.where(
+            same, previous['arrival_ms'].to_numpy(),
+            np.where(at_stop, event_ms, np.nan)
+        )
+        dwell = np.where(at_stop, np.maximum(event_ms - arrival, 0) / 1000.0, np.nan)
+
+        # Veículos ausentes desta captura mantêm o estado anterior
+        current = pd.DataFrame(
+            {'stop_id': stop, 'arrival_ms': arrival},
+            index=pd.Index(vehicle, name='vehicle_id')
+        )
+        current = current[~current.index.duplicated(keep='last')]
+        kept = self.dwell_state.drop(current.index, errors='ignore')
+        self.dwell_state = pd.concat([kept, current[current['stop_id'] >= 0]])
+        return dwell
+
+    def match(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Associa cada registro da captura ao shape e à parada mais próximos
+
+        Args:
+            df: DataFrame produzido por BRTAPICapture.process_raw_data
+
+        Returns:
+            DataFrame com as colunas de df e MATCH_COLUMNS
+        """
+        start = time.perf_counter()
+        df = df.reset_index(drop=True)
+        x, y = project(
+            df['latitude'].astype('float64').to_numpy(na_value=np.nan),
+            df['longitude'].astype('float64').to_numpy(na_value=np.nan)
+        )
+        valid = np.isfinite(x) & np.isfinite(y)
+        x, y = np.where(valid, x, 0.0), np.where(valid, y, 0.0)
+
+        line = df['line'].astype('string').fillna('').to_numpy(dtype=object)
+        direction = (
+            df['sentido'].astype('string').str.lower().map(DIRECTION_IDS)
+            .fillna(-1).astype('int64').to_numpy()
+        )
+
+        seg, seg_distance, t = self._match_segments(x, y, line, direction)
+        stop, stop_distance = self._match_stops(x, y)
+        seg = np.where(valid, seg, -1)
+        stop = np.where(valid, stop, -1)
+
+        matched = seg >= 0
+        safe_seg = np.maximum(seg, 0)
+        shape = np.where(matched, self.seg_shape[safe_seg], -1)
+        progress = self.seg_offset[safe_seg] + t * self.seg_length[safe_seg]
+
+        # O último elemento (None) atende os índices -1 (sem correspondência)
+        shape_ids = np.append(np.asarray(self.shape_ids, dtype=object), None)
+        shape_lines = np.append(self.shape_line, None)
+        stop_ids = np.append(np.asarray(self.stop_ids, dtype=object), None)
+
+        result = df.assign(
+            shape_id=pd.Series(shape_ids[shape], dtype='string'),
+            shape_line=pd.Series(shape_lines[shape], dtype='string'),
+            segment_index=pd.Series(
+                np.where(matched, progress // self.segment_length, np.nan)
+            ).astype('Int64'),
+            distance_to_shape_m=np.where(matched, seg_distance, np.nan),
+            shape_progress_m=np.where(matched, progress, np.nan),
+            stop_id=pd.Series(stop_ids[stop], dtype='string'),
+            distance_to_stop_m=np.where(stop >= 0, stop_distance, np.nan),
+            at_stop=stop >= 0,
+            dwell_seconds=self._update_dwell(df, stop),
+        )
+
+        self.last_duration = time.perf_counter() - start
+        logger.info(
+            f"Map-matching: {int(matched.sum())}/{len(df)} no corredor, "
+            f"{int((stop >= 0).sum())} em paradas "
+            f"({self.last_duration * 1000:.1f} ms)"
+        )
+        return result
+
+    def summarize(self, matched: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """
+        Resumo de rede de uma captura
+
+        Args:
+            matched: DataFrame retornado por match
+
+        Returns:
+            Dict com 'segments' (velocidade por trecho de segment_length
+            metros de cada shape) e 'stops' (veículos e permanência por parada);
+            speed_count e dwell_count permitem combinar capturas em
+            WindowNetwork
+        """
+        capture_timestamp = (
+            matched['capture_timestamp'].max() if not matched.empty else pd.NaT
+        )
+
+        on_shape = matched[matched['shape_id'].notna()]
+        segments = (
+            on_shape.groupby(['shape_id', 'shape_line', 'segment_index'], sort=True)
+            .agg(
+                vehicles=('vehicle_id', 'nunique'),
+                speed_count=('speed', 'count'),
+                avg_speed_kmh=('speed', 'mean'),
+                min_speed_kmh=('speed', 'min'),
+                max_speed_kmh=('speed', 'max'),
+            )
+            .reset_index()
+        )
+        segments['segment_start_m'] = (
+            segments['segment_index'].astype('float64') * self.segment_length
+        )
+        segments['capture_timestamp'] = capture_timestamp
+
+        at_stop = matched[matched['at_stop']]
+        stops = (
+            at_stop.groupby('stop_id', sort=True)
+            .agg(
+                vehicles=('vehicle_id', 'nunique'),
+                dwell_count=('dwell_seconds', 'count'),
+                avg_dwell_seconds=('dwell_seconds', 'mean'),
+                max_dwell_seconds=('dwell_seconds', 'max'),
+            )
+            .reset_index()
+        )
+        names = pd.Series(self.stop_names, index=self.stop_ids)
+        stops.insert(1, 'stop_name', stops['stop_id'].map(names).astype('string'))
+        stops['capture_timestamp'] = capture_timestamp
+
+        return {'segments': segments, 'stops': stops}
+
+    def process(self, df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        """
+        Executa match e resumo de uma captura
+        
+        O resumo não é gravado aqui: o agregador o acumula na janela da
+        captura e grava uma vez por janela fechada (WindowNetwork).
+
+        Args:
+            df: DataFrame produzido por BRTAPICapture.process_raw_data
+
+        Returns:
+            Dict com 'matched', 'segments' e 'stops'
+        """
+        matched = self.match(df)
+        return {'matched': matched, **self.summarize(matched)}
+
+
+class WindowNetwork:
+    """
+    Resumos de rede das capturas de uma janela
+
+    Cada captura contribui com o resumo já calculado por MapMatcher.summarize
+    (uma linha por trecho ou parada ocupada); os resumos são combinados uma
+    única vez, quando a janela fecha.
+    """
+
+    SEGMENT_KEYS = ['shape_id', 'shape_line', 'segment_index', 'segment_start_m']
+
+    def __init__(self, window_start: pd.Timestamp):
+        """
+        Inicializa a janela sem capturas
+
+        Args:
+            window_start: Início da janela
+        """
+        self.window_start = window_start
+        self.captures = 0
+        self.summaries: Dict[str, List[pd.DataFrame]] = {
+            'segments': [],
+            'stops': [],
+        }
+
+    def add(self, summary: Dict[str, pd.DataFrame]) -> None:
+        """
+        Acrescenta o resumo de uma captura
+
+        Args:
+            summary: Dict retornado por MapMatcher.summarize (ou process)
+        """
+        self.captures += 1
+        for name, frames in self.summaries.items():
+            table = summary.get(name)
+            if table is not None and not table.empty:
+                frames.append(table)
+
+    @property
+    def empty(self) -> bool:
+        return not any(self.summaries.values())
+
+    def to_frames(self) -> Dict[str, pd.DataFrame]:
+        """
+        Combina os resumos das capturas da janela
+
+        Returns:
+            Dict com 'segments' e 'stops': capturas em que o trecho ou a
+            parada estava ocupado, média e máximo de veículos por captura,
+            médias ponderadas pelas observações de cada captura e extremos
+        """
+        frames = {}
+        segments = self.summaries['segments']
+        if segments:
+            combined = pd.concat(segments, ignore_index=True)
+            combined['speed_sum'] = (
+                combined['avg_speed_kmh'].fillna(0.0) * combined['speed_count']
+            )
+            result = (
+                combined.groupby(self.SEGMENT_KEYS, sort=True)
+                .agg(
+                    captures=('vehicles', 'size'),
+                    avg_vehicles=('vehicles', 'mean'),
+                    max_vehicles=('vehicles', 'max'),
+                    speed_count=('speed_count', 'sum'),
+                    speed_sum=('speed_sum', 'sum'),
+                    min_speed_kmh=('min_speed_kmh', 'min'),
+                    max_speed_kmh=('max_speed_kmh', 'max'),
+                )
+                .reset_index()
+            )
+            result.insert(
+                len(result.columns) - 2,
+                'avg_speed_kmh',
+                result['speed_sum'] / result['speed_count'].where(
+                    result['speed_count'] > 0
+                )
+            )
+            frames['segments'] = self._finish(result.drop(columns='speed_sum'))
+
+        stops = self.summaries['stops']
+        if stops:
+            combined = pd.concat(stops, ignore_index=True)
+            combined['dwell_sum'] = (
+                combined['avg_dwell_seconds'].fillna(0.0) * combined['dwell_count']
+            )
+            result = (
+                combined.groupby(['stop_id', 'stop_name'], sort=True, dropna=False)
+                .agg(
+                    captures=('vehicles', 'size'),
+                    avg_vehicles=('vehicles', 'mean'),
+                    max_vehicles=('vehicles', 'max'),
+                    dwell_count=('dwell_count', 'sum'),
+                    dwell_sum=('dwell_sum', 'sum'),
+                    max_dwell_seconds=('max_dwell_seconds', 'max'),
+                )
+                .reset_index()
+            )
+            result.insert(
+                len(result.columns) - 1,
+                'avg_dwell_seconds',
+                result['dwell_sum'] / result['dwell_count'].where(
+                    result['dwell_count'] > 0
+                )
+            )
+            frames['stops'] = self._finish(result.drop(columns='dwell_sum'))
+        return frames
+
+    def _finish(self, table: pd.DataFrame) -> pd.DataFrame:
+        """Acrescenta window_start e o total de capturas da janela"""
+        table.insert(0, 'window_start', self.window_start)
+        table['window_captures'] = self.captures
+        return table
+
+
+def write_network(table: pd.DataFrame, filepath: Path) -> Path:
+    """
+    Grava um resumo de rede de uma janela em Parquet de forma atômica
+
+    Args:
+        table: DataFrame retornado por WindowNetwork.to_frames
+        filepath: Caminho de destino
+
+    Returns:
+        Caminho gravado
+    """
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = filepath.with_name(filepath.name + '.tmp')
+    table.to_parquet(tmp_path, index=False)
+    tmp_path.replace(filepath)
+    return filepath
+
+
+def create_map_matcher() -> Optional[MapMatcher]:
+    """
+    Cria o MapMatcher se MAP_MATCHING estiver ativo e o GTFS existir
+
+    Returns:
+        MapMatcher ou None
+    """
+    if os.getenv('MAP_MATCHING', 'false').lower() != 'true':
+        return None
+    try:
+        return MapMatcher()
+    except FileNotFoundError as e:
+        logger.warning(f"Map-matching desativado: {e}")
+        return None
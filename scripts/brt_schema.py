@@ -0,0 +1,147 @@
+"""
+Schema dos registros de captura BRT
+Define colunas e tipos explícitos usados na gravação dos arquivos
+Arquitetura Medallion - Contrato entre Bronze e Silver
+"""
+
+from typing import Dict, List
+import pandas as pd
+
+
+# Ordem das colunas produzidas por BRTAPICapture.process_raw_data
+CAPTURE_COLUMNS: List[str] = [
+    'capture_timestamp',
+    'vehicle_id',
+    'line',
+    'latitude',
+    'longitude',
+    'speed',
+    'timestamp_gps',
+    'placa',
+    'sentido',
+    'trajeto',
+    'raw_data',
+]
+
+# Textos que se repetem entre veículos de uma captura (poucos valores
+# distintos): categóricos em memória e dicionários Arrow no buffer
+CATEGORICAL_COLUMNS: List[str] = ['line', 'sentido', 'trajeto']
+
+# Tipos pandas de cada coluna em memória (nullable para tolerar campos
+# ausentes na API). Os demais textos ficam em buffers Arrow contíguos, sem
+# um objeto Python por valor; capture_timestamp é datetime64 (epoch int64)
+CAPTURE_DTYPES: Dict[str, str] = {
+    'vehicle_id': 'string[pyarrow]',
+    'line': 'category',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'speed': 'float64',
+    'timestamp_gps': 'Int64',
+    'placa': 'string[pyarrow]',
+    'sentido': 'category',
+    'trajeto': 'category',
+    'raw_data': 'string[pyarrow]',
+}
+
+
+def conform_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ajusta DataFrame de captura ao schema declarado
+
+    Colunas ausentes são criadas vazias e colunas extras são descartadas,
+    garantindo que todas as capturas tenham o mesmo layout.
+
+    Args:
+        df: DataFrame com dados capturados
+
+    Returns:
+        DataFrame com colunas e tipos do schema
+    """
+    conformed = df.reindex(columns=CAPTURE_COLUMNS)
+    conformed['capture_timestamp'] = pd.to_datetime(
+        conformed['capture_timestamp']
+    )
+    for column, dtype in CAPTURE_DTYPES.items():
+        if dtype.startswith(('float', 'Int')):
+            conformed[column] = pd.to_numeric(
+                conformed[column], errors='coerce'
+            )
+        conformed[column] = conformed[column].astype(dtype)
+    return conformed
+
+
+def arrow_schema():
+    """
+    Retorna schema pyarrow equivalente ao schema de captura
+
+    Returns:
+        pyarrow.Schema com tipos explícitos de cada coluna
+    """
+    import pyarrow as pa
+
+    return pa.schema([
+        pa.field('capture_timestamp', pa.timestamp('us')),
+        pa.field('vehicle_id', pa.string()),
+        pa.field('line', pa.string()),
+        pa.field('latitude', pa.float64()),
+        pa.field('longitude', pa.float64()),
+        pa.field('speed', pa.float64()),
+        pa.field('timestamp_gps', pa.int64()),
+        pa.field('placa', pa.string()),
+        pa.field('sentido', pa.string()),
+        pa.field('trajeto', pa.string()),
+        pa.field('raw_data', pa.string()),
+    ])
+
+
+def buffer_arrow_schema():
+    """
+    Schema dos segmentos do buffer: como arrow_schema, mas com
+    CATEGORICAL_COLUMNS codificadas em dicionário
+
+    Returns:
+        pyarrow.Schema compacto
+    """
+    import pyarrow as pa
+
+    return pa.schema([
+        pa.field(field.name, pa.dictionary(pa.int32(), pa.string()))
+        if field.name in CATEGORICAL_COLUMNS else field
+        for field in arrow_schema()
+    ])
+
+
+def to_arrow_table(df: pd.DataFrame, schema=None):
+    """
+    Converte DataFrame de captura em tabela pyarrow tipada
+
+    Args:
+        df: DataFrame com dados capturados
+        schema: Schema de destino (padrão: arrow_schema)
+
+    Returns:
+        pyarrow.Table com o schema de captura
+    """
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(
+        conform_dataframe(df),
+        schema=schema if schema is not None else arrow_schema(),
+        preserve_index=False
+    )
+
+
+def expand_arrow_table(table):
+    """
+    Converte uma tabela do buffer para arrow_schema (decodifica dicionários)
+
+    Args:
+        table: pyarrow.Table no schema do buffer ou de captura
+
+    Returns:
+        pyarrow.Table com arrow_schema
+    """
+    schema = arrow_schema()
+    if table.schema.remove_metadata().equals(schema):
+        return table
+    return table.cast(schema)
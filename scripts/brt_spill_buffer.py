@@ -0,0 +1,239 @@
+"""
+Buffer de agregação em disco para dados BRT
+Grava cada captura em um segmento Arrow IPC assim que chega
+Os segmentos sobrevivem a reinícios do agent e são reaproveitados
+Arquitetura Medallion - Staging local da camada Bronze
+"""
+
+from pathlib import Path
+from typing import Iterator, List
+from loguru import logger
+import os
+import pandas as pd
+
+from brt_schema import (
+    arrow_schema,
+    buffer_arrow_schema,
+    expand_arrow_table,
+    to_arrow_table,
+)
+from brt_state_files import fsync_dir, read_json, write_json_atomic
+
+
+class SpillBuffer:
+    """Buffer que mantém as capturas em segmentos Arrow IPC no disco"""
+
+    SEGMENT_PREFIX = 'capture_'
+    SEGMENT_SUFFIX = '.arrow'
+    STATE_FILENAME = 'state.json'
+
+    def __init__(self, buffer_dir: Path):
+        """
+        Inicializa o buffer em disco e recupera segmentos existentes
+
+        Args:
+            buffer_dir: Diretório onde os segmentos são gravados
+        """
+        self.buffer_dir = Path(buffer_dir)
+        self.buffer_dir.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.buffer_dir / self.STATE_FILENAME
+        self.rows_count = 0
+        self.recover()
+
+    def _read_segment(self, segment_path: Path):
+        """
+        Lê um segmento completo via memory map
+
+        Args:
+            segment_path: Caminho do segmento
+
+        Returns:
+            pyarrow.Table com os dados do segmento (schema de captura)
+        """
+        import pyarrow as pa
+
+        with pa.memory_map(str(segment_path), 'r') as source:
+            return expand_arrow_table(pa.ipc.open_file(source).read_all())
+
+    def recover(self) -> int:
+        """
+        Recupera segmentos gravados antes de um reinício
+
+        Arquivos temporários de gravações interrompidas são descartados e
+        segmentos ilegíveis são movidos para a pasta 'corrupted'. O custo é
+        proporcional apenas ao tamanho do buffer atual.
+
+        Returns:
+            Quantidade de capturas recuperadas
+        """
+        for tmp_path in self.buffer_dir.glob('*.tmp'):
+            logger.warning(f"Descartando gravação interrompida: {tmp_path.name}")
+            tmp_path.unlink()
+
+        rows = 0
+        recovered = 0
+        for segment_path in self.segments():
+            try:
+                rows += self._read_segment(segment_path).num_rows
+                recovered += 1
+            except Exception as e:
+                corrupted_dir = self.buffer_dir / 'corrupted'
+                corrupted_dir.mkdir(exist_ok=True)
+                segment_path.replace(corrupted_dir / segment_path.name)
+                logger.error(f"Segmento ilegível {segment_path.name}: {e}")
+
+        self.rows_count = rows
+        if recovered:
+            logger.info(
+                f"Buffer recuperado do disco: {recovered} capturas "
+                f"({rows} registros)"
+            )
+        return recovered
+
+    def load_state(self) -> dict:
+        """
+        Lê metadados persistidos do buffer
+
+        Returns:
+            Dict com o estado salvo (vazio se não existir)
+        """
+        return read_json(self.state_path)
+
+    def save_state(self, state: dict) -> None:
+        """
+        Persiste metadados do buffer de forma atômica
+
+        Args:
+            state: Dict serializável em JSON
+        """
+        write_json_atomic(self.state_path, state)
+
+    def segments(self) -> List[Path]:
+        """
+        Lista segmentos gravados, em ordem de chegada
+
+        Returns:
+            Lista de caminhos dos segmentos
+        """
+        return sorted(
+            self.buffer_dir.glob(f"{self.SEGMENT_PREFIX}*{self.SEGMENT_SUFFIX}")
+        )
+
+    @property
+    def captures_count(self) -> int:
+        """Quantidade de capturas armazenadas no buffer"""
+        return len(self.segments())
+
+    def append(self, df: pd.DataFrame) -> Path:
+        """
+        Grava uma captura como novo segmento
+
+        Args:
+            df: DataFrame com dados capturados
+
+        Returns:
+            Caminho do segmento gravado
+        """
+        import pyarrow as pa
+
+        # Textos repetidos gravados como dicionário (ver buffer_arrow_schema)
+        table = to_arrow_table(df, schema=buffer_arrow_schema())
+        existing = self.segments()
+        sequence = (
+            int(existing[-1].stem[len(self.SEGMENT_PREFIX):]) + 1
+            if existing else 1
+        )
+        segment_path = self.buffer_dir / (
+            f"{self.SEGMENT_PREFIX}{sequence:06d}{self.SEGMENT_SUFFIX}"
+        )
+        tmp_path = segment_path.with_name(segment_path.name + '.tmp')
+
+        # Grava em arquivo temporário e renomeia: o segmento só passa a
+        # existir depois de estar completo e sincronizado no disco
+        with open(tmp_path, 'wb') as f:
+            with pa.ipc.new_file(pa.PythonFile(f), table.schema) as writer:
+                writer.write_table(table)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path.replace(segment_path)
+        fsync_dir(self.buffer_dir)
+
+        self.rows_count += table.num_rows
+        logger.debug(
+            f"Segmento gravado: {segment_path.name} ({table.num_rows} registros)"
+        )
+        return segment_path
+
+    def iter_tables(self) -> Iterator:
+        """
+        Lê os segmentos um a um via memory map
+
+        Yields:
+            pyarrow.Table de cada captura, na ordem de chegada
+        """
+        for segment_path in self.segments():
+            yield self._read_segment(segment_path)
+
+    def write_parquet(
+        self,
+        filepath: Path,
+        compression: str,
+        row_group_size: int
+    ) -> int:
+        """
+        Compacta os segmentos em um único arquivo Parquet
+
+        Args:
+            filepath: Caminho do arquivo de destino
+            compression: Codec de compressão ('none' desativa)
+            row_group_size: Quantidade máxima de linhas por row group
+
+        Returns:
+            Quantidade de registros gravados
+        """
+        import pyarrow.parquet as pq
+
+        rows = 0
+        with pq.ParquetWriter(
+            str(filepath),
+            arrow_schema(),
+            compression=None if compression == 'none' else compression
+        ) as writer:
+            for table in self.iter_tables():
+                writer.write_table(table, row_group_size=row_group_size)
+                rows += table.num_rows
+        return rows
+
+    def write_csv(self, filepath: Path) -> int:
+        """
+        Compacta os segmentos em um único arquivo CSV
+
+        Args:
+            filepath: Caminho do arquivo de destino
+
+        Returns:
+            Quantidade de registros gravados
+        """
+        rows = 0
+        with open(filepath, 'w', newline='', encoding='utf-8') as f:
+            for table in self.iter_tables():
+                table.to_pandas().to_csv(f, header=rows == 0, index=False)
+                rows += table.num_rows
+        return rows
+
+    def clear(self) -> None:
+        """Remove todos os segmentos e o estado do buffer"""
+        for segment_path in self.segments():
+            segment_path.unlink()
+        if self.state_path.exists():
+            self.state_path.unlink()
+        fsync_dir(self.buffer_dir)
+        self.rows_count = 0
+
+    def remove(self) -> None:
+        """Remove segmentos, estado e o próprio diretório do buffer"""
+        self.clear()
+        try:
+            self.buffer_dir.rmdir()
+        except OSError as e:
+            logger.warning(f"Diretório do buffer não removido: {e}")
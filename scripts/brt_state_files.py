@@ -0,0 +1,63 @@
+"""
+Arquivos de estado do pipeline BRT
+Leitura tolerante e gravação atômica (temporário + fsync + rename) dos JSON
+de estado e checkpoint usados pelo buffer, agregador, DBT, tabelas externas
+e backfill
+"""
+
+from pathlib import Path
+from loguru import logger
+import json
+import os
+
+
+def fsync_dir(directory: Path) -> None:
+    """
+    Persiste entradas de um diretório (renomeações) no disco
+
+    Args:
+        directory: Diretório a sincronizar
+    """
+    if os.name != 'posix':
+        return
+    fd = os.open(str(directory), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_json(path: Path) -> dict:
+    """
+    Lê arquivo JSON de estado
+
+    Args:
+        path: Caminho do arquivo
+
+    Returns:
+        Dict com o conteúdo (vazio se não existir ou estiver ilegível)
+    """
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Estado ilegível em {path}, ignorando: {e}")
+        return {}
+
+
+def write_json_atomic(path: Path, data: dict) -> None:
+    """
+    Grava arquivo JSON de forma atômica (temporário + fsync + rename)
+
+    Args:
+        path: Caminho do arquivo
+        data: Dict serializável em JSON
+    """
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp_path.replace(path)
+    fsync_dir(path.parent)
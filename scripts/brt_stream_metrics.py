@@ -0,0 +1,506 @@
+"""
+Métricas Gold incrementais para o pipeline BRT
+Mantém agregados mescláveis por janela enquanto as capturas chegam
+(contagens, soma/média/M2 de Welford, mín/máx e conjuntos exatos de veículos)
+Arquitetura Medallion - Gold em tempo quase real, sem consulta ao warehouse
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import os
+import numpy as np
+import pandas as pd
+
+from local_engine import (
+    SPEED_CATEGORIES,
+    build_silver,
+    finish_gold_metrics,
+)
+
+GROUP_KEYS = ['date_partition', 'line', 'period_of_day']
+
+# Contadores por categoria de velocidade (mesma ordem de SPEED_CATEGORIES)
+CATEGORY_COLUMNS = [
+    'vehicles_stopped',
+    'vehicles_slow',
+    'vehicles_normal',
+    'vehicles_fast',
+]
+
+# Layout dos arquivos parciais (uma linha por grupo e janela)
+PARTIAL_COLUMNS = GROUP_KEYS + [
+    'window_start',
+    'observations',
+    'speed_count',
+    'speed_mean',
+    'speed_m2',
+    'speed_min',
+    'speed_max',
+] + CATEGORY_COLUMNS + [
+    'latitude_sum',
+    'longitude_sum',
+    'first_hour',
+    'last_hour',
+    'last_capture_timestamp',
+    'vehicle_ids',
+]
+
+
+def partial_from_silver(
+    silver: pd.DataFrame,
+    window_start: Optional[pd.Timestamp] = None
+) -> pd.DataFrame:
+    """
+    Resume registros Silver em agregados parciais por grupo
+
+    Args:
+        silver: DataFrame retornado por build_silver
+        window_start: Janela de origem dos registros
+
+    Returns:
+        DataFrame no layout PARTIAL_COLUMNS
+    """
+    if silver.empty:
+        return pd.DataFrame(columns=PARTIAL_COLUMNS)
+
+    data = silver.assign(
+        date_partition=silver['capture_date'],
+        **{
+            column: silver['speed_category'] == category
+            for column, category in zip(CATEGORY_COLUMNS, SPEED_CATEGORIES)
+        }
+    )
+    grouped = data.groupby(GROUP_KEYS, dropna=False, sort=True)
+    partial = grouped.agg(
+        observations=('vehicle_id', 'size'),
+        speed_count=('speed_kmh', 'count'),
+        speed_mean=('speed_kmh', 'mean'),
+        speed_var=('speed_kmh', 'var'),
+        speed_min=('speed_kmh', 'min'),
+        speed_max=('speed_kmh', 'max'),
+        **{column: (column, 'sum') for column in CATEGORY_COLUMNS},
+        latitude_sum=('latitude', 'sum'),
+        longitude_sum=('longitude', 'sum'),
+        first_hour=('capture_hour', 'min'),
+        last_hour=('capture_hour', 'max'),
+        last_capture_timestamp=('capture_timestamp', 'max'),
+        vehicle_ids=('vehicle_id', lambda s: sorted(s.unique())),
+    ).reset_index()
+
+    # M2 = variância amostral * (n - 1); zero para grupos com um valor
+    partial['speed_m2'] = (
+        partial['speed_var'] * (partial['speed_count'] - 1)
+    ).fillna(0.0)
+    partial['window_start'] = window_start
+    return partial[PARTIAL_COLUMNS]
+
+
+def combine_partials(
+    partials: pd.DataFrame,
+    keys: Iterable[str] = GROUP_KEYS
+) -> pd.DataFrame:
+    """
+    Mescla agregados parciais do mesmo grupo (fórmula paralela de Chan)
+
+    M2 = soma(M2_i) + soma(n_i * (média_i - média)^2), o que torna a
+    mescla exata e independente da ordem das janelas.
+
+    Args:
+        partials: DataFrame no layout PARTIAL_COLUMNS
+        keys: Colunas de agrupamento
+
+    Returns:
+        DataFrame com uma linha por grupo (window_start = menor janela)
+    """
+    keys = list(keys)
+    if partials.empty:
+        return pd.DataFrame(columns=PARTIAL_COLUMNS)
+
+    data = partials.assign(
+        _weighted=partials['speed_mean'].fillna(0.0) * partials['speed_count']
+    )
+    grouped = data.groupby(keys, dropna=False, sort=True)
+    combined = grouped.agg(
+        window_start=('window_start', 'min'),
+        observations=('observations', 'sum'),
+        speed_count=('speed_count', 'sum'),
+        _weighted=('_weighted', 'sum'),
+        _m2=('speed_m2', 'sum'),
+        speed_min=('speed_min', 'min'),
+        speed_max=('speed_max', 'max'),
+        **{column: (column, 'sum') for column in CATEGORY_COLUMNS},
+        latitude_sum=('latitude_sum', 'sum'),
+        longitude_sum=('longitude_sum', 'sum'),
+        first_hour=('first_hour', 'min'),
+        last_hour=('last_hour', 'max'),
+        last_capture_timestamp=('last_capture_timestamp', 'max'),
+        vehicle_ids=('vehicle_ids', lambda s: sorted(set().union(*s))),
+    ).reset_index()
+
+    count = combined['speed_count'].to_numpy(dtype='float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        combined['speed_mean'] = np.where(
+            count > 0, combined['_weighted'] / count, np.nan
+        )
+
+    # Termo entre grupos: n_i * (média_i - média_global)^2
+    merged = data[keys + ['speed_count', 'speed_mean']].merge(
+        combined[keys + ['speed_mean']].rename(columns={'speed_mean': '_mean'}),
+        on=keys,
+        how='left'
+    )
+    merged['_between'] = (
+        merged['speed_count']
+        * (merged['speed_mean'] - merged['_mean']) ** 2
+    ).fillna(0.0)
+    between = merged.groupby(keys, dropna=False, sort=True)['_between'].sum()
+    combined['speed_m2'] = combined['_m2'].to_numpy() + between.to_numpy()
+    return combined[PARTIAL_COLUMNS]
+
+
+def finalize_partials(partials: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte agregados parciais nas métricas de fct_brt_line_metrics
+
+    Args:
+        partials: Parciais de uma ou mais janelas
+
+    Returns:
+        DataFrame no layout da tabela Gold
+    """
+    combined = combine_partials(partials)
+    count = combined['speed_count'].to_numpy(dtype='float64')
+    observations = combined['observations'].to_numpy(dtype='float64')
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        metrics = pd.DataFrame({
+            'date_partition': combined['date_partition'],
+            'line': combined['line'],
+            'period_of_day': combined['period_of_day'],
+            'total_vehicles': combined['vehicle_ids'].map(len),
+            'total_observations': combined['observations'],
+            'avg_speed_kmh': combined['speed_mean'],
+            'min_speed_kmh': combined['speed_min'],
+            'max_speed_kmh': combined['speed_max'],
+            # STDDEV do BigQuery é amostral (NULL com menos de 2 valores)
+            'stddev_speed_kmh': np.where(
+                count > 1,
+                np.sqrt(combined['speed_m2'] / (count - 1)),
+                np.nan
+            ),
+            **{column: combined[column] for column in CATEGORY_COLUMNS},
+            'avg_latitude': combined['latitude_sum'] / observations,
+            'avg_longitude': combined['longitude_sum'] / observations,
+            'first_hour': combined['first_hour'],
+            'last_hour': combined['last_hour'],
+            'last_capture_timestamp': combined['last_capture_timestamp'],
+        })
+    metrics['min_speed_kmh'] = metrics['min_speed_kmh'].astype('float64')
+    metrics['max_speed_kmh'] = metrics['max_speed_kmh'].astype('float64')
+    return finish_gold_metrics(metrics)
+
+
+def partials_schema():
+    """
+    Schema pyarrow dos arquivos parciais
+
+    Returns:
+        pyarrow.Schema com tipos explícitos de cada coluna
+    """
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            pa.field('date_partition', pa.date32()),
+            pa.field('line', pa.string()),
+            pa.field('period_of_day', pa.string()),
+            pa.field('window_start', pa.timestamp('us')),
+            pa.field('observations', pa.int64()),
+            pa.field('speed_count', pa.int64()),
+            pa.field('speed_mean', pa.float64()),
+            pa.field('speed_m2', pa.float64()),
+            pa.field('speed_min', pa.float64()),
+            pa.field('speed_max', pa.float64()),
+        ]
+        + [pa.field(column, pa.int64()) for column in CATEGORY_COLUMNS]
+        + [
+            pa.field('latitude_sum', pa.float64()),
+            pa.field('longitude_sum', pa.float64()),
+            pa.field('first_hour', pa.int64()),
+            pa.field('last_hour', pa.int64()),
+            pa.field('last_capture_timestamp', pa.timestamp('us')),
+            pa.field('vehicle_ids', pa.list_(pa.string())),
+        ]
+    )
+
+
+def write_partials(partials: pd.DataFrame, filepath: Path) -> Path:
+    """
+    Grava agregados parciais em Parquet de forma atômica
+
+    Args:
+        partials: DataFrame no layout PARTIAL_COLUMNS
+        filepath: Caminho de destino
+
+    Returns:
+        Caminho gravado
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = filepath.with_name(filepath.name + '.tmp')
+    schema = partials_schema()
+    table = pa.Table.from_pydict(
+        {
+            column: partials[column].tolist()
+            if column == 'vehicle_ids' else partials[column]
+            for column in PARTIAL_COLUMNS
+        },
+        schema=schema
+    )
+    pq.write_table(table, str(tmp_path))
+    tmp_path.replace(filepath)
+    return filepath
+
+
+def read_partials(paths: Iterable[Path]) -> pd.DataFrame:
+    """
+    Lê arquivos parciais gravados por write_partials
+
+    Args:
+        paths: Arquivos Parquet
+
+    Returns:
+        DataFrame concatenado no layout PARTIAL_COLUMNS
+    """
+    import pyarrow.parquet as pq
+
+    frames = [pq.read_table(str(p)).to_pandas() for p in paths]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=PARTIAL_COLUMNS)
+    partials = pd.concat(frames, ignore_index=True)
+    partials['vehicle_ids'] = partials['vehicle_ids'].map(list)
+    return partials
+
+
+class WindowMetrics:
+    """
+    Agregados mescláveis de uma janela, atualizados a cada captura
+
+    Cada grupo (date_partition, line, period_of_day) ocupa uma posição em
+    arrays NumPy. Uma captura é resumida com bincount e mesclada apenas nas
+    posições dos seus grupos (fórmula de Chan), sem reagrupar o que já foi
+    acumulado; o DataFrame de parciais só é montado quando lido.
+    """
+
+    # Valor inicial de cada agregado (identidade da operação de mescla)
+    _FIELDS = {
+        'observations': ('int64', 0),
+        'speed_count': ('int64', 0),
+        'speed_mean': ('float64', 0.0),
+        'speed_m2': ('float64', 0.0),
+        'speed_min': ('float64', np.inf),
+        'speed_max': ('float64', -np.inf),
+        **{column: ('int64', 0) for column in CATEGORY_COLUMNS},
+        'latitude_sum': ('float64', 0.0),
+        'longitude_sum': ('float64', 0.0),
+        'first_hour': ('int64', 24),
+        'last_hour': ('int64', -1),
+        'last_capture_timestamp': ('int64', np.iinfo('int64').min),
+    }
+
+    def __init__(self, window_start: pd.Timestamp):
+        """
+        Inicializa agregados vazios
+
+        Args:
+            window_start: Início da janela
+        """
+        self.window_start = window_start
+        self._rows: Dict[tuple, int] = {}
+        self._keys: List[tuple] = []
+        self._vehicles: List[set] = []
+        self._arrays = {
+            name: np.full(0, fill, dtype=dtype)
+            for name, (dtype, fill) in self._FIELDS.items()
+        }
+
+    def _group_rows(self, keys: List[tuple]) -> np.ndarray:
+        """Posição de cada grupo nos arrays, criando as que faltam"""
+        rows = np.empty(len(keys), dtype='int64')
+        for i, key in enumerate(keys):
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = len(self._keys)
+                self._keys.append(key)
+                self._vehicles.append(set())
+            rows[i] = row
+
+        capacity = len(self._arrays['observations'])
+        if len(self._keys) > capacity:
+            grow = max(len(self._keys), 2 * capacity, 64) - capacity
+            for name, (dtype, fill) in self._FIELDS.items():
+                self._arrays[name] = np.concatenate(
+                    [self._arrays[name], np.full(grow, fill, dtype=dtype)]
+                )
+        return rows
+
+    @staticmethod
+    def _batch_groups(silver: pd.DataFrame) -> tuple:
+        """
+        Código de grupo de cada registro e a chave de cada código
+
+        Returns:
+            Tuple (códigos 0..g-1 por registro, lista de g chaves)
+        """
+        codes = np.zeros(len(silver), dtype='int64')
+        uniques = []
+        for column in ('capture_date', 'line', 'period_of_day'):
+            column_codes, column_uniques = pd.factorize(
+                silver[column], use_na_sentinel=False
+            )
+            codes = codes * len(column_uniques) + column_codes
+            uniques.append(np.asarray(column_uniques, dtype=object))
+
+        group_codes, codes = np.unique(codes, return_inverse=True)
+        parts = []
+        for column_uniques in reversed(uniques):
+            parts.append(column_uniques[group_codes % len(column_uniques)])
+            group_codes = group_codes // len(column_uniques)
+        return codes.reshape(-1), list(zip(*reversed(parts)))
+
+    def update(self, df: pd.DataFrame) -> None:
+        """
+        Incorpora uma captura aos agregados
+
+        Os registros passam pela mesma limpeza de stg_brt_gps_cleaned;
+        duplicatas (vehicle_id, capture_timestamp) só ocorrem dentro de uma
+        mesma captura e são removidas ali.
+
+        Args:
+            df: Registros da captura pertencentes a esta janela
+        """
+        silver = build_silver(df)
+        if silver.empty:
+            return
+        codes, keys = self._batch_groups(silver)
+        rows = self._group_rows(keys)
+        groups = len(keys)
+
+        speed = silver['speed_kmh'].to_numpy(dtype='float64', na_value=np.nan)
+        valid = ~np.isnan(speed)
+        speed_codes, speed = codes[valid], speed[valid]
+        hours = silver['capture_hour'].to_numpy(dtype='int64')
+        captured = silver['capture_timestamp'].to_numpy(dtype='datetime64[ns]')
+
+        # Resumo da captura por grupo
+        observations = np.bincount(codes, minlength=groups)
+        count = np.bincount(speed_codes, minlength=groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(
+                count > 0,
+                np.bincount(speed_codes, speed, groups) / count,
+                0.0
+            )
+        m2 = np.bincount(
+            speed_codes, (speed - mean[speed_codes]) ** 2, groups
+        )
+        speed_min = np.full(groups, np.inf)
+        np.minimum.at(speed_min, speed_codes, speed)
+        speed_max = np.full(groups, -np.inf)
+        np.maximum.at(speed_max, speed_codes, speed)
+        first_hour = np.full(groups, 24, dtype='int64')
+        np.minimum.at(first_hour, codes, hours)
+        last_hour = np.full(groups, -1, dtype='int64')
+        np.maximum.at(last_hour, codes, hours)
+        last_capture = np.full(groups, np.iinfo('int64').min, dtype='int64')
+        np.maximum.at(last_capture, codes, captured.view('int64'))
+
+        # Mescla com o acumulado (Chan): só as posições dos grupos da captura
+        a = self._arrays
+        previous_count = a['speed_count'][rows]
+        total = previous_count + count
+        delta = mean - a['speed_mean'][rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            a['speed_mean'][rows] = np.where(
+                total > 0, a['speed_mean'][rows] + delta * count / total, 0.0
+            )
+            a['speed_m2'][rows] += m2 + np.where(
+                total > 0, delta ** 2 * previous_count * count / total, 0.0
+            )
+        a['speed_count'][rows] = total
+        a['observations'][rows] += observations
+        a['speed_min'][rows] = np.minimum(a['speed_min'][rows], speed_min)
+        a['speed_max'][rows] = np.maximum(a['speed_max'][rows], speed_max)
+        categories = silver['speed_category'].to_numpy(dtype=object)
+        for column, category in zip(CATEGORY_COLUMNS, SPEED_CATEGORIES):
+            a[column][rows] += np.bincount(
+                codes, categories == category, groups
+            ).astype('int64')
+        a['latitude_sum'][rows] += np.bincount(
+            codes, silver['latitude'].to_numpy(dtype='float64'), groups
+        )
+        a['longitude_sum'][rows] += np.bincount(
+            codes, silver['longitude'].to_numpy(dtype='float64'), groups
+        )
+        a['first_hour'][rows] = np.minimum(a['first_hour'][rows], first_hour)
+        a['last_hour'][rows] = np.maximum(a['last_hour'][rows], last_hour)
+        a['last_capture_timestamp'][rows] = np.maximum(
+            a['last_capture_timestamp'][rows], last_capture
+        )
+
+        # Conjuntos exatos de veículos: um update por grupo da captura
+        order = np.argsort(codes, kind='stable')
+        vehicles = silver['vehicle_id'].to_numpy(dtype=object)[order]
+        chunks = np.split(vehicles, np.cumsum(observations)[:-1])
+        for row, chunk in zip(rows, chunks):
+            self._vehicles[row].update(chunk)
+
+    @property
+    def partials(self) -> pd.DataFrame:
+        """Agregados no layout PARTIAL_COLUMNS, um grupo por linha"""
+        groups = len(self._keys)
+        if groups == 0:
+            return pd.DataFrame(columns=PARTIAL_COLUMNS)
+        a = {name: values[:groups] for name, values in self._arrays.items()}
+        has_speed = a['speed_count'] > 0
+        dates, lines, periods = zip(*self._keys)
+        partials = pd.DataFrame({
+            'date_partition': list(dates),
+            'line': pd.array(list(lines), dtype='string'),
+            'period_of_day': list(periods),
+            'window_start': self.window_start,
+            'observations': a['observations'],
+            'speed_count': a['speed_count'],
+            'speed_mean': np.where(has_speed, a['speed_mean'], np.nan),
+            'speed_m2': a['speed_m2'],
+            'speed_min': np.where(has_speed, a['speed_min'], np.nan),
+            'speed_max': np.where(has_speed, a['speed_max'], np.nan),
+            **{column: a[column] for column in CATEGORY_COLUMNS},
+            'latitude_sum': a['latitude_sum'],
+            'longitude_sum': a['longitude_sum'],
+            'first_hour': a['first_hour'],
+            'last_hour': a['last_hour'],
+            'last_capture_timestamp': a['last_capture_timestamp'].astype(
+                'datetime64[ns]'
+            ).astype('datetime64[us]'),
+            'vehicle_ids': [sorted(vehicles) for vehicles in self._vehicles],
+        })
+        return partials.sort_values(
+            GROUP_KEYS, na_position='last', kind='mergesort'
+        ).reset_index(drop=True)[PARTIAL_COLUMNS]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def empty(self) -> bool:
+        return not self._keys
+
+
+def stream_metrics_enabled() -> bool:
+    """Indica se as métricas incrementais estão ativas (STREAM_METRICS)"""
+    return os.getenv('STREAM_METRICS', 'false').lower() in ('1', 'true', 'yes')
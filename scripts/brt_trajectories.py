@@ -0,0 +1,250 @@
+"""
+Reconstrução de trajetórias por veículo para o pipeline BRT
+Ordena os registros de uma janela por veículo e timestamp_gps e deriva
+distância, velocidade, rumo e intervalos entre posições consecutivas com NumPy
+Arquitetura Medallion - Qualidade do GPS (saltos e velocidade informada)
+"""
+
+from pathlib import Path
+from typing import Optional
+from loguru import logger
+import os
+import time
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EARTH_RADIUS_M = 6371008.8
+
+# Colunas da janela lidas pelo construtor (raw_data não é necessário)
+TRAJECTORY_SOURCE_COLUMNS = [
+    'vehicle_id',
+    'line',
+    'latitude',
+    'longitude',
+    'speed',
+    'timestamp_gps',
+]
+
+SEGMENT_COLUMNS = [
+    'vehicle_id',
+    'line',
+    'start_timestamp_gps',
+    'end_timestamp_gps',
+    'start_latitude',
+    'start_longitude',
+    'end_latitude',
+    'end_longitude',
+    'duration_seconds',
+    'distance_m',
+    'derived_speed_kmh',
+    'reported_speed_kmh',
+    'speed_difference_kmh',
+    'heading_degrees',
+    'is_time_gap',
+    'is_gps_jump',
+]
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Distância haversine em metros entre pares de coordenadas
+
+    Args:
+        lat1, lon1, lat2, lon2: Arrays em graus
+
+    Returns:
+        Array de distâncias em metros
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2.0) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    )
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Rumo inicial em graus (0 = norte, sentido horário)
+
+    Args:
+        lat1, lon1, lat2, lon2: Arrays em graus
+
+    Returns:
+        Array de rumos em [0, 360)
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(x, y)) % 360.0
+
+
+def build_trajectories(
+    df: pd.DataFrame,
+    max_speed_kmh: Optional[float] = None,
+    max_gap_seconds: Optional[float] = None
+) -> pd.DataFrame:
+    """
+    Monta a tabela de segmentos entre posições consecutivas de cada veículo
+
+    Os registros são ordenados uma única vez por (vehicle_id, timestamp_gps)
+    com np.lexsort; os segmentos são os pares adjacentes do mesmo veículo,
+    sem laço em Python por veículo.
+
+    Args:
+        df: Registros da janela (layout de captura)
+        max_speed_kmh: Velocidade derivada acima da qual o segmento é um
+            salto de GPS (padrão: TRAJECTORY_MAX_SPEED_KMH)
+        max_gap_seconds: Intervalo acima do qual o segmento é uma lacuna
+            (padrão: TRAJECTORY_MAX_GAP_SECONDS)
+
+    Returns:
+        DataFrame no layout SEGMENT_COLUMNS
+    """
+    max_speed_kmh = float(
+        max_speed_kmh if max_speed_kmh is not None
+        else os.getenv('TRAJECTORY_MAX_SPEED_KMH', 120)
+    )
+    max_gap_seconds = float(
+        max_gap_seconds if max_gap_seconds is not None
+        else os.getenv('TRAJECTORY_MAX_GAP_SECONDS', 300)
+    )
+
+    data = df[TRAJECTORY_SOURCE_COLUMNS].dropna(
+        subset=['vehicle_id', 'latitude', 'longitude', 'timestamp_gps']
+    )
+    # A mesma posição aparece em capturas seguidas enquanto o GPS não avança
+    data = data.drop_duplicates(subset=['vehicle_id', 'timestamp_gps'])
+    if len(data) < 2:
+        return pd.DataFrame(columns=SEGMENT_COLUMNS)
+
+    vehicle_codes, vehicles = pd.factorize(data['vehicle_id'])
+    ts = data['timestamp_gps'].to_numpy(dtype='int64')
+    order = np.lexsort((ts, vehicle_codes))
+
+    vehicle_codes = vehicle_codes[order]
+    ts = ts[order]
+    lat = data['latitude'].to_numpy(dtype='float64')[order]
+    lon = data['longitude'].to_numpy(dtype='float64')[order]
+    speed = data['speed'].to_numpy(dtype='float64', na_value=np.nan)[order]
+    line = data['line'].to_numpy(dtype=object)[order]
+
+    # Pares adjacentes do mesmo veículo
+    pair = vehicle_codes[1:] == vehicle_codes[:-1]
+    start = np.flatnonzero(pair)
+    end = start + 1
+
+    duration = (ts[end] - ts[start]) / 1000.0
+    distance = haversine_m(lat[start], lon[start], lat[end], lon[end])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        derived = np.where(duration > 0, distance / duration * 3.6, np.nan)
+    # Velocidade informada: média das duas pontas (ou a única disponível)
+    speed_start, speed_end = speed[start], speed[end]
+    reported = np.where(
+        np.isnan(speed_start), speed_end,
+        np.where(np.isnan(speed_end), speed_start, (speed_start + speed_end) / 2.0)
+    )
+    moved = distance > 0
+
+    segments = pd.DataFrame({
+        'vehicle_id': pd.Series(
+            np.asarray(vehicles, dtype=object)[vehicle_codes[start]],
+            dtype='string'
+        ),
+        'line': pd.Series(line[end], dtype='string'),
+        'start_timestamp_gps': ts[start],
+        'end_timestamp_gps': ts[end],
+        'start_latitude': lat[start],
+        'start_longitude': lon[start],
+        'end_latitude': lat[end],
+        'end_longitude': lon[end],
+        'duration_seconds': duration,
+        'distance_m': distance,
+        'derived_speed_kmh': derived,
+        'reported_speed_kmh': reported,
+        'speed_difference_kmh': reported - derived,
+        'heading_degrees': np.where(
+            moved, initial_bearing(lat[start], lon[start], lat[end], lon[end]),
+            np.nan
+        ),
+        'is_time_gap': duration > max_gap_seconds,
+        'is_gps_jump': derived > max_speed_kmh,
+    }, columns=SEGMENT_COLUMNS)
+    return segments
+
+
+def summarize_trajectories(segments: pd.DataFrame) -> dict:
+    """
+    Indicadores de qualidade de uma tabela de segmentos
+
+    Args:
+        segments: DataFrame retornado por build_trajectories
+
+    Returns:
+        Dict com contagens de veículos, segmentos, saltos e lacunas
+    """
+    return {
+        'vehicles': int(segments['vehicle_id'].nunique()),
+        'segments': int(len(segments)),
+        'gps_jumps': int(segments['is_gps_jump'].sum()),
+        'time_gaps': int(segments['is_time_gap'].sum()),
+        'distance_km': float(segments['distance_m'].sum() / 1000.0),
+    }
+
+
+def write_trajectories(segments: pd.DataFrame, filepath: Path) -> Path:
+    """
+    Grava a tabela de segmentos em Parquet de forma atômica
+
+    Args:
+        segments: DataFrame retornado por build_trajectories
+        filepath: Caminho de destino
+
+    Returns:
+        Caminho gravado
+    """
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = filepath.with_name(filepath.name + '.tmp')
+    segments.to_parquet(tmp_path, index=False)
+    tmp_path.replace(filepath)
+    return filepath
+
+
+def trajectories_enabled() -> bool:
+    """Indica se as trajetórias por janela estão ativas (TRAJECTORIES)"""
+    return os.getenv('TRAJECTORIES', 'false').lower() in ('1', 'true', 'yes')
+
+
+def main():
+    """Constrói as trajetórias de um arquivo de janela"""
+    import argparse
+
+    from local_engine import read_source_file
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help='Arquivo CSV ou Parquet de uma janela')
+    parser.add_argument('--output', help='Parquet de saída da tabela de segmentos')
+    args = parser.parse_args()
+
+    df = read_source_file(Path(args.path))
+    start = time.perf_counter()
+    segments = build_trajectories(df)
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        f"Trajetórias: {summarize_trajectories(segments)} "
+        f"em {elapsed * 1000:.1f} ms"
+    )
+    if args.output:
+        write_trajectories(segments, Path(args.output))
+    else:
+        print(segments.head(20).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Fila local de janelas gravadas para o pipeline BRT
+Desacopla a captura/agregação (a cada minuto) do upload e do DBT: cada janela
+gravada vira um arquivo JSON em data/queue/pending e o worker do warehouse
+consome todas as pendentes de uma vez, em uma única execução DBT
+Arquitetura Medallion - Passagem Bronze -> Silver/Gold
+"""
+
+from pathlib import Path
+from typing import List, Optional
+from datetime import datetime
+from loguru import logger
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class WindowBatch:
+    """Conjunto de entradas reivindicadas da fila por um consumidor"""
+
+    def __init__(self, entries: List[dict]):
+        self.entries = entries
+
+    @property
+    def file_paths(self) -> List[str]:
+        """Arquivos de todas as janelas do lote, sem repetição e em ordem"""
+        paths = []
+        for entry in self.entries:
+            for path in entry['file_paths']:
+                if path not in paths:
+                    paths.append(path)
+        return paths
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class WindowQueue:
+    """Fila FIFO em disco, segura entre processos (rename atômico)"""
+
+    def __init__(
+        self,
+        queue_dir: Optional[str] = None,
+        max_attempts: Optional[int] = None
+    ):
+        """
+        Inicializa a fila
+
+        Args:
+            queue_dir: Diretório da fila (padrão: WINDOW_QUEUE_DIR)
+            max_attempts: Tentativas antes de mover a entrada para failed/
+                (padrão: WAREHOUSE_MAX_ATTEMPTS)
+        """
+        self.queue_dir = Path(
+            queue_dir or os.getenv('WINDOW_QUEUE_DIR', './data/queue')
+        )
+        self.max_attempts = int(
+            max_attempts or os.getenv('WAREHOUSE_MAX_ATTEMPTS', 5)
+        )
+        self.pending_dir = self.queue_dir / 'pending'
+        self.processing_dir = self.queue_dir / 'processing'
+        self.failed_dir = self.queue_dir / 'failed'
+        for directory in (self.pending_dir, self.processing_dir, self.failed_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        # Acorda consumidores do mesmo processo sem esperar o polling
+        self._event = threading.Event()
+
+    def _write_entry(self, directory: Path, entry: dict) -> Path:
+        filepath = directory / f"{entry['id']}.json"
+        tmp_path = filepath.with_name(filepath.name + '.tmp')
+        tmp_path.write_text(json.dumps(entry), encoding='utf-8')
+        tmp_path.replace(filepath)
+        return filepath
+
+    def enqueue(self, file_paths: List[str]) -> Optional[Path]:
+        """
+        Adiciona os arquivos de uma ou mais janelas gravadas
+
+        Args:
+            file_paths: Caminhos dos arquivos das janelas
+
+        Returns:
+            Caminho da entrada criada (None se não houver arquivos)
+        """
+        if not file_paths:
+            return None
+
+        # Nome ordenável: a listagem do diretório preserva a ordem FIFO
+        entry = {
+            'id': f"{time.time_ns():020d}_{os.getpid()}",
+            'file_paths': [str(path) for path in file_paths],
+            'enqueued_at': datetime.now().isoformat(),
+            'attempts': 0,
+        }
+        filepath = self._write_entry(self.pending_dir, entry)
+        self._event.set()
+        logger.info(f"Janelas enfileiradas para o warehouse: {entry['file_paths']}")
+        return filepath
+
+    def pending_count(self) -> int:
+        """Quantidade de entradas aguardando consumo"""
+        return sum(1 for _ in self.pending_dir.glob('*.json'))
+
+    def claim(self, max_entries: Optional[int] = None) -> WindowBatch:
+        """
+        Reivindica as entradas pendentes mais antigas
+
+        Cada entrada é movida para processing/ com rename atômico; se outro
+        consumidor a moveu antes, ela é ignorada.
+
+        Args:
+            max_entries: Máximo de entradas no lote (padrão: todas)
+
+        Returns:
+            WindowBatch (vazio se não houver pendências)
+        """
+        self._event.clear()
+        entries = []
+        for filepath in sorted(self.pending_dir.glob('*.json')):
+            if max_entries and len(entries) >= max_entries:
+                break
+            target = self.processing_dir / filepath.name
+            try:
+                filepath.replace(target)
+            except FileNotFoundError:
+                continue
+            try:
+                entries.append(json.loads(target.read_text(encoding='utf-8')))
+            except (OSError, ValueError) as e:
+                logger.error(f"Entrada inválida na fila {target}: {e}")
+                target.replace(self.failed_dir / target.name)
+        return WindowBatch(entries)
+
+    def ack(self, batch: WindowBatch) -> None:
+        """Remove da fila as entradas processadas com sucesso"""
+        for entry in batch.entries:
+            (self.processing_dir / f"{entry['id']}.json").unlink(missing_ok=True)
+
+    def release(self, batch: WindowBatch) -> None:
+        """
+        Devolve as entradas de um lote com falha para pending/
+
+        Entradas que atingiram max_attempts vão para failed/.
+        """
+        for entry in batch.entries:
+            entry['attempts'] = entry.get('attempts', 0) + 1
+            if entry['attempts'] >= self.max_attempts:
+                self._write_entry(self.failed_dir, entry)
+                logger.error(
+                    f"Janelas movidas para {self.failed_dir} após "
+                    f"{entry['attempts']} tentativas: {entry['file_paths']}"
+                )
+            else:
+                self._write_entry(self.pending_dir, entry)
+            (self.processing_dir / f"{entry['id']}.json").unlink(missing_ok=True)
+
+    def recover(self) -> int:
+        """
+        Devolve para pending/ entradas de um consumidor interrompido
+
+        Deve ser chamado na inicialização do único worker do warehouse.
+
+        Returns:
+            Quantidade de entradas recuperadas
+        """
+        recovered = 0
+        for filepath in sorted(self.processing_dir.glob('*.json')):
+            filepath.replace(self.pending_dir / filepath.name)
+            recovered += 1
+        if recovered:
+            logger.warning(f"{recovered} entradas recuperadas de processing/")
+        return recovered
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Aguarda uma nova entrada (mesmo processo) ou o fim do timeout
+
+        Args:
+            timeout: Segundos máximos de espera
+
+        Returns:
+            True se há entradas pendentes
+        """
+        if self.pending_count():
+            return True
+        self._event.wait(timeout)
+        return self.pending_count() > 0
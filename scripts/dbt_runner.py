@@ -0,0 +1,226 @@
+"""
+Executor DBT em processo para o pipeline BRT
+Invoca o dbt programaticamente, reaproveitando o manifest entre execuções
+Arquitetura Medallion - Transformações Silver e Gold
+"""
+
+from pathlib import Path
+from typing import List, Optional, Tuple
+from loguru import logger
+import os
+import shutil
+import time
+from dotenv import load_dotenv
+
+from brt_state_files import read_json, write_json_atomic
+
+load_dotenv()
+
+# Modelos afetados por novas janelas na Bronze
+DEFAULT_SELECTOR = 'source:brt_external+'
+
+
+class DBTRunner:
+    """Executa comandos dbt no próprio processo, sem subprocess por task"""
+
+    STATE_DIRNAME = 'state'
+    RUNNER_STATE_FILENAME = 'runner_state.json'
+
+    def __init__(
+        self,
+        project_dir: Optional[str] = None,
+        profiles_dir: Optional[str] = None,
+        target: Optional[str] = None,
+        docs_interval_minutes: Optional[float] = None
+    ):
+        """
+        Inicializa o executor
+
+        Args:
+            project_dir: Diretório do projeto dbt (padrão: dbt_brt/)
+            profiles_dir: Diretório do profiles.yml (padrão: project_dir)
+            target: Target do profiles.yml (padrão: DBT_TARGET ou o default)
+            docs_interval_minutes: Intervalo mínimo entre 'dbt docs generate'
+        """
+        self.project_dir = Path(
+            project_dir or Path(__file__).parent.parent / 'dbt_brt'
+        ).resolve()
+        self.profiles_dir = Path(profiles_dir or self.project_dir).resolve()
+        self.target = target or os.getenv('DBT_TARGET')
+        self.docs_interval = float(
+            docs_interval_minutes
+            if docs_interval_minutes is not None
+            else os.getenv('DBT_DOCS_INTERVAL_MINUTES', 60)
+        ) * 60
+
+        self.target_dir = self.project_dir / 'target'
+        # Manifest da última execução bem-sucedida (base de state:modified)
+        self.state_dir = self.target_dir / self.STATE_DIRNAME
+        self.runner_state_path = self.target_dir / self.RUNNER_STATE_FILENAME
+
+        self._runner = None
+        self._manifest = None
+        self._legacy = False
+        try:
+            from dbt.cli.main import dbtRunner  # noqa: F401 (dbt >= 1.5)
+        except ImportError:
+            # dbt 1.4: sem API de manifest; o cache é o partial parsing
+            # (target/partial_parse.msgpack) reaproveitado a cada chamada
+            self._legacy = True
+
+    def _base_args(self) -> List[str]:
+        args = [
+            '--project-dir', str(self.project_dir),
+            '--profiles-dir', str(self.profiles_dir),
+        ]
+        if self.target:
+            args += ['--target', self.target]
+        return args
+
+    def _get_manifest(self):
+        """
+        Faz o parse do projeto uma vez e mantém o manifest em memória
+
+        Alterações nos modelos passam a valer ao reiniciar o processo.
+        """
+        from dbt.cli.main import dbtRunner
+
+        if self._manifest is None:
+            start = time.perf_counter()
+            result = dbtRunner().invoke(['parse'] + self._base_args())
+            if not result.success:
+                raise RuntimeError(f"Falha no parse do projeto dbt: {result.exception}")
+            self._manifest = result.result
+            self._runner = dbtRunner(manifest=self._manifest)
+            logger.info(
+                f"Manifest dbt carregado em {time.perf_counter() - start:.1f}s"
+            )
+        return self._runner
+
+    def invoke(self, command: List[str]) -> Tuple[bool, object]:
+        """
+        Executa um comando dbt no processo atual
+
+        Args:
+            command: Comando e argumentos (ex.: ['run', '--select', 'x+'])
+
+        Returns:
+            Tuple (sucesso, resultado do dbt)
+        """
+        args = command + self._base_args()
+        start = time.perf_counter()
+
+        if self._legacy:
+            from dbt.main import handle_and_check
+
+            results, success = handle_and_check(args)
+        else:
+            result = self._get_manifest().invoke(args)
+            if result.exception is not None:
+                raise result.exception
+            results, success = result.result, result.success
+
+        logger.info(
+            f"dbt {' '.join(command)}: "
+            f"{'sucesso' if success else 'falha'} em "
+            f"{time.perf_counter() - start:.1f}s"
+        )
+        return success, results
+
+    def _selector(self, select: Optional[str]) -> str:
+        """Seleção padrão: descendentes da Bronze e modelos alterados"""
+        if select is not None:
+            return select
+        if (self.state_dir / 'manifest.json').exists():
+            return f"{DEFAULT_SELECTOR} state:modified+"
+        return DEFAULT_SELECTOR
+
+    def _state_args(self, selector: str) -> List[str]:
+        return ['--state', str(self.state_dir)] if 'state:' in selector else []
+
+    def _save_state(self) -> None:
+        """Guarda o manifest desta execução como base do próximo state:modified"""
+        manifest_path = self.target_dir / 'manifest.json'
+        if manifest_path.exists():
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_dir / 'manifest.json.tmp'
+            shutil.copyfile(manifest_path, tmp_path)
+            tmp_path.replace(self.state_dir / 'manifest.json')
+
+    def run(self, select: Optional[str] = None) -> Tuple[bool, object]:
+        """
+        Executa os modelos afetados pela nova janela
+
+        Args:
+            select: Seletor dbt (padrão: source:brt_external+ e
+                state:modified+ quando há manifest anterior)
+
+        Returns:
+            Tuple (sucesso, resultado do dbt)
+        """
+        selector = self._selector(select)
+        success, results = self.invoke(
+            ['run', '--select', selector] + self._state_args(selector)
+        )
+        if success:
+            self._save_state()
+        return success, results
+
+    def test(self, select: Optional[str] = None) -> Tuple[bool, object]:
+        """
+        Executa os testes dos modelos afetados
+
+        Args:
+            select: Seletor dbt (padrão: o mesmo de run)
+
+        Returns:
+            Tuple (sucesso, resultado do dbt)
+        """
+        selector = select if select is not None else DEFAULT_SELECTOR
+        return self.invoke(
+            ['test', '--select', selector] + self._state_args(selector)
+        )
+
+    def docs_due(self) -> bool:
+        """Indica se já passou o intervalo desde a última documentação"""
+        last = read_json(self.runner_state_path).get('docs_generated_at', 0)
+        return time.time() - last >= self.docs_interval
+
+    def generate_docs(self, force: bool = False) -> bool:
+        """
+        Gera a documentação se o intervalo configurado tiver passado
+
+        Args:
+            force: Gera mesmo dentro do intervalo
+
+        Returns:
+            True se a documentação foi gerada
+        """
+        if not force and not self.docs_due():
+            return False
+
+        success, _ = self.invoke(['docs', 'generate'])
+        if success:
+            self.target_dir.mkdir(parents=True, exist_ok=True)
+            state = read_json(self.runner_state_path)
+            state['docs_generated_at'] = time.time()
+            write_json_atomic(self.runner_state_path, state)
+        return success
+
+
+def count_failures(results) -> int:
+    """
+    Conta nós com erro ou falha em um resultado do dbt
+
+    Args:
+        results: Resultado retornado por DBTRunner.invoke
+
+    Returns:
+        Quantidade de nós com status error/fail
+    """
+    if results is None or not hasattr(results, 'results'):
+        return 0
+    return sum(
+        1 for r in results.results
+        if str(getattr(r, 'status', '')).lower() in ('error', 'fail')
+    )
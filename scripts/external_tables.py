@@ -0,0 +1,167 @@
+"""
+Criação idempotente das tabelas externas da camada Bronze
+Só executa o DDL quando a definição muda (fingerprint em cache)
+Arquitetura Medallion - Exposição da Bronze no BigQuery
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+from loguru import logger
+import hashlib
+import os
+import re
+import time
+from dotenv import load_dotenv
+
+from brt_state_files import read_json, write_json_atomic
+
+load_dotenv()
+
+DDL_MODES = ('script', 'parallel')
+
+
+def split_statements(sql: str) -> List[str]:
+    """
+    Separa um script SQL em instruções, descartando comentários de linha
+
+    Args:
+        sql: Conteúdo do script
+
+    Returns:
+        Lista de instruções sem o ';' final
+    """
+    without_comments = re.sub(r'^\s*--.*$', '', sql, flags=re.MULTILINE)
+    return [
+        statement.strip()
+        for statement in without_comments.split(';')
+        if statement.strip()
+    ]
+
+
+class ExternalTableManager:
+    """Aplica o DDL das tabelas externas apenas quando ele muda"""
+
+    def __init__(
+        self,
+        sql_path: Optional[Path] = None,
+        cache_path: Optional[Path] = None,
+        project_id: Optional[str] = None,
+        bucket_name: Optional[str] = None,
+        location: Optional[str] = None,
+        mode: Optional[str] = None
+    ):
+        """
+        Inicializa o gerenciador
+
+        Args:
+            sql_path: Script DDL (padrão: dbt_brt/analyses/create_external_table.sql)
+            cache_path: Arquivo do fingerprint aplicado
+            project_id: ID do projeto GCP
+            bucket_name: Bucket com os arquivos da Bronze
+            location: Localização dos jobs do BigQuery
+            mode: 'script' (um único job com todas as instruções) ou
+                'parallel' (um job por instrução, submetidos juntos)
+        """
+        dbt_dir = Path(__file__).parent.parent / 'dbt_brt'
+        self.sql_path = Path(
+            sql_path or dbt_dir / 'analyses' / 'create_external_table.sql'
+        )
+        self.cache_path = Path(
+            cache_path or dbt_dir / 'target' / 'external_tables.json'
+        )
+        self.project_id = project_id or os.getenv('GCP_PROJECT_ID')
+        self.bucket_name = bucket_name or os.getenv('GCS_BUCKET_NAME')
+        self.location = location or os.getenv('BQ_LOCATION')
+        self.mode = (mode or os.getenv('BQ_DDL_MODE', 'script')).lower()
+        if self.mode not in DDL_MODES:
+            raise ValueError(
+                f"BQ_DDL_MODE inválido: {self.mode} (use {', '.join(DDL_MODES)})"
+            )
+
+        self._client = None
+        self.last_jobs = 0
+
+    @property
+    def client(self):
+        """Cliente BigQuery criado na primeira execução de DDL e reutilizado"""
+        if self._client is None:
+            from google.cloud import bigquery
+
+            self._client = bigquery.Client(
+                project=self.project_id, location=self.location
+            )
+        return self._client
+
+    def render(self) -> str:
+        """
+        Lê o script DDL e substitui as variáveis de ambiente
+
+        Returns:
+            SQL pronto para execução
+        """
+        sql = self.sql_path.read_text(encoding='utf-8')
+        sql = sql.replace('${GCP_PROJECT_ID}', self.project_id or '')
+        return sql.replace('${GCS_BUCKET_NAME}', self.bucket_name or '')
+
+    @staticmethod
+    def fingerprint(statements: List[str]) -> str:
+        """Hash da definição, insensível a espaços e comentários"""
+        normalized = ';'.join(' '.join(s.split()) for s in statements)
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def _execute(self, statements: List[str]) -> int:
+        """
+        Executa as instruções e espera a conclusão
+
+        Returns:
+            Quantidade de jobs BigQuery criados
+        """
+        if self.mode == 'script':
+            # Script multi-instrução: um único job, uma única espera
+            self.client.query(';\n'.join(statements) + ';').result()
+            return 1
+
+        # Instruções independentes (CREATE SCHEMA precede as tabelas)
+        setup = [s for s in statements if s.upper().startswith('CREATE SCHEMA')]
+        tables = [s for s in statements if s not in setup]
+        for statement in setup:
+            self.client.query(statement).result()
+        jobs = [self.client.query(statement) for statement in tables]
+        with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as executor:
+            list(executor.map(lambda job: job.result(), jobs))
+        return len(setup) + len(jobs)
+
+    def apply(self, force: bool = False) -> bool:
+        """
+        Cria/atualiza as tabelas externas se a definição mudou
+
+        Args:
+            force: Executa mesmo com fingerprint igual ao aplicado (ex.:
+                tabela removida manualmente)
+
+        Returns:
+            True se o DDL foi executado, False se foi pulado
+        """
+        statements = split_statements(self.render())
+        fingerprint = self.fingerprint(statements)
+        cached = read_json(self.cache_path)
+
+        if not force and cached.get('fingerprint') == fingerprint:
+            self.last_jobs = 0
+            logger.info("Tabelas externas inalteradas, DDL pulado")
+            return False
+
+        start = time.perf_counter()
+        self.last_jobs = self._execute(statements)
+
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.cache_path, {
+            'fingerprint': fingerprint,
+            'applied_at': time.time(),
+        })
+        logger.success(
+            f"Tabelas externas criadas/atualizadas: {len(statements)} instruções "
+            f"em {self.last_jobs} jobs ({time.perf_counter() - start:.1f}s)"
+        )
+        return True
@@ -4,15 +4,56 @@ Gerencia upload de arquivos CSV para o GCS
 Arquitetura Medallion - Persistência na nuvem
 """
 
-from google.cloud import storage
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterable, List, Optional
 from loguru import logger
 import os
+import re
+import time
 from dotenv import load_dotenv
 
+from storage_backends import (
+    StorageBackend,
+    compute_checksums,
+    create_storage_backend,
+)
+
 load_dotenv()
 
+# Uploads resumable exigem chunk_size múltiplo de 256 KB
+CHUNK_SIZE_MULTIPLE = 256 * 1024
+
+# Data/hora no nome dos arquivos de janela (brt_data_YYYYMMDD_HHMM,
+# brt_consolidated_YYYYMMDD_HHMMSS)
+FILENAME_TIMESTAMP = re.compile(r'(\d{4})(\d{2})(\d{2})_(\d{2})\d{2}')
+
+
+def hive_partition_prefix(local_path: Path) -> Optional[str]:
+    """
+    Prefixo de partição Hive (dt=YYYY-MM-DD/hour=HH) de um arquivo de janela
+    
+    Usa os diretórios dt=/hour= do caminho local quando existem; caso
+    contrário, deriva a partição da data/hora no nome do arquivo.
+    
+    Args:
+        local_path: Caminho do arquivo local
+        
+    Returns:
+        Prefixo sem barra final, ou None se não for possível determinar
+    """
+    parts = Path(local_path).parts
+    dt = next((p for p in parts if p.startswith('dt=')), None)
+    hour = next((p for p in parts if p.startswith('hour=')), None)
+    if dt and hour:
+        return f"{dt}/{hour}"
+    
+    match = FILENAME_TIMESTAMP.search(Path(local_path).name)
+    if match is None:
+        return None
+    year, month, day, hour = match.groups()
+    return f"dt={year}-{month}-{day}/hour={hour}"
+
 
 class GCSManager:
     """Classe para gerenciar uploads no Google Cloud Storage"""
@@ -21,7 +62,8 @@ class GCSManager:
         self,
         bucket_name: Optional[str] = None,
         credentials_path: Optional[str] = None,
-        project_id: Optional[str] = None
+        project_id: Optional[str] = None,
+        backend: Optional[StorageBackend] = None
     ):
         """
         Inicializa o gerenciador GCS
@@ -30,6 +72,8 @@ class GCSManager:
             bucket_name: Nome do bucket GCS
             credentials_path: Caminho para arquivo de credenciais
             project_id: ID do projeto GCP
+            backend: Backend de armazenamento (padrão: STORAGE_BACKEND,
+                GCS real ou emulador local)
         """
         self.bucket_name = bucket_name or os.getenv('GCS_BUCKET_NAME')
         self.project_id = project_id or os.getenv('GCP_PROJECT_ID')
@@ -41,15 +85,20 @@ class GCSManager:
             logger.info(f"Credenciais GCP carregadas: {credentials_path}")
         
         try:
-            self.client = storage.Client(project=self.project_id)
-            self.bucket = self.client.bucket(self.bucket_name)
+            self.backend = backend or create_storage_backend(
+                self.bucket_name, project_id=self.project_id
+            )
+            self.bucket_name = self.backend.bucket_name
             logger.success(
                 f"GCS Manager inicializado - Bucket: {self.bucket_name}"
             )
         except Exception as e:
             logger.error(f"Erro ao inicializar GCS Client: {e}")
-            self.client = None
-            self.bucket = None
+            self.backend = None
+        
+        # Acesso direto ao cliente oficial (None no emulador local)
+        self.client = getattr(self.backend, 'client', None)
+        self.bucket = getattr(self.backend, 'bucket', None)
     
     def upload_file(
         self,
@@ -68,7 +117,7 @@ class GCSManager:
         Returns:
             URI público do arquivo ou None em caso de erro
         """
-        if not self.bucket:
+        if not self.backend:
             logger.error("Bucket GCS não inicializado")
             return None
         
@@ -84,15 +133,12 @@ class GCSManager:
                 destination_name = local_path.name
             
             blob_name = f"{gcs_folder}/{destination_name}"
-            blob = self.bucket.blob(blob_name)
+            gcs_uri = self.backend.uri(blob_name)
             
-            logger.info(f"Iniciando upload: {local_filepath} -> gs://{self.bucket_name}/{blob_name}")
+            logger.info(f"Iniciando upload: {local_filepath} -> {gcs_uri}")
             
             # Faz upload
-            blob.upload_from_filename(str(local_path))
-            
-            # URI do arquivo
-            gcs_uri = f"gs://{self.bucket_name}/{blob_name}"
+            self.backend.upload_file(local_path, blob_name)
             
             logger.success(f"Upload concluído: {gcs_uri}")
             
@@ -102,6 +148,191 @@ class GCSManager:
             logger.error(f"Erro ao fazer upload para GCS: {e}")
             return None
     
+    def _upload_one(
+        self,
+        local_path: Path,
+        blob_name: str,
+        chunk_size: int,
+        skip_existing: bool
+    ) -> Dict:
+        """
+        Envia um arquivo com upload resumable e validação de checksum
+        
+        Args:
+            local_path: Caminho do arquivo local
+            blob_name: Nome do objeto no bucket
+            chunk_size: Tamanho de cada chunk do upload resumable
+            skip_existing: Pula o envio se o objeto já existe com o mesmo hash
+            
+        Returns:
+            Dict com o resultado do arquivo
+        """
+        result = {
+            'local_path': str(local_path),
+            'blob_name': blob_name,
+            'gcs_uri': self.backend.uri(blob_name),
+            'status': 'failed',
+            'bytes': 0,
+            'seconds': 0.0,
+            'error': None,
+        }
+        start = time.perf_counter()
+        
+        try:
+            result['bytes'] = local_path.stat().st_size
+            md5_b64, crc_b64 = compute_checksums(local_path)
+            
+            if skip_existing:
+                existing = self.backend.get_object(blob_name)
+                if existing is not None and (
+                    (crc_b64 and existing['crc32c'] == crc_b64)
+                    or existing['md5_hash'] == md5_b64
+                ):
+                    result['status'] = 'skipped'
+                    return result
+            
+            self.backend.upload_file(
+                local_path,
+                blob_name,
+                chunk_size=chunk_size,
+                checksum='crc32c' if crc_b64 else 'md5'
+            )
+            result['status'] = 'uploaded'
+            
+        except Exception as e:
+            result['error'] = str(e)
+            logger.error(f"Erro ao enviar {local_path}: {e}")
+        finally:
+            result['seconds'] = round(time.perf_counter() - start, 3)
+        
+        return result
+    
+    def upload_files(
+        self,
+        local_filepaths: Iterable[str],
+        gcs_folder: str = 'brt-data',
+        base_dir: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        chunk_size_mb: Optional[int] = None,
+        skip_existing: bool = True,
+        partitioned: bool = True
+    ) -> List[Dict]:
+        """
+        Faz upload de vários arquivos em paralelo
+        
+        Cada arquivo usa upload resumable em chunks e é conferido por
+        checksum (CRC32C, ou MD5 sem google-crc32c); objetos que já existem
+        com o mesmo hash não são reenviados, então a chamada pode ser
+        repetida com segurança após uma falha parcial.
+        
+        Args:
+            local_filepaths: Caminhos dos arquivos locais
+            gcs_folder: Pasta no bucket GCS
+            base_dir: Se informado, preserva o caminho relativo a este
+                diretório no nome do objeto (ex.: dt=.../hour=.../)
+            max_workers: Uploads simultâneos
+            chunk_size_mb: Tamanho do chunk do upload resumable em MB
+            skip_existing: Pula arquivos já enviados com o mesmo hash
+            partitioned: Sem base_dir, grava cada arquivo sob o prefixo
+                dt=YYYY-MM-DD/hour=HH/ (particionamento Hive da tabela
+                externa)
+            
+        Returns:
+            Lista de dicts com status ('uploaded', 'skipped' ou 'failed'),
+            bytes, segundos e erro de cada arquivo
+        """
+        local_paths = [Path(p) for p in local_filepaths]
+        if not local_paths:
+            return []
+        
+        if not self.backend:
+            logger.error("Bucket GCS não inicializado")
+            return [
+                {
+                    'local_path': str(p), 'blob_name': None, 'gcs_uri': None,
+                    'status': 'failed', 'bytes': 0, 'seconds': 0.0,
+                    'error': 'Bucket GCS não inicializado',
+                }
+                for p in local_paths
+            ]
+        
+        max_workers = int(max_workers or os.getenv('GCS_UPLOAD_WORKERS', 8))
+        chunk_size_mb = float(
+            chunk_size_mb or os.getenv('GCS_UPLOAD_CHUNK_MB', 8)
+        )
+        chunk_size = max(
+            CHUNK_SIZE_MULTIPLE,
+            int(chunk_size_mb * 1024 * 1024) // CHUNK_SIZE_MULTIPLE
+            * CHUNK_SIZE_MULTIPLE
+        )
+        
+        def blob_name_for(local_path: Path) -> str:
+            if base_dir is not None:
+                relative = local_path.resolve().relative_to(
+                    Path(base_dir).resolve()
+                )
+                return f"{gcs_folder}/{relative.as_posix()}"
+            prefix = hive_partition_prefix(local_path) if partitioned else None
+            if prefix is not None:
+                return f"{gcs_folder}/{prefix}/{local_path.name}"
+            return f"{gcs_folder}/{local_path.name}"
+        
+        logger.info(
+            f"Iniciando upload de {len(local_paths)} arquivos "
+            f"({max_workers} em paralelo) -> {self.backend.uri(gcs_folder)}/"
+        )
+        start = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                lambda p: self._upload_one(
+                    p, blob_name_for(p), chunk_size, skip_existing
+                ),
+                local_paths
+            ))
+        
+        counts = {
+            status: sum(1 for r in results if r['status'] == status)
+            for status in ('uploaded', 'skipped', 'failed')
+        }
+        uploaded_bytes = sum(
+            r['bytes'] for r in results if r['status'] == 'uploaded'
+        )
+        logger.success(
+            f"Upload em lote concluído em {time.perf_counter() - start:.1f}s: "
+            f"{counts['uploaded']} enviados ({uploaded_bytes} bytes), "
+            f"{counts['skipped']} já existentes, {counts['failed']} falhas"
+        )
+        
+        return results
+    
+    def upload_directory(
+        self,
+        local_dir: str,
+        gcs_folder: str = 'brt-data',
+        pattern: str = '**/*',
+        **kwargs
+    ) -> List[Dict]:
+        """
+        Envia todos os arquivos de um diretório (ex.: backlog de data/silver)
+        
+        Args:
+            local_dir: Diretório local
+            gcs_folder: Pasta no bucket GCS
+            pattern: Padrão glob dos arquivos a enviar
+            **kwargs: Repassados para upload_files
+            
+        Returns:
+            Lista de resultados por arquivo (ver upload_files)
+        """
+        local_paths = [
+            p for p in sorted(Path(local_dir).glob(pattern))
+            if p.is_file() and not p.name.endswith('.tmp')
+        ]
+        return self.upload_files(
+            local_paths, gcs_folder=gcs_folder, base_dir=local_dir, **kwargs
+        )
+    
     def list_files(self, prefix: str = 'brt-data/') -> list:
         """
         Lista arquivos no bucket com determinado prefixo
@@ -112,13 +343,12 @@ class GCSManager:
         Returns:
             Lista de nomes de arquivos
         """
-        if not self.bucket:
+        if not self.backend:
             logger.error("Bucket GCS não inicializado")
             return []
         
         try:
-            blobs = self.client.list_blobs(self.bucket_name, prefix=prefix)
-            files = [blob.name for blob in blobs]
+            files = self.backend.list_objects(prefix=prefix)
             logger.info(f"Encontrados {len(files)} arquivos com prefixo '{prefix}'")
             return files
         except Exception as e:
@@ -135,13 +365,12 @@ class GCSManager:
         Returns:
             True se deletado com sucesso, False caso contrário
         """
-        if not self.bucket:
+        if not self.backend:
             logger.error("Bucket GCS não inicializado")
             return False
         
         try:
-            blob = self.bucket.blob(blob_name)
-            blob.delete()
+            self.backend.delete_object(blob_name)
             logger.success(f"Arquivo deletado: {blob_name}")
             return True
         except Exception as e:
@@ -158,18 +387,17 @@ class GCSManager:
         Returns:
             True se bucket existe ou foi criado, False em caso de erro
         """
+        if not self.backend:
+            logger.error("Bucket GCS não inicializado")
+            return False
+        
         try:
-            # Verifica se bucket existe
-            if self.client.lookup_bucket(self.bucket_name):
+            # Verifica se bucket existe e cria se necessário
+            if self.backend.ensure_bucket(location=location):
                 logger.info(f"Bucket já existe: {self.bucket_name}")
                 return True
             
-            # Cria bucket
-            bucket = self.client.create_bucket(
-                self.bucket_name,
-                location=location
-            )
-            self.bucket = bucket
+            self.bucket = getattr(self.backend, 'bucket', None)
             logger.success(f"Bucket criado: {self.bucket_name} em {location}")
             return True
             
@@ -193,7 +421,7 @@ def main():
     # Inicializa manager
     gcs = GCSManager()
     
-    if gcs.bucket:
+    if gcs.backend:
         # Upload
         print(f"Fazendo upload de: {test_file}")
         uri = gcs.upload_file(test_file, gcs_folder='test')
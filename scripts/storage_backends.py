@@ -0,0 +1,442 @@
+"""
+Backends de armazenamento de objetos do pipeline BRT
+Interface comum para o Google Cloud Storage e um emulador em sistema de arquivos
+Arquitetura Medallion - Persistência na nuvem (ou local para testes de carga)
+"""
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+import base64
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from brt_state_files import write_json_atomic
+
+# Trava entre processos do emulador é opcional (indisponível no Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Uma trava por objeto do emulador, compartilhada entre instâncias
+_BLOB_LOCKS: Dict[str, threading.Lock] = {}
+_BLOB_LOCKS_GUARD = threading.Lock()
+
+
+def compute_checksums(filepath: Path) -> Tuple[str, Optional[str]]:
+    """
+    Calcula MD5 e CRC32C (base64, formato do GCS) de um arquivo local
+
+    Args:
+        filepath: Caminho do arquivo
+
+    Returns:
+        Tuple (md5, crc32c); crc32c é None se google-crc32c não estiver
+        disponível
+    """
+    try:
+        import google_crc32c
+        crc = google_crc32c.Checksum()
+    except ImportError:
+        crc = None
+
+    md5 = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+            if crc is not None:
+                crc.update(chunk)
+
+    md5_b64 = base64.b64encode(md5.digest()).decode('ascii')
+    crc_b64 = (
+        base64.b64encode(crc.digest()).decode('ascii')
+        if crc is not None else None
+    )
+    return md5_b64, crc_b64
+
+
+class PreconditionFailed(Exception):
+    """Precondição de geração (if_generation_match) não atendida"""
+
+
+class ChecksumMismatch(Exception):
+    """Conteúdo gravado difere do arquivo de origem (md5/crc32c)"""
+
+
+class StorageBackend(ABC):
+    """Interface de armazenamento usada pelo GCSManager"""
+
+    scheme = 'gs'
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+
+    def uri(self, blob_name: str) -> str:
+        """URI do objeto no backend"""
+        return f"{self.scheme}://{self.bucket_name}/{blob_name}"
+
+    @abstractmethod
+    def upload_file(
+        self,
+        local_path: Path,
+        blob_name: str,
+        chunk_size: Optional[int] = None,
+        checksum: Optional[str] = None,
+        if_generation_match: Optional[int] = None
+    ) -> Dict:
+        """
+        Envia arquivo local para o objeto blob_name
+
+        Args:
+            local_path: Caminho do arquivo local
+            blob_name: Nome do objeto
+            chunk_size: Tamanho do chunk (upload resumable quando informado)
+            checksum: Validação de integridade ('md5', 'crc32c' ou None)
+            if_generation_match: Só grava se a geração atual for esta
+                (0 = objeto não pode existir)
+
+        Returns:
+            Metadados do objeto gravado (ver get_object)
+        """
+
+    @abstractmethod
+    def get_object(self, blob_name: str) -> Optional[Dict]:
+        """
+        Retorna metadados do objeto ou None se não existir
+
+        Returns:
+            Dict com name, size, md5_hash, crc32c e generation
+        """
+
+    @abstractmethod
+    def list_objects(self, prefix: str = '') -> List[str]:
+        """Lista nomes de objetos com o prefixo"""
+
+    @abstractmethod
+    def delete_object(self, blob_name: str) -> None:
+        """Remove o objeto (erro se não existir)"""
+
+    @abstractmethod
+    def ensure_bucket(self, location: str = 'US') -> bool:
+        """Cria o bucket se necessário; retorna True se já existia"""
+
+
+class GCSStorageBackend(StorageBackend):
+    """Backend sobre o cliente oficial google-cloud-storage"""
+
+    def __init__(self, bucket_name: str, project_id: Optional[str] = None):
+        from google.cloud import storage
+
+        super().__init__(bucket_name)
+        self.client = storage.Client(project=project_id)
+        self.bucket = self.client.bucket(bucket_name)
+
+    @staticmethod
+    def _metadata(blob) -> Dict:
+        """Metadados de um blob no formato de get_object"""
+        return {
+            'name': blob.name,
+            'size': blob.size,
+            'md5_hash': blob.md5_hash,
+            'crc32c': blob.crc32c,
+            'generation': blob.generation,
+        }
+
+    def upload_file(
+        self,
+        local_path: Path,
+        blob_name: str,
+        chunk_size: Optional[int] = None,
+        checksum: Optional[str] = None,
+        if_generation_match: Optional[int] = None
+    ) -> Dict:
+        """
+        Envia o arquivo com Blob.upload_from_filename
+
+        O cliente valida o checksum informado e aplica if_generation_match
+        no servidor (google.api_core.exceptions.PreconditionFailed).
+        """
+        blob = self.bucket.blob(blob_name, chunk_size=chunk_size)
+        blob.upload_from_filename(
+            str(local_path),
+            checksum=checksum,
+            if_generation_match=if_generation_match
+        )
+        return self._metadata(blob)
+
+    def get_object(self, blob_name: str) -> Optional[Dict]:
+        """Metadados do blob ou None se não existir"""
+        blob = self.bucket.get_blob(blob_name)
+        return self._metadata(blob) if blob is not None else None
+
+    def list_objects(self, prefix: str = '') -> List[str]:
+        """Lista nomes de blobs com o prefixo (paginação feita pelo cliente)"""
+        return [
+            blob.name
+            for blob in self.client.list_blobs(self.bucket_name, prefix=prefix)
+        ]
+
+    def delete_object(self, blob_name: str) -> None:
+        """Remove o blob (google.api_core.exceptions.NotFound se não existir)"""
+        self.bucket.blob(blob_name).delete()
+
+    def ensure_bucket(self, location: str = 'US') -> bool:
+        """Cria o bucket na localização informada se ainda não existir"""
+        if self.client.lookup_bucket(self.bucket_name):
+            return True
+        self.bucket = self.client.create_bucket(
+            self.bucket_name, location=location
+        )
+        return False
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Emulador do GCS em sistema de arquivos
+
+    Objetos ficam em <root>/<bucket>/<blob_name> e metadados (geração,
+    hashes) em <root>/<bucket>/.metadata/<blob_name>.json. A gravação é
+    atômica, cada sobrescrita incrementa a geração e a latência por
+    operação pode ser injetada para testes de carga.
+
+    Como no GCS, if_generation_match é verificado e aplicado de forma
+    atômica (trava por objeto, também entre processos onde há fcntl) e o
+    checksum pedido é validado contra o arquivo de origem.
+    """
+
+    scheme = 'file'
+
+    def __init__(
+        self,
+        bucket_name: str,
+        root_dir: Optional[str] = None,
+        latency_ms: Optional[float] = None,
+        latency_jitter_ms: Optional[float] = None,
+        bandwidth_mbps: Optional[float] = None
+    ):
+        """
+        Inicializa o emulador
+
+        Args:
+            bucket_name: Nome do bucket emulado
+            root_dir: Diretório raiz dos buckets
+            latency_ms: Latência fixa por operação
+            latency_jitter_ms: Variação aleatória máxima da latência
+            bandwidth_mbps: Banda simulada de upload (None = ilimitada)
+        """
+        super().__init__(bucket_name)
+        self.root_dir = Path(
+            root_dir or os.getenv('LOCAL_STORAGE_ROOT', './data/gcs_emulator')
+        )
+        self.bucket_dir = self.root_dir / bucket_name
+        self.metadata_dir = self.bucket_dir / '.metadata'
+        self.latency_ms = float(
+            latency_ms if latency_ms is not None
+            else os.getenv('LOCAL_STORAGE_LATENCY_MS', 0)
+        )
+        self.latency_jitter_ms = float(
+            latency_jitter_ms if latency_jitter_ms is not None
+            else os.getenv('LOCAL_STORAGE_LATENCY_JITTER_MS', 0)
+        )
+        self.bandwidth_mbps = bandwidth_mbps or (
+            float(os.getenv('LOCAL_STORAGE_BANDWIDTH_MBPS'))
+            if os.getenv('LOCAL_STORAGE_BANDWIDTH_MBPS') else None
+        )
+
+    def uri(self, blob_name: str) -> str:
+        return f"file://{(self.bucket_dir / blob_name).resolve().as_posix()}"
+
+    def _sleep(self, size_bytes: int = 0) -> None:
+        """Injeta latência e tempo de transferência simulados"""
+        delay = self.latency_ms + random.uniform(0, self.latency_jitter_ms)
+        if self.bandwidth_mbps:
+            delay += size_bytes * 8 / (self.bandwidth_mbps * 1e6) * 1000
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _object_path(self, blob_name: str) -> Path:
+        return self.bucket_dir / blob_name
+
+    def _metadata_path(self, blob_name: str) -> Path:
+        return self.metadata_dir / f"{blob_name}.json"
+
+    @contextmanager
+    def _blob_lock(self, blob_name: str):
+        """Serializa escritas de um mesmo objeto (threads e processos)"""
+        key = str(self._object_path(blob_name).resolve())
+        with _BLOB_LOCKS_GUARD:
+            lock = _BLOB_LOCKS.setdefault(key, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            lock_path = self.metadata_dir / f"{blob_name}.lock"
+            lock_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def upload_file(
+        self,
+        local_path: Path,
+        blob_name: str,
+        chunk_size: Optional[int] = None,
+        checksum: Optional[str] = None,
+        if_generation_match: Optional[int] = None
+    ) -> Dict:
+        local_path = Path(local_path)
+        self._sleep(local_path.stat().st_size)
+        source_md5, source_crc = (
+            compute_checksums(local_path) if checksum else (None, None)
+        )
+
+        object_path = self._object_path(blob_name)
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._blob_lock(blob_name):
+            current = self.get_object(blob_name, _simulate_latency=False)
+            if if_generation_match is not None:
+                current_generation = current['generation'] if current else 0
+                if current_generation != if_generation_match:
+                    raise PreconditionFailed(
+                        f"{blob_name}: geração {current_generation} != "
+                        f"{if_generation_match}"
+                    )
+
+            # Temporário exclusivo: list_objects ignora '.uploading'
+            fd, tmp_name = tempfile.mkstemp(
+                dir=object_path.parent,
+                prefix=f"{object_path.name}.",
+                suffix='.uploading'
+            )
+            os.close(fd)
+            tmp_path = Path(tmp_name)
+            try:
+                shutil.copyfile(local_path, tmp_path)
+                md5_b64, crc_b64 = compute_checksums(tmp_path)
+                self._verify_checksum(
+                    blob_name, checksum,
+                    (source_md5, source_crc), (md5_b64, crc_b64)
+                )
+                tmp_path.replace(object_path)
+            except BaseException:
+                tmp_path.unlink(missing_ok=True)
+                raise
+
+            metadata = {
+                'name': blob_name,
+                'size': object_path.stat().st_size,
+                'md5_hash': md5_b64,
+                'crc32c': crc_b64,
+                # Gerações do GCS são crescentes por objeto
+                'generation': max(
+                    time.time_ns() // 1000,
+                    (current['generation'] + 1) if current else 0
+                ),
+            }
+            metadata_path = self._metadata_path(blob_name)
+            metadata_path.parent.mkdir(parents=True, exist_ok=True)
+            # get_object concorrente nunca vê o JSON pela metade
+            write_json_atomic(metadata_path, metadata)
+        return metadata
+
+    @staticmethod
+    def _verify_checksum(
+        blob_name: str,
+        checksum: Optional[str],
+        source: Tuple[Optional[str], Optional[str]],
+        stored: Tuple[Optional[str], Optional[str]]
+    ) -> None:
+        """
+        Compara o hash pedido (md5 ou crc32c) da origem e do gravado
+
+        Sem google-crc32c, 'crc32c' é validado por MD5.
+
+        Raises:
+            ChecksumMismatch: Conteúdo gravado difere da origem
+        """
+        if not checksum:
+            return
+        index = 1 if checksum == 'crc32c' and source[1] is not None else 0
+        if source[index] != stored[index]:
+            raise ChecksumMismatch(
+                f"{blob_name}: {checksum} {stored[index]} != {source[index]}"
+            )
+
+    def get_object(
+        self,
+        blob_name: str,
+        _simulate_latency: bool = True
+    ) -> Optional[Dict]:
+        if _simulate_latency:
+            self._sleep()
+        metadata_path = self._metadata_path(blob_name)
+        if not self._object_path(blob_name).exists() or not metadata_path.exists():
+            return None
+        return json.loads(metadata_path.read_text(encoding='utf-8'))
+
+    def list_objects(self, prefix: str = '') -> List[str]:
+        self._sleep()
+        if not self.bucket_dir.exists():
+            return []
+        names = []
+        for path in self.bucket_dir.rglob('*'):
+            if not path.is_file() or path.name.endswith('.uploading'):
+                continue
+            relative = path.relative_to(self.bucket_dir)
+            if relative.parts[0] == '.metadata':
+                continue
+            name = relative.as_posix()
+            if name.startswith(prefix):
+                names.append(name)
+        return sorted(names)
+
+    def delete_object(self, blob_name: str) -> None:
+        self._sleep()
+        object_path = self._object_path(blob_name)
+        with self._blob_lock(blob_name):
+            if not object_path.exists():
+                raise FileNotFoundError(f"Objeto não encontrado: {blob_name}")
+            object_path.unlink()
+            self._metadata_path(blob_name).unlink(missing_ok=True)
+
+    def ensure_bucket(self, location: str = 'US') -> bool:
+        existed = self.bucket_dir.exists()
+        self.bucket_dir.mkdir(parents=True, exist_ok=True)
+        return existed
+
+
+def create_storage_backend(
+    bucket_name: str,
+    project_id: Optional[str] = None,
+    backend: Optional[str] = None
+) -> StorageBackend:
+    """
+    Cria o backend configurado em STORAGE_BACKEND ('gcs' ou 'local')
+
+    Args:
+        bucket_name: Nome do bucket
+        project_id: ID do projeto GCP (apenas 'gcs')
+        backend: Sobrescreve STORAGE_BACKEND
+
+    Returns:
+        Instância de StorageBackend
+    """
+    backend = (backend or os.getenv('STORAGE_BACKEND', 'gcs')).lower()
+    if backend == 'local':
+        logger.info("Usando emulador local de storage (STORAGE_BACKEND=local)")
+        return LocalStorageBackend(bucket_name)
+    if backend == 'gcs':
+        return GCSStorageBackend(bucket_name, project_id=project_id)
+    raise ValueError(f"Backend de storage inválido: {backend} (use gcs ou local)")
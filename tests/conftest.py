@@ -0,0 +1,6 @@
+"""Configuração dos testes: os módulos de scripts/ são importados pelo nome"""
+
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'scripts'))
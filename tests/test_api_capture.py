@@ -0,0 +1,76 @@
+"""Testes da captura da API BRT (scripts/brt_api_capture.py)"""
+
+import json
+
+import pandas as pd
+import pytest
+
+from brt_api_capture import BRTAPICapture, decode_with_raw_slices
+
+
+def test_filter_delta_counts_duplicates_in_the_same_response():
+    capture = BRTAPICapture()
+    df = pd.DataFrame({
+        'vehicle_id': ['1', '1', '2'],
+        'timestamp_gps': [10, 10, 5],
+    })
+
+    delta = capture.filter_delta(df)
+
+    assert len(delta) == 2
+    assert capture.delta_stats == {
+        'rows_in': 3, 'rows_emitted': 2, 'rows_suppressed': 1
+    }
+
+    capture.filter_delta(pd.DataFrame({
+        'vehicle_id': ['1', '2'], 'timestamp_gps': [10, 6],
+    }))
+    assert capture.delta_stats == {
+        'rows_in': 5, 'rows_emitted': 3, 'rows_suppressed': 2
+    }
+
+
+def test_failed_fetch_clears_previous_payload():
+    capture = BRTAPICapture(api_url='http://127.0.0.1:9/gps')
+    capture.last_raw_bytes = b'[{"codigo": "1"}]'
+    capture.last_raw_slices = ['{"codigo": "1"}']
+
+    assert capture.fetch_data() is None
+    assert capture.last_raw_bytes is None
+    assert capture.last_raw_slices is None
+
+
+def test_failed_capture_clears_previous_network():
+    capture = BRTAPICapture(api_url='http://127.0.0.1:9/gps')
+    capture.last_network = {'segments': pd.DataFrame(), 'stops': pd.DataFrame()}
+
+    assert capture.capture_and_process().empty
+    assert capture.last_network == {}
+
+
+@pytest.mark.parametrize('payload', [
+    b'{"veiculos":[{"codigo":"1"},{"codigo":"2"}]}',
+    b' [ {"codigo": "1"} , {"codigo": "2"} ] \n',
+    b'{"total": 2, "veiculos": [{"codigo": "1"}, {"codigo": "2"}], "ok": true}',
+    b'{"veiculos": []}',
+    b'{"status": "sem dados"}',
+])
+def test_decode_with_raw_slices_matches_json_loads(payload):
+    data, slices = decode_with_raw_slices(payload)
+
+    assert data == json.loads(payload)
+    if slices is not None:
+        vehicles = data['veiculos'] if isinstance(data, dict) else data
+        assert [json.loads(s) for s in slices] == vehicles
+
+
+@pytest.mark.parametrize('payload', [
+    b'{"veiculos":[{"codigo":"1"}]',
+    b'{"veiculos":[{"codigo":"1"}',
+    b'{"veiculos":[{"codigo":"1"}]}garbage',
+    b'[{"codigo":"1"}]]',
+    b'{"veiculos":[{"codigo":"1"}] "x": 1}',
+])
+def test_decode_with_raw_slices_rejects_invalid_payload(payload):
+    with pytest.raises(ValueError):
+        decode_with_raw_slices(payload)
@@ -0,0 +1,120 @@
+"""Testes do backfill histórico (scripts/brt_backfill.py)"""
+
+from pathlib import Path
+
+import pandas as pd
+
+from brt_backfill import run_backfill
+
+
+def write_legacy_file(path: Path, capture_times: list, first_vehicle: int) -> None:
+    """Grava um CSV antigo (raw_data em repr Python) com um veículo por linha"""
+    rows = []
+    for offset, capture_time in enumerate(capture_times):
+        capture_time = pd.Timestamp(capture_time)
+        vehicle = {
+            'codigo': str(first_vehicle + offset),
+            'placa': '',
+            'linha': '22',
+            'latitude': -23.0 + offset * 1e-4,
+            'longitude': -43.3 - offset * 1e-4,
+            'dataHora': int(capture_time.timestamp() * 1000) - 30000,
+            'velocidade': 30.0,
+            'sentido': 'ida',
+            'trajeto': '22 - ALVORADA X JARDIM OCEÂNICO (PARADOR) [IDA]',
+        }
+        rows.append({
+            'timestamp': capture_time.isoformat(),
+            'vehicle_id': vehicle['codigo'],
+            'line': vehicle['linha'],
+            'latitude': vehicle['latitude'],
+            'longitude': vehicle['longitude'],
+            'speed': vehicle['velocidade'],
+            'gps_timestamp': vehicle['dataHora'],
+            'placa': vehicle['placa'],
+            'sentido': vehicle['sentido'],
+            'trajeto': vehicle['trajeto'],
+            'raw_data': repr(vehicle),
+        })
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def read_output(directory: Path) -> pd.DataFrame:
+    files = sorted(directory.rglob('brt_data_*.csv'))
+    return pd.concat([pd.read_csv(f) for f in files], ignore_index=True)
+
+
+def test_rows_after_midnight_go_to_the_next_day(tmp_path, monkeypatch):
+    monkeypatch.setenv('RAW_DATA_MODE', 'inline')
+    source = tmp_path / 'bronze'
+    source.mkdir()
+    # Arquivo do dia 27 cuja última captura já é do dia 28
+    write_legacy_file(
+        source / 'brt_data_20251027_2355.csv',
+        ['2025-10-27T23:55:10'] * 50 + ['2025-10-28T00:03:10'] * 50,
+        first_vehicle=900000
+    )
+    write_legacy_file(
+        source / 'brt_data_20251028_0005.csv',
+        ['2025-10-28T00:05:10'] * 100,
+        first_vehicle=910000
+    )
+    output = tmp_path / 'backfill'
+
+    totals = run_backfill(
+        source_dir=str(source),
+        output_dir=str(output),
+        workers=1,
+        aggregation_minutes=10,
+        output_format='csv',
+        event_time_column='capture_timestamp'
+    )
+
+    assert totals['failed_units'] == [] and totals['failed_dates'] == []
+    assert totals['input_rows'] == 200
+    assert totals['output_rows'] == 200
+
+    silver = read_output(output / 'silver')
+    assert len(silver) == 200
+    windows = sorted(p.name for p in (output / 'silver').rglob('brt_data_*.csv'))
+    assert windows == [
+        'brt_data_20251027_2350.csv',
+        'brt_data_20251028_0000.csv',
+    ]
+    assert sorted(p.name for p in (output / 'silver').glob('dt=*')) == [
+        'dt=2025-10-27', 'dt=2025-10-28'
+    ]
+    next_day = read_output(output / 'silver' / 'dt=2025-10-28')
+    assert len(next_day) == 150
+
+
+def test_rerun_resumes_from_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setenv('RAW_DATA_MODE', 'inline')
+    source = tmp_path / 'bronze'
+    source.mkdir()
+    write_legacy_file(
+        source / 'brt_data_20251027_2355.csv',
+        ['2025-10-27T23:55:10'] * 10 + ['2025-10-28T00:03:10'] * 10,
+        first_vehicle=900000
+    )
+    output = tmp_path / 'backfill'
+    kwargs = dict(
+        source_dir=str(source), output_dir=str(output), workers=1,
+        aggregation_minutes=10, output_format='csv',
+        event_time_column='capture_timestamp'
+    )
+    assert run_backfill(**kwargs)['output_rows'] == 20
+
+    rerun = run_backfill(**kwargs)
+    assert rerun['units'] == 0 and rerun['dates'] == 0
+
+    write_legacy_file(
+        source / 'brt_data_20251028_0005.csv',
+        ['2025-10-28T00:05:10'] * 5,
+        first_vehicle=910000
+    )
+    # Só a partição nova é lida, mas a data 28 é reagregada por inteiro
+    rerun = run_backfill(**kwargs)
+    assert rerun['units'] == 1
+    assert rerun['dates'] == 1 and rerun['output_rows'] == 15
+    assert len(read_output(output / 'silver' / 'dt=2025-10-28')) == 15
@@ -0,0 +1,137 @@
+"""Testes das janelas de tempo de evento (scripts/brt_data_aggregator.py)"""
+
+import pandas as pd
+import pytest
+
+from brt_data_aggregator import BRTDataAggregator
+
+
+@pytest.fixture(autouse=True)
+def aggregator_env(monkeypatch):
+    for name in ('AGGREGATION_MINUTES', 'ALLOWED_LATENESS_SECONDS',
+                 'MAX_EVENT_TIME_SKEW_SECONDS', 'EVENT_TIME_COLUMN'):
+        monkeypatch.delenv(name, raising=False)
+
+
+def make_aggregator(data_dir, **kwargs) -> BRTDataAggregator:
+    options = dict(
+        aggregation_minutes=10,
+        data_dir=str(data_dir),
+        output_format='csv',
+        event_time_column='capture_timestamp',
+        allowed_lateness_seconds=0,
+        stream_metrics=False,
+        trajectories=False,
+        heatmap=False,
+    )
+    options.update(kwargs)
+    return BRTDataAggregator(**options)
+
+
+def capture(timestamp, vehicles: int = 3) -> pd.DataFrame:
+    """Uma captura com `vehicles` veículos no instante `timestamp`"""
+    timestamp = pd.Timestamp(timestamp)
+    return pd.DataFrame({
+        'capture_timestamp': [timestamp] * vehicles,
+        'vehicle_id': [str(900000 + i) for i in range(vehicles)],
+        'line': ['22'] * vehicles,
+        'latitude': [-22.95] * vehicles,
+        'longitude': [-43.35] * vehicles,
+        'speed': [30.0] * vehicles,
+        'timestamp_gps': [int(timestamp.timestamp() * 1000)] * vehicles,
+    })
+
+
+def test_window_closes_when_watermark_passes_its_end(tmp_path):
+    aggregator = make_aggregator(tmp_path)
+
+    assert not aggregator.add_data(capture('2025-10-27 10:01'))
+    assert not aggregator.add_data(capture('2025-10-27 10:09'))
+    assert aggregator.add_data(capture('2025-10-27 10:10'))
+
+    saved = aggregator.save_ready_windows()
+    assert [p.split('/')[-1] for p in saved] == ['brt_data_20251027_1000.csv']
+    assert len(pd.read_csv(saved[0])) == 6
+    assert list(aggregator.windows) == [pd.Timestamp('2025-10-27 10:10')]
+
+
+def test_allowed_lateness_delays_closing(tmp_path):
+    aggregator = make_aggregator(tmp_path, allowed_lateness_seconds=120)
+
+    assert not aggregator.add_data(capture('2025-10-27 10:05'))
+    assert not aggregator.add_data(capture('2025-10-27 10:11'))
+    assert aggregator.add_data(capture('2025-10-27 10:12'))
+
+
+def test_rows_of_a_closed_window_are_late(tmp_path):
+    aggregator = make_aggregator(tmp_path)
+    aggregator.add_data(capture('2025-10-27 10:05'))
+    aggregator.add_data(capture('2025-10-27 10:20'))
+    aggregator.save_ready_windows()
+
+    aggregator.add_data(capture('2025-10-27 10:08', vehicles=2))
+
+    assert aggregator.late_rows == 2
+    assert pd.Timestamp('2025-10-27 10:00') not in aggregator.windows
+
+
+def test_future_event_time_does_not_advance_watermark(tmp_path):
+    aggregator = make_aggregator(tmp_path, max_clock_skew_seconds=300)
+    now = pd.Timestamp.now().floor('min')
+    aggregator.add_data(capture(now - pd.Timedelta(minutes=1)))
+    watermark = aggregator.watermark
+
+    # Um veículo com o relógio um dia adiantado
+    batch = pd.concat([
+        capture(now, vehicles=3),
+        capture(now + pd.Timedelta(days=1), vehicles=1),
+    ], ignore_index=True)
+    aggregator.add_data(batch)
+
+    assert aggregator.future_rows == 1
+    assert watermark <= aggregator.watermark <= now
+    aggregator.add_data(capture(now + pd.Timedelta(seconds=30)))
+    assert aggregator.late_rows == 0
+
+
+def test_watermark_survives_restart_and_future_state_is_clamped(tmp_path):
+    aggregator = make_aggregator(tmp_path)
+    aggregator.add_data(capture('2025-10-27 10:05'))
+
+    restored = make_aggregator(tmp_path)
+    assert restored.max_event_time == pd.Timestamp('2025-10-27 10:05')
+    assert list(restored.windows) == [pd.Timestamp('2025-10-27 10:00')]
+
+    # state.json gravado por um relógio adiantado antes do limite existir
+    restored.max_event_time = pd.Timestamp.now() + pd.Timedelta(days=365)
+    restored._save_state()
+    clamped = make_aggregator(tmp_path, max_clock_skew_seconds=300)
+    assert clamped.max_event_time <= pd.Timestamp.now() + pd.Timedelta(seconds=300)
+
+
+def test_network_summaries_are_written_once_per_closed_window(tmp_path):
+    aggregator = make_aggregator(tmp_path)
+
+    def network(timestamp):
+        segments = pd.DataFrame({
+            'shape_id': ['s1'], 'shape_line': ['22'], 'segment_index': [0],
+            'vehicles': [2], 'speed_count': [2], 'avg_speed_kmh': [25.0],
+            'min_speed_kmh': [20.0], 'max_speed_kmh': [30.0],
+            'segment_start_m': [0.0],
+            'capture_timestamp': [pd.Timestamp(timestamp)],
+        })
+        return {'segments': segments, 'stops': segments.iloc[0:0]}
+
+    for minute in range(10):
+        timestamp = f'2025-10-27 10:{minute:02d}'
+        aggregator.add_data(capture(timestamp), network=network(timestamp))
+    aggregator.add_data(
+        capture('2025-10-27 10:10'), network=network('2025-10-27 10:10')
+    )
+    aggregator.save_ready_windows()
+
+    files = sorted((tmp_path / 'gold' / 'network').rglob('*.parquet'))
+    assert [f.name for f in files] == ['brt_segments_20251027_1000.parquet']
+    segments = pd.read_parquet(files[0])
+    assert segments['captures'].tolist() == [10]
+    assert list(aggregator.networks) == [pd.Timestamp('2025-10-27 10:10')]
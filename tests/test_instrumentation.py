@@ -0,0 +1,55 @@
+"""Testes da instrumentação do pipeline (scripts/brt_instrumentation.py)"""
+
+import threading
+import time
+
+from brt_instrumentation import PipelineMetrics
+
+
+def test_flow_record_reports_task_seconds_and_share(tmp_path):
+    metrics = PipelineMetrics(str(tmp_path))
+    metrics.start_run('brt')
+    with metrics.measure('upload_to_gcs') as record:
+        time.sleep(0.02)
+        record['files'] = 3
+    with metrics.measure('upload_to_gcs'):
+        time.sleep(0.02)
+
+    run = metrics.finish_run('Success')
+
+    assert run['files'] == 3
+    assert set(run['task_wall_seconds']) == {'upload_to_gcs'}
+    assert run['task_wall_seconds']['upload_to_gcs'] >= 0.04
+    assert 0 < run['task_share']['upload_to_gcs'] <= 1
+    assert 'brt_task_files_total{task="upload_to_gcs"} 3' in metrics.render_prometheus()
+
+
+def _burn_cpu(seconds: float) -> None:
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+def test_task_cpu_excludes_other_threads(tmp_path):
+    metrics = PipelineMetrics(str(tmp_path))
+    stop = threading.Event()
+
+    def busy():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy)
+    worker.start()
+    try:
+        metrics.start_run('brt')
+        with metrics.measure('capture_brt_data') as record:
+            _burn_cpu(0.05)
+            time.sleep(0.2)
+        run = metrics.finish_run('Success')
+    finally:
+        stop.set()
+        worker.join()
+
+    assert 0.04 <= record['cpu_seconds'] < 0.12
+    assert record['process_cpu_seconds'] > record['cpu_seconds'] + 0.05
+    assert run['cpu_seconds'] < 0.15
@@ -0,0 +1,67 @@
+"""Testes do motor local Silver/Gold (scripts/local_engine.py)"""
+
+from pathlib import Path
+
+import pandas as pd
+
+from local_engine import LocalEngine, read_gold
+
+
+def write_window(silver_dir: Path, dt: str, name: str, captures: list, first_vehicle: int) -> None:
+    """Grava um arquivo de janela no layout dt=/hour= do agregador"""
+    rows = [
+        {
+            'capture_timestamp': pd.Timestamp(capture).isoformat(),
+            'vehicle_id': str(first_vehicle + offset),
+            'line': '22',
+            'latitude': -22.95,
+            'longitude': -43.35,
+            'speed': 30.0,
+            'timestamp_gps': int(pd.Timestamp(capture).timestamp() * 1000),
+        }
+        for offset, capture in enumerate(captures)
+    ]
+    directory = silver_dir / f"dt={dt}" / f"hour={name[-4:-2]}"
+    directory.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(rows).to_csv(directory / f"brt_data_{name}.csv", index=False)
+
+
+def observations_by_date(gold_dir: Path) -> dict:
+    gold = read_gold(str(gold_dir))
+    totals = gold.groupby('date_partition')['total_observations'].sum()
+    return {str(date): int(total) for date, total in totals.items()}
+
+
+def test_utc_partition_keeps_previous_local_day(tmp_path):
+    silver = tmp_path / 'silver'
+    gold = tmp_path / 'gold'
+    # EVENT_TIME_COLUMN=timestamp_gps: capturas das 21h-24h locais do dia 27
+    # caem na partição UTC do dia 28
+    write_window(silver, '2025-10-27', '20251027_1500', ['2025-10-27T12:00:00'] * 10, 1000)
+    write_window(silver, '2025-10-28', '20251028_0010', ['2025-10-27T21:10:00'] * 5, 2000)
+    write_window(silver, '2025-10-28', '20251028_1500', ['2025-10-28T12:00:00'] * 7, 3000)
+
+    stats = LocalEngine(silver_dir=str(silver), gold_dir=str(gold)).run()
+
+    assert stats['late_rows'] == 0
+    assert stats['silver_rows'] == 22
+    assert observations_by_date(gold) == {'2025-10-27': 15, '2025-10-28': 7}
+
+
+def test_rows_of_a_written_day_reprocess_it(tmp_path):
+    silver = tmp_path / 'silver'
+    gold = tmp_path / 'gold'
+    write_window(silver, '2025-10-26', '20251026_1500', ['2025-10-26T12:00:00'] * 4, 1000)
+    write_window(silver, '2025-10-27', '20251027_1500', ['2025-10-27T12:00:00'] * 10, 2000)
+    write_window(silver, '2025-10-28', '20251028_1500', ['2025-10-28T12:00:00'] * 7, 3000)
+    # Relógio muito atrasado: registro do dia 26 dois dias depois
+    write_window(silver, '2025-10-28', '20251028_1510', ['2025-10-26T12:30:00'] * 3, 4000)
+
+    stats = LocalEngine(silver_dir=str(silver), gold_dir=str(gold)).run()
+
+    assert stats['late_rows'] == 3
+    assert stats['reprocessed_days'] == 1
+    assert stats['gold_partitions'] == 3
+    assert observations_by_date(gold) == {
+        '2025-10-26': 7, '2025-10-27': 10, '2025-10-28': 7
+    }
@@ -0,0 +1,62 @@
+"""Testes do índice espacial do map-matching (scripts/brt_map_matching.py)"""
+
+import numpy as np
+import pandas as pd
+
+from brt_map_matching import GridIndex, WindowNetwork
+
+
+def test_query_returns_only_existing_candidates():
+    # Item 0 é um ponto; item 1 atravessa várias células
+    index = GridIndex(
+        xmin=np.array([0.0, 0.0]),
+        ymin=np.array([0.0, 500.0]),
+        xmax=np.array([0.0, 1000.0]),
+        ymax=np.array([0.0, 500.0]),
+        cell_size=100.0
+    )
+
+    point, item = index.query(np.array([50.0, 950.0, 5000.0]), np.array([50.0, 450.0, 5000.0]))
+
+    assert set(zip(point.tolist(), item.tolist())) == {(0, 0), (1, 1)}
+    assert np.all(np.diff(point) >= 0)
+    # Sem preenchimento: memória proporcional aos pares encontrados
+    assert len(index.items) == 1 + 11
+
+
+def summary(timestamp, vehicles, speeds, dwell):
+    """Resumo de uma captura com um trecho e uma parada ocupados"""
+    timestamp = pd.Timestamp(timestamp)
+    speeds = pd.Series(speeds, dtype='float64')
+    return {
+        'segments': pd.DataFrame({
+            'shape_id': ['s1'], 'shape_line': ['22'], 'segment_index': [3],
+            'vehicles': [vehicles], 'speed_count': [int(speeds.count())],
+            'avg_speed_kmh': [speeds.mean()], 'min_speed_kmh': [speeds.min()],
+            'max_speed_kmh': [speeds.max()], 'segment_start_m': [1500.0],
+            'capture_timestamp': [timestamp],
+        }),
+        'stops': pd.DataFrame({
+            'stop_id': ['p1'], 'stop_name': ['Alvorada'], 'vehicles': [1],
+            'dwell_count': [1], 'avg_dwell_seconds': [dwell],
+            'max_dwell_seconds': [dwell], 'capture_timestamp': [timestamp],
+        }),
+    }
+
+
+def test_window_network_weights_each_capture_by_its_observations():
+    network = WindowNetwork(pd.Timestamp('2025-10-27 10:00'))
+    network.add(summary('2025-10-27 10:01', 1, [10.0], 30.0))
+    network.add(summary('2025-10-27 10:02', 3, [20.0, 30.0, np.nan], 90.0))
+    network.add({'segments': pd.DataFrame(), 'stops': pd.DataFrame()})
+
+    frames = network.to_frames()
+    segment = frames['segments'].iloc[0]
+    assert segment['captures'] == 2
+    assert segment['window_captures'] == 3
+    assert segment['avg_vehicles'] == 2.0
+    assert segment['avg_speed_kmh'] == 20.0
+    assert (segment['min_speed_kmh'], segment['max_speed_kmh']) == (10.0, 30.0)
+    stop = frames['stops'].iloc[0]
+    assert stop['avg_dwell_seconds'] == 60.0
+    assert stop['max_dwell_seconds'] == 90.0
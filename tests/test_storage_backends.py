@@ -0,0 +1,89 @@
+"""Testes do emulador local do GCS (scripts/storage_backends.py)"""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pytest
+
+import storage_backends
+from storage_backends import (
+    ChecksumMismatch,
+    LocalStorageBackend,
+    PreconditionFailed,
+)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return LocalStorageBackend(
+        'brt', root_dir=str(tmp_path / 'gcs'), latency_ms=0, latency_jitter_ms=0
+    )
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'window.csv'
+    path.write_bytes(b'vehicle_id,speed\n' + b'1,30.0\n' * 50000)
+    return path
+
+
+def test_generation_precondition_admits_a_single_writer(backend, source):
+    barrier = threading.Barrier(8)
+
+    def upload(_):
+        barrier.wait()
+        try:
+            backend.upload_file(source, 'dt=2025-10-27/w.csv', if_generation_match=0)
+            return 'uploaded'
+        except PreconditionFailed:
+            return 'rejected'
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(upload, range(8)))
+
+    assert results.count('uploaded') == 1
+    assert backend.list_objects() == ['dt=2025-10-27/w.csv']
+
+
+def test_concurrent_overwrites_keep_metadata_readable(backend, source):
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        while not stop.is_set():
+            try:
+                backend.get_object('w.csv')
+            except Exception as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            generations = list(executor.map(
+                lambda _: backend.upload_file(source, 'w.csv')['generation'],
+                range(20)
+            ))
+    finally:
+        stop.set()
+        thread.join()
+
+    assert errors == []
+    assert len(set(generations)) == 20
+    assert backend.get_object('w.csv')['generation'] == max(generations)
+    assert backend.list_objects() == ['w.csv']
+
+
+def test_checksum_mismatch_is_raised_and_nothing_is_published(
+    backend, source, monkeypatch
+):
+    def corrupt_copy(src, dst):
+        with open(dst, 'wb') as f:
+            f.write(b'truncated')
+
+    monkeypatch.setattr(storage_backends.shutil, 'copyfile', corrupt_copy)
+
+    with pytest.raises(ChecksumMismatch):
+        backend.upload_file(source, 'w.csv', checksum='md5')
+    assert backend.get_object('w.csv') is None
+    assert list(backend.bucket_dir.glob('*.uploading')) == []
@@ -0,0 +1,89 @@
+"""Testes das métricas Gold incrementais (scripts/brt_stream_metrics.py)"""
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from brt_data_aggregator import BRTDataAggregator
+from brt_stream_metrics import WindowMetrics, partial_from_silver
+from local_engine import build_silver
+
+WINDOW = pd.Timestamp('2025-10-27 23:50')
+
+
+def capture(timestamp, seed: int, vehicles: int = 60) -> pd.DataFrame:
+    """Captura com velocidades nulas, linha nula e veículos repetidos"""
+    rng = np.random.default_rng(seed)
+    timestamp = pd.Timestamp(timestamp)
+    speed = rng.uniform(0, 80, vehicles).round(1)
+    speed[::7] = np.nan
+    lines = [str(i % 4) for i in range(vehicles)]
+    lines[1] = None
+    return pd.DataFrame({
+        'capture_timestamp': [timestamp] * vehicles,
+        'vehicle_id': [str(rng.integers(0, 40)) for _ in range(vehicles)],
+        'line': lines,
+        'latitude': -22.9 + rng.normal(0, 0.03, vehicles),
+        'longitude': -43.4 + rng.normal(0, 0.05, vehicles),
+        'speed': speed,
+        'timestamp_gps': [int(timestamp.timestamp() * 1000)] * vehicles,
+    })
+
+
+def test_incremental_updates_match_single_pass():
+    # A janela atravessa a meia-noite: dois date_partition
+    captures = [
+        capture(WINDOW + pd.Timedelta(minutes=i), seed=i) for i in range(10)
+    ]
+    metrics = WindowMetrics(WINDOW)
+    for df in captures:
+        metrics.update(df)
+
+    expected = partial_from_silver(
+        build_silver(pd.concat(captures, ignore_index=True)), WINDOW
+    )
+    result = metrics.partials
+
+    assert len(metrics) == len(expected) == len(result)
+    pd.testing.assert_frame_equal(
+        result.drop(columns='vehicle_ids'),
+        expected.drop(columns='vehicle_ids'),
+        check_dtype=False,
+        atol=1e-9,
+    )
+    assert [list(v) for v in result['vehicle_ids']] == [
+        list(v) for v in expected['vehicle_ids']
+    ]
+
+
+def test_live_snapshot_is_throttled_until_a_window_closes(tmp_path):
+    aggregator = BRTDataAggregator(
+        aggregation_minutes=10,
+        data_dir=str(tmp_path),
+        output_format='csv',
+        event_time_column='capture_timestamp',
+        allowed_lateness_seconds=0,
+        max_clock_skew_seconds=0,
+        stream_metrics=True,
+        live_metrics_interval_seconds=3600,
+        trajectories=False,
+        heatmap=False,
+    )
+
+    def live_observations():
+        table = pq.read_table(aggregator.live_metrics_path).to_pandas()
+        return int(table['observations'].sum())
+
+    aggregator.add_data(capture('2025-10-27 10:01', seed=1))
+    first = live_observations()
+    aggregator.add_data(capture('2025-10-27 10:02', seed=2))
+    assert live_observations() == first
+
+    aggregator.add_data(capture('2025-10-27 10:10', seed=3))
+    aggregator.save_ready_windows()
+    # Só a janela 10:10 segue aberta; a 10:00 foi para metrics_partials
+    open_window = aggregator.metrics[pd.Timestamp('2025-10-27 10:10')]
+    assert live_observations() == int(
+        open_window.partials['observations'].sum()
+    )
+    assert (tmp_path / 'gold' / 'metrics_partials').exists()